@@ -1,6 +1,9 @@
 from __future__ import annotations
+import random
+from typing import Iterator
 import pygame
 from block import Block, ROT_CW, ROT_CCW, SWAP_HORZ, SWAP_VERT
+from settings import PALETTE
 
 
 class Action:
@@ -29,6 +32,26 @@ class Action:
         Apply this action to the given <block> and return True iff the action
         was successfully applied. <extra_info> contains additional
         values which implementations of apply may need.
+
+        If <block>'s board keeps a journal, a successful action is recorded in
+        it as a single move, which Journal.undo reverses.
+        """
+        journal = block.journal
+        if journal is None:
+            return self._apply(block, extra_info)
+
+        journal.begin_move()
+        performed = False
+        try:
+            performed = self._apply(block, extra_info)
+        finally:
+            journal.end_move(performed)
+        return performed
+
+    def _apply(self, block: Block, extra_info: dict) -> bool:
+        """
+        Apply this action to the given <block> and return True iff the action
+        was successfully applied. Subclasses specify how.
         """
         raise NotImplementedError
 
@@ -39,7 +62,7 @@ class RotateClockwise(Action):
         super().__init__('rotate-cw', 'Rotate Clockwise',
                          'rotating a block clockwise', 0)
 
-    def apply(self, block: Block, extra_info: dict) -> bool:
+    def _apply(self, block: Block, extra_info: dict) -> bool:
         return block.rotate(ROT_CW)
 
 
@@ -49,7 +72,7 @@ class RotateCounterClockwise(Action):
         super().__init__('rotate-ccw', 'Rotate Counter Clockwise',
                          'rotating a block counter-clockwise', 0)
 
-    def apply(self, block: Block, extra_info: dict) -> bool:
+    def _apply(self, block: Block, extra_info: dict) -> bool:
         return block.rotate(ROT_CCW)
 
 
@@ -59,7 +82,7 @@ class SwapHorizontal(Action):
         super().__init__('swap-horizontal', 'Swap Horizontally',
                          'swapping a block horizontally', 0)
 
-    def apply(self, block: Block, extra_info: dict) -> bool:
+    def _apply(self, block: Block, extra_info: dict) -> bool:
         return block.swap(SWAP_HORZ)
 
 
@@ -69,7 +92,7 @@ class SwapVertical(Action):
         super().__init__('swap-vertical', 'Swap Vertically',
                          'swapping a block vertically', 0)
 
-    def apply(self, block: Block, extra_info: dict) -> bool:
+    def _apply(self, block: Block, extra_info: dict) -> bool:
         return block.swap(SWAP_VERT)
 
 
@@ -79,7 +102,7 @@ class Smash(Action):
         super().__init__('smash', 'Smash Block',
                          'smashing a block', 2)
 
-    def apply(self, block: Block, extra_info: dict) -> bool:
+    def _apply(self, block: Block, extra_info: dict) -> bool:
         return block.smash()
 
 
@@ -89,7 +112,7 @@ class Combine(Action):
         super().__init__('combine', 'Combine Blocks',
                          'combining blocks', 1)
 
-    def apply(self, block: Block, extra_info: dict) -> bool:
+    def _apply(self, block: Block, extra_info: dict) -> bool:
         return block.combine()
 
 
@@ -99,7 +122,7 @@ class Paint(Action):
         super().__init__('paint', 'Paint Blocks',
                          'painting blocks', 1)
 
-    def apply(self, block: Block, extra_info: dict) -> bool:
+    def _apply(self, block: Block, extra_info: dict) -> bool:
         return block.paint(extra_info['colour'])
 
 
@@ -109,7 +132,7 @@ class Pass(Action):
         super().__init__('pass', 'Pass',
                          'passing', 0)
 
-    def apply(self, block: Block, extra_info: dict) -> bool:
+    def _apply(self, block: Block, extra_info: dict) -> bool:
         return True
 
 
@@ -123,6 +146,114 @@ COMBINE = Combine()
 PAINT = Paint()
 PASS = Pass()
 
+
+def legal_moves(board: Block, colour: tuple[int, int, int]) -> \
+        Iterator[tuple[tuple[int, ...], Action]]:
+    """Yield every move that can be made on <board> by a player whose goal
+    has the given <colour> and that changes the board, as the path of child
+    indices leading from <board> to the block to move, and the action.
+
+    A move that would leave the board as it is, such as rotating a block
+    whose children all look the same, is not yielded, and neither is PASS.
+    When rotating a block clockwise and counter-clockwise give the same
+    result, only the clockwise rotation is yielded. Results are compared by
+    structural hash, so <board> is not changed.
+
+    >>> from settings import COLOUR_LIST
+    >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+    >>> [(path, action.short_name)
+    ...  for path, action in legal_moves(board, COLOUR_LIST[0])]
+    [((), 'smash')]
+    >>> board.smash()
+    True
+    >>> for child in board.children:
+    ...     child.colour = COLOUR_LIST[1]
+    >>> [(path, action.short_name)
+    ...  for path, action in legal_moves(board, COLOUR_LIST[1])]
+    [((), 'combine')]
+    """
+    target = PALETTE.index(colour)
+    pending = [(board, ())]
+    while pending:
+        block, path = pending.pop()
+        for action in _block_moves(block, target):
+            yield path, action
+        children = block.view_children()
+        for i in range(len(children) - 1, -1, -1):
+            pending.append((children[i], path + (i,)))
+
+
+def _block_moves(block: Block, target: int) -> list[Action]:
+    """Return the actions of the moves that legal_moves yields for <block>
+    itself, for a player whose goal colour has the index <target> in
+    settings.PALETTE.
+    """
+    children = block.view_children()
+    if len(children) == 0:
+        moves = []
+        if block.smashable():
+            moves.append(SMASH)
+        if block.level == block.max_depth and block.colour_index != target:
+            moves.append(PAINT)
+        return moves
+    moves = []
+    hashes = [block.rotated_hash(turns) for turns in range(4)]
+    if hashes[1] != hashes[0]:
+        moves.append(ROTATE_CLOCKWISE)
+        if hashes[3] != hashes[1]:
+            moves.append(ROTATE_COUNTER_CLOCKWISE)
+    child_hashes = [child.structural_hash() for child in children]
+    # A swap changes the board unless it exchanges equal children.
+    if child_hashes[0] != child_hashes[1] \
+            or child_hashes[2] != child_hashes[3]:
+        moves.append(SWAP_HORIZONTAL)
+    if child_hashes[0] != child_hashes[3] \
+            or child_hashes[1] != child_hashes[2]:
+        moves.append(SWAP_VERTICAL)
+    if block.combinable():
+        moves.append(COMBINE)
+    return moves
+
+
+def random_legal_move(board: Block, colour: tuple[int, int, int]) -> \
+        tuple[tuple[int, ...], Action] | None:
+    """Return a move chosen uniformly at random from those yielded by
+    legal_moves for <board> and <colour>, or None if there are none.
+
+    The moves are not all listed. Instead, the number of legal moves in
+    each subtree, which a Block caches, is used to walk down from <board>
+    straight to the Block of the chosen move, so once the counts are known
+    a move is chosen in time proportional to the depth of the board.
+    """
+    target = PALETTE.index(colour)
+    total = _move_count(board, target)
+    if total == 0:
+        return None
+    # The position of the chosen move among those of <block>'s subtree, in
+    # the order that legal_moves yields them.
+    rank = random.randrange(total)
+    block, path = board, ()
+    while True:
+        moves = _block_moves(block, target)
+        if rank < len(moves):
+            return path, moves[rank]
+        rank -= len(moves)
+        for i, child in enumerate(block.view_children()):
+            count = _move_count(child, target)
+            if rank < count:
+                block, path = child, path + (i,)
+                break
+            rank -= count
+
+
+def _move_count(block: Block, target: int) -> int:
+    """Return the number of moves that legal_moves yields for <block>, for
+    a player whose goal colour has the index <target> in settings.PALETTE.
+    """
+    return block.subtree_total(
+        ('moves', target), lambda node: len(_block_moves(node, target)))
+
+
 KEY_ACTION = {
     pygame.K_d: ROTATE_CLOCKWISE,
     pygame.K_a: ROTATE_COUNTER_CLOCKWISE,
@@ -0,0 +1,410 @@
+from __future__ import annotations
+from typing import Any
+from raster import _CHILD_OFFSETS, np
+
+# The blobs of a board are found from its leaves rather than its unit cells:
+# each leaf is a square of unit cells of one colour, so it lies within a
+# single blob, and two leaves are in the same blob if they have the same
+# colour and are joined by a chain of same-colour leaves that share edges.
+# The work done therefore grows with the number of leaves, not cells.
+#
+# The functions below accept a board of either backend, that is, a Block or a
+# linear_board.LinearBlock.
+
+# The indices, in the children of a Block, of its four quadrants.
+_UPPER_RIGHT, _UPPER_LEFT, _LOWER_LEFT, _LOWER_RIGHT = range(4)
+
+# For a pair of adjacent Blocks, the children of the first and of the second
+# that face each other across their shared edge, matched up. The first Block
+# lies to the left of the second if the pair is horizontal, and above it
+# otherwise.
+_FACING = {
+    True: ((_UPPER_RIGHT, _LOWER_RIGHT), (_UPPER_LEFT, _LOWER_LEFT)),
+    False: ((_LOWER_LEFT, _LOWER_RIGHT), (_UPPER_LEFT, _UPPER_RIGHT))
+}
+
+
+class _UnionFind:
+    """A collection of disjoint sets of leaves, each weighted by the total
+    area of its leaves.
+
+    A leaf is identified by the column and row of its upper left unit cell,
+    since a linear_board.LinearBlock is a new object each time it is read.
+
+    Private Instance Attributes:
+    - _numbers: Maps the upper left unit cell of each leaf added to its
+                number.
+    - _parents: The number of the parent of each leaf in its set's tree.
+    - _areas: For the leaf at the root of each set's tree, the total area of
+              the set in unit cells.
+    - _colours: The palette index of the colour of each leaf.
+    """
+    _numbers: dict[tuple[int, int], int]
+    _parents: list[int]
+    _areas: list[int]
+    _colours: list[int]
+
+    def __init__(self) -> None:
+        """Initialize an empty collection of sets.
+        """
+        self._numbers = {}
+        self._parents = []
+        self._areas = []
+        self._colours = []
+
+    def add(self, x: int, y: int, n: int, colour: int) -> int:
+        """Add the n-by-n leaf of the given palette <colour> whose upper left
+        unit cell is at column <x> and row <y> in a set of its own, if it has
+        not been added yet, and return its number.
+        """
+        number = self._numbers.get((x, y))
+        if number is None:
+            number = len(self._parents)
+            self._numbers[(x, y)] = number
+            self._parents.append(number)
+            self._areas.append(n * n)
+            self._colours.append(colour)
+        return number
+
+    def find(self, number: int) -> int:
+        """Return the number of the leaf at the root of the set containing
+        leaf <number>.
+        """
+        parents = self._parents
+        root = number
+        while parents[root] != root:
+            root = parents[root]
+        while parents[number] != root:
+            parents[number], number = root, parents[number]
+        return root
+
+    def union(self, first: int, second: int) -> None:
+        """Merge the sets containing the leaves numbered <first> and
+        <second>.
+        """
+        root1 = self.find(first)
+        root2 = self.find(second)
+        if root1 != root2:
+            if self._areas[root1] < self._areas[root2]:
+                root1, root2 = root2, root1
+            self._parents[root2] = root1
+            self._areas[root1] += self._areas[root2]
+
+    def areas(self) -> dict[int, list[int]]:
+        """Return a dictionary mapping the palette index of each colour to the
+        total area of every set of leaves of that colour.
+        """
+        areas = {}
+        for number in range(len(self._parents)):
+            if self._parents[number] == number:
+                areas.setdefault(self._colours[number], []).append(
+                    self._areas[number])
+        return areas
+
+
+def _placed_children(block: Any, x: int, y: int, n: int) -> list[tuple]:
+    """Return each child of the n-by-n <block>, whose upper left unit cell is
+    at column <x> and row <y>, with the column and row of its own upper left
+    unit cell and its width, in the order of Block.children.
+    """
+    half = n // 2
+    return [(child, x + dx * half, y + dy * half, half)
+            for child, (dx, dy) in zip(block.view_children(), _CHILD_OFFSETS)]
+
+
+def blob_sizes(board: Any, target: int) -> list[int]:
+    """Return the number of unit cells in each blob of <board> whose colour
+    has the index <target> in settings.PALETTE, in no particular order.
+
+    >>> from block import Block
+    >>> from settings import COLOUR_LIST
+    >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+    >>> blob_sizes(board, 0)
+    [4]
+    >>> board.smash()
+    True
+    >>> for child, colour in zip(board.children, [1, 0, 1, 0]):
+    ...     child.colour = COLOUR_LIST[colour]
+    >>> blob_sizes(board, 1)
+    [1, 1]
+    >>> board.children[1].colour = COLOUR_LIST[1]
+    >>> blob_sizes(board, 1)
+    [3]
+    """
+    return blob_sizes_by_colour(board, {target}).get(target, [])
+
+
+def blob_sizes_by_colour(board: Any, colours: set[int]) -> \
+        dict[int, list[int]]:
+    """Return a dictionary mapping the index in settings.PALETTE of each of
+    <colours> that is on <board> to the number of unit cells in each of its
+    blobs, in no particular order.
+
+    All the blobs are found in a single traversal of <board>.
+
+    >>> from block import Block
+    >>> from settings import COLOUR_LIST
+    >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+    >>> board.smash()
+    True
+    >>> for child, colour in zip(board.children, [1, 0, 1, 1]):
+    ...     child.colour = COLOUR_LIST[colour]
+    >>> sorted(blob_sizes_by_colour(board, {0, 1, 2}).items())
+    [(0, [1]), (1, [3])]
+    """
+    sets = _UnionFind()
+    # Each entry is either one placed Block whose leaves are still to be
+    # visited, or two adjacent placed Blocks whose leaves along their shared
+    # edge are still to be joined and whether the pair is horizontal. A
+    # placed Block is a Block with the column and row of its upper left unit
+    # cell and its width.
+    pending = [((board, 0, 0, 2 ** (board.max_depth - board.level)),)]
+    while pending:
+        entry = pending.pop()
+        if len(entry) == 1:
+            placed = entry[0]
+            children = _placed_children(*placed)
+            if len(children) == 0:
+                block, x, y, n = placed
+                if block.colour_index in colours:
+                    sets.add(x, y, n, block.colour_index)
+                continue
+            pending.extend((child,) for child in children)
+            pending.append((children[_UPPER_LEFT], children[_UPPER_RIGHT],
+                            True))
+            pending.append((children[_LOWER_LEFT], children[_LOWER_RIGHT],
+                            True))
+            pending.append((children[_UPPER_LEFT], children[_LOWER_LEFT],
+                            False))
+            pending.append((children[_UPPER_RIGHT], children[_LOWER_RIGHT],
+                            False))
+        else:
+            first, second, horizontal = entry
+            first_children = _placed_children(*first)
+            second_children = _placed_children(*second)
+            if len(first_children) == 0 \
+                    and first[0].colour_index not in colours \
+                    or len(second_children) == 0 \
+                    and second[0].colour_index not in colours:
+                continue
+            if len(first_children) == 0 and len(second_children) == 0:
+                colour = first[0].colour_index
+                if second[0].colour_index == colour:
+                    sets.union(sets.add(*first[1:], colour),
+                               sets.add(*second[1:], colour))
+                continue
+            first_side, second_side = _FACING[horizontal]
+            for i in range(2):
+                pending.append((
+                    first_children[first_side[i]] if first_children
+                    else first,
+                    second_children[second_side[i]] if second_children
+                    else second,
+                    horizontal))
+    return sets.areas()
+
+
+def largest_blobs(rasters: Any, target: int) -> Any:
+    """Return an array of the number of unit cells in the largest blob of the
+    colour with index <target> in settings.PALETTE on each of the boards
+    whose rasters are stacked in <rasters>, an array of shape (k, n, n) as
+    returned by raster.stack_rasters.
+
+    The blobs of all the boards are labelled together with array operations:
+    each cell of the target colour starts with a label of its own, then
+    repeatedly takes the largest label of its neighbours of the target
+    colour, and of the cell its label names, until no label changes.
+
+    Precondition:
+    - raster.NUMPY_AVAILABLE
+
+    >>> import numpy as np
+    >>> rasters = np.array([[[0, 0], [1, 0]], [[0, 1], [1, 0]]])
+    >>> largest_blobs(rasters, 0).tolist()
+    [3, 1]
+    """
+    mask = rasters == target
+    count = mask.size
+    ids = np.arange(1, count + 1, dtype=np.int64).reshape(mask.shape)
+    labels = np.where(mask, ids, 0)
+    while True:
+        spread = labels.copy()
+        np.maximum(spread[:, 1:], labels[:, :-1], out=spread[:, 1:])
+        np.maximum(spread[:, :-1], labels[:, 1:], out=spread[:, :-1])
+        np.maximum(spread[:, :, 1:], labels[:, :, :-1],
+                   out=spread[:, :, 1:])
+        np.maximum(spread[:, :, :-1], labels[:, :, 1:],
+                   out=spread[:, :, :-1])
+        spread = np.where(mask, spread, 0)
+        # A label names a cell in the same blob, whose label may be larger.
+        flat = spread.ravel()
+        spread = np.where(mask, flat[np.maximum(spread - 1, 0)], 0)
+        if np.array_equal(spread, labels):
+            break
+        labels = spread
+    sizes = np.bincount(labels.ravel(), minlength=count + 1)
+    sizes[0] = 0
+    # Every label names a cell of its own board.
+    per_board = sizes[1:].reshape(len(rasters), -1)
+    return per_board.max(axis=1)
+
+
+class BlobTracker:
+    """The blobs of one colour on a board, kept up to date as the board
+    changes.
+
+    A BlobTracker is made by Block.track_blobs, and its board tells it which
+    region of unit cells each change covers. It labels every unit cell of
+    the target colour with its blob, and on each change it relabels only the
+    blobs that touch the changed region, splitting or merging them as
+    needed. The work done for a change is therefore proportional to the
+    area of the changed region and the blobs it touches, not of the board.
+    If NumPy is not installed, or the board's raster has been dropped, the
+    blobs are found again from the whole board the next time they are read.
+
+    Instance Attributes:
+    - target: The index in settings.PALETTE of the colour whose blobs are
+              tracked.
+
+    Private Instance Attributes:
+    - _board: The root of the board whose blobs are tracked.
+    - _labels: The label of the blob of every unit cell of the board, indexed
+               like a raster, with 0 for cells not of the target colour.
+               None if the blobs must be found again from the whole board.
+    - _sizes: Maps the label of each blob to its number of unit cells.
+    - _boxes: Maps the label of each blob to the columns and rows (x0, x1,
+              y0, y1) of the smallest region of the board that contains it,
+              including x0 and y0 but not x1 and y1.
+    - _next_label: The label to give the next blob found.
+
+    Representation Invariants:
+    - Every value of self._sizes is > 0
+    - self._sizes and self._boxes have the same keys, all < self._next_label
+    """
+    target: int
+    _board: Any
+    _labels: Any
+    _sizes: dict[int, int]
+    _boxes: dict[int, tuple[int, int, int, int]]
+    _next_label: int
+
+    def __init__(self, board: Any, target: int) -> None:
+        """Initialize a tracker of the blobs of colour <target> on the board
+        rooted at <board>.
+        """
+        self.target = target
+        self._board = board
+        self._labels = None
+        self._sizes = {}
+        self._boxes = {}
+        self._next_label = 1
+
+    def largest(self) -> int:
+        """Return the number of unit cells in the largest blob of the target
+        colour, or 0 if there is none.
+
+        >>> from block import Block
+        >>> from settings import COLOUR_LIST
+        >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+        >>> tracker = board.track_blobs(COLOUR_LIST[0])
+        >>> tracker.largest()
+        16
+        >>> board.smash()
+        True
+        >>> tracker.largest() == max(blob_sizes(board, 0), default=0)
+        True
+        """
+        return max(self.sizes(), default=0)
+
+    def sizes(self) -> list[int]:
+        """Return the number of unit cells in each blob of the target colour,
+        in no particular order.
+        """
+        raster = self._board.raster()
+        if raster is None:
+            return blob_sizes(self._board, self.target)
+        if self._labels is None:
+            self._labels = np.zeros(raster.shape, dtype=np.int32)
+            self._sizes.clear()
+            self._boxes.clear()
+            n = raster.shape[0]
+            self._relabel(raster, (0, n, 0, n))
+        return list(self._sizes.values())
+
+    def reset(self) -> None:
+        """Record that the board has changed in a way that its raster does not
+        describe, so its blobs must be found again from the whole board.
+        """
+        self._labels = None
+
+    def changed(self, x: int, y: int, n: int) -> None:
+        """Relabel the blobs that touch the n-by-n region of the board whose
+        upper left unit cell is at column <x> and row <y>, which has just
+        changed. The board's raster must already show the change.
+        """
+        labels = self._labels
+        if labels is None:
+            return
+        size = labels.shape[0]
+        # Blobs just outside the region may have joined or lost cells in it.
+        window = (max(x - 1, 0), min(x + n + 1, size),
+                  max(y - 1, 0), min(y + n + 1, size))
+        touched = np.unique(labels[window[0]:window[1], window[2]:window[3]])
+        for label in touched.tolist():
+            if label == 0:
+                continue
+            x0, x1, y0, y1 = self._boxes.pop(label)
+            del self._sizes[label]
+            box = labels[x0:x1, y0:y1]
+            box[box == label] = 0
+            window = (min(window[0], x0), max(window[1], x1),
+                      min(window[2], y0), max(window[3], y1))
+        self._relabel(self._board.raster(), window)
+
+    def _relabel(self, raster: Any, window: tuple[int, int, int, int]) -> \
+            None:
+        """Label the blobs of unlabelled unit cells of the target colour in
+        <window> of <raster>, given as (x0, x1, y0, y1) like a value of
+        <_boxes>. These blobs must lie entirely within <window>.
+        """
+        x0, x1, y0, y1 = window
+        cells = raster[x0:x1, y0:y1].tolist()
+        region = self._labels[x0:x1, y0:y1]
+        labels = region.tolist()
+        target = self.target
+        width = x1 - x0
+        height = y1 - y0
+        for i in range(width):
+            for j in range(height):
+                if cells[i][j] != target or labels[i][j] != 0:
+                    continue
+                label = self._next_label
+                self._next_label += 1
+                labels[i][j] = label
+                pending = [(i, j)]
+                count = 0
+                box = [i, i, j, j]
+                while pending:
+                    ci, cj = pending.pop()
+                    count += 1
+                    box[0] = min(box[0], ci)
+                    box[1] = max(box[1], ci)
+                    box[2] = min(box[2], cj)
+                    box[3] = max(box[3], cj)
+                    for ni, nj in ((ci - 1, cj), (ci + 1, cj), (ci, cj - 1),
+                                   (ci, cj + 1)):
+                        if 0 <= ni < width and 0 <= nj < height \
+                                and labels[ni][nj] == 0 \
+                                and cells[ni][nj] == target:
+                            labels[ni][nj] = label
+                            pending.append((ni, nj))
+                self._sizes[label] = count
+                self._boxes[label] = (x0 + box[0], x0 + box[1] + 1,
+                                      y0 + box[2], y0 + box[3] + 1)
+        region[...] = labels
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -1,8 +1,13 @@
 from __future__ import annotations
 import random
 import math
+import struct
+from typing import Any, Callable
 
-from settings import colour_name, COLOUR_LIST
+from settings import colour_name, COLOUR_LIST, PALETTE, PaletteFullError
+from raster import NUMPY_AVAILABLE, new_raster, paint_region, rotate_region, \
+    swap_region, np
+from blob import BlobTracker
 
 # constants
 ROT_CW = 1
@@ -10,6 +15,319 @@ ROT_CCW = 3
 SWAP_HORZ = 0
 SWAP_VERT = 1
 
+# The number of clockwise quarter turns made by a rotation in each direction.
+_QUARTER_TURNS = {ROT_CW: 1, ROT_CCW: 3}
+
+# Structural hashes are 64-bit integers.
+_HASH_MASK = (1 << 64) - 1
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+# Random keys for structural hashing, generated on demand.
+_HASH_KEYS = {}
+
+# The header of the encoding of a Block made by Block.to_bytes: the x and y
+# coordinates of its position, its size, its level, its max_depth, and the
+# number of colours in the palette that follows.
+_BOARD_HEADER = struct.Struct('<IIIBBB')
+
+
+class SharedBlockError(Exception):
+    """ An exception to be raised when attempting to change a Block that may be
+    shared with a copy of its board.
+
+    This happens when a Block is obtained from a board, the board (or one of
+    the Block's ancestors) is copied, and the old Block is then changed. The
+    Block must be looked up again from the board's root instead.
+    """
+    pass
+
+
+class BoardFormatError(Exception):
+    """ An exception to be raised when bytes passed to Block.from_bytes do not
+    encode a Block.
+    """
+    pass
+
+
+class _Owner:
+    """The owner of the Blocks that make up one board.
+
+    Every Block records its owner. A Block may be changed in place only while
+    its owner is live. When a board is copied, the copy shares the original's
+    Blocks, so their owner is retired: from then on, each side makes its own
+    copy of a shared Block the first time it reaches it through
+    Block.children.
+
+    Instance Attributes:
+    - live: True iff the Blocks owned by this owner belong to exactly one
+            board and can be changed in place.
+    - journal: The journal recording the moves made on the board these Blocks
+               belong to, or None if that board does not keep a journal.
+    - raster: A raster of the board these Blocks belong to, as described in
+              the raster module, or None if it has not been made yet. Every
+              change to the board is made to the raster too.
+    - trackers: The blob trackers of the board these Blocks belong to, which
+                are told about every change to the board.
+    - squares: The squares last returned by _block_to_squares for a Block
+               owned by this owner, with the structural hash, position and
+               size of that Block, or None if there are none.
+    """
+    __slots__ = ('live', 'journal', 'raster', 'trackers', 'squares')
+    live: bool
+    journal: Journal | None
+    raster: Any
+    trackers: list[BlobTracker]
+    squares: tuple[tuple[int, tuple[int, int], int],
+                   list[tuple[tuple[int, int, int], tuple[int, int], int]]] \
+        | None
+
+    def __init__(self) -> None:
+        """Initialize a new live owner, with no journal, raster or squares.
+        """
+        self.live = True
+        self.journal = None
+        self.raster = None
+        self.trackers = []
+        self.squares = None
+
+
+class _Children(list):
+    """The list of children of a Block.
+
+    Every Block added to this list becomes part of its parent's board, and
+    every change to this list is recorded by its parent, as a move would be.
+
+    Private Instance Attributes:
+    - _parent: The Block whose children these are.
+    """
+    __slots__ = ('_parent',)
+    _parent: Block
+
+    def __init__(self, parent: Block, blocks: list[Block] = ()) -> None:
+        """Initialize this list of <parent>'s children to hold <blocks>, which
+        must already be part of <parent>'s board or be shared.
+        """
+        list.__init__(self, blocks)
+        self._parent = parent
+
+    def append(self, block: Block) -> None:
+        list.append(self, self._parent._adopt(block))
+
+    def extend(self, blocks: list[Block]) -> None:
+        list.extend(self, [self._parent._adopt(block) for block in blocks])
+
+    def insert(self, index: int, block: Block) -> None:
+        list.insert(self, index, self._parent._adopt(block))
+
+    def __setitem__(self, index: int | slice,
+                    value: Block | list[Block]) -> None:
+        if isinstance(index, slice):
+            value = [self._parent._adopt(block) for block in value]
+        else:
+            value = self._parent._adopt(value)
+        list.__setitem__(self, index, value)
+
+    def __iadd__(self, blocks: list[Block]) -> _Children:
+        self.extend(blocks)
+        return self
+
+    def __imul__(self, times: int) -> _Children:
+        self._change()
+        return list.__imul__(self, times)
+
+    def __delitem__(self, index: int | slice) -> None:
+        self._change()
+        list.__delitem__(self, index)
+
+    def pop(self, index: int = -1) -> Block:
+        self._change()
+        return list.pop(self, index)
+
+    def remove(self, block: Block) -> None:
+        self._change()
+        list.remove(self, block)
+
+    def clear(self) -> None:
+        self._change()
+        list.clear(self)
+
+    def reverse(self) -> None:
+        self._change()
+        list.reverse(self)
+
+    def sort(self, *args: Any, **kwargs: Any) -> None:
+        self._change()
+        list.sort(self, *args, **kwargs)
+
+    def _change(self) -> None:
+        """Record that the children are about to be removed or reordered.
+        """
+        self._parent._check_changeable()
+        self._parent._invalidate_caches()
+        self._parent._drop_raster()
+
+
+class Journal:
+    """A record of the moves made on a board, which lets them be undone and
+    redone.
+
+    Each change to a Block is recorded as the smallest amount of information
+    needed to reverse it: the direction of a rotation or swap, or the colour
+    and children that a smash, paint or combine replaced. Undoing or redoing a
+    move therefore takes time proportional to the depth of the changed Block
+    plus the size of the change, never the size of the board.
+
+    A move usually changes a single Block, but all the changes made between
+    begin_move and end_move are undone and redone together.
+
+    Private Instance Attributes:
+    - _root: The root of the board whose moves this journal records.
+    - _done: The moves that can be undone, oldest first.
+    - _undone: The moves that can be redone, most recently undone last.
+    - _move: The changes recorded so far for the move that is being made, or
+             None if no move is being made.
+
+    Each change is a list [path, kind, other], where <path> is the indices of
+    the children leading from the root to the changed Block. If <kind> is
+    'rotate' or 'swap', <other> is the direction of the change. If <kind> is
+    'contents', <other> is the (colour, children) the Block had before the
+    change, or after it once the change has been undone.
+    """
+    _root: Block
+    _done: list[list[list]]
+    _undone: list[list[list]]
+    _move: list[list] | None
+
+    def __init__(self, root: Block) -> None:
+        """Initialize an empty journal for the board rooted at <root>.
+        """
+        self._root = root
+        self._done = []
+        self._undone = []
+        self._move = None
+
+    def __len__(self) -> int:
+        """Return the number of moves that can be undone.
+        """
+        return len(self._done)
+
+    def begin_move(self) -> None:
+        """Start recording a move, so that every change made until end_move
+        is called is undone and redone as one.
+        """
+        self._move = []
+
+    def end_move(self, performed: bool) -> None:
+        """Finish recording the current move. If <performed> is False, the
+        move was not made, so nothing is recorded.
+        """
+        move = self._move
+        self._move = None
+        if performed:
+            self._done.append(move)
+            self._undone.clear()
+
+    def record(self, path: tuple[int, ...], kind: str, other: object) -> None:
+        """Record a change of <kind> to the Block at <path>, which can be
+        reversed using <other>.
+
+        If no move is being recorded, the change is recorded as a move of its
+        own.
+        """
+        if self._move is None:
+            self._done.append([[path, kind, other]])
+            self._undone.clear()
+        else:
+            self._move.append([path, kind, other])
+
+    def undo(self) -> bool:
+        """Undo the most recent move that has not been undone yet.
+
+        Return True iff there was a move to undo.
+        """
+        if not self._done:
+            return False
+        move = self._done.pop()
+        for change in reversed(move):
+            self._replay(change, True)
+        self._undone.append(move)
+        return True
+
+    def redo(self) -> bool:
+        """Redo the most recently undone move.
+
+        Return True iff there was a move to redo.
+        """
+        if not self._undone:
+            return False
+        move = self._undone.pop()
+        for change in move:
+            self._replay(change, False)
+        self._done.append(move)
+        return True
+
+    def _replay(self, change: list, undo: bool) -> None:
+        """Undo <change> if <undo> is True, or redo it otherwise.
+        """
+        path, kind, other = change
+        block = self._root
+        for index in path:
+            block = block.children[index]
+
+        if kind == 'rotate':
+            block._rotate(_opposite(other) if undo else other)
+        elif kind == 'swap':
+            block._swap(other)
+        else:
+            change[2] = block._exchange_contents(other)
+
+
+def _hash_key(*parts: object) -> int:
+    """Return the random 64-bit key for <parts>.
+
+    Keys are derived from <parts> alone, so the same parts always have the
+    same key, in every run of the game.
+    """
+    if parts not in _HASH_KEYS:
+        _HASH_KEYS[parts] = random.Random(repr(parts)).getrandbits(64)
+    return _HASH_KEYS[parts]
+
+
+def _leaf_hash(colour: int, level: int) -> int:
+    """Return the structural hash of a leaf at <level> whose colour has the
+    palette index <colour>.
+    """
+    return _hash_key('leaf', colour, level)
+
+
+def _placed_hash(block_hash: int, level: int, slot: int) -> int:
+    """Return what a Block at <level>, whose structural hash is <block_hash>,
+    contributes to its parent's structural hash when it is child number
+    <slot>.
+    """
+    mixed = ((block_hash ^ _hash_key('slot', level, slot)) * _HASH_MULTIPLIER) \
+        & _HASH_MASK
+    return mixed ^ (mixed >> 29)
+
+
+def _add_counts(first: dict[int, int], second: dict[int, int]) -> \
+        dict[int, int]:
+    """Return a new dictionary of colour counts that adds the counts in
+    <first> and <second>.
+
+    >>> _add_counts({0: 2, 1: 1}, {1: 3})
+    {0: 2, 1: 4}
+    """
+    counts = dict(first)
+    for colour, count in second.items():
+        counts[colour] = counts.get(colour, 0) + count
+    return counts
+
+
+def _opposite(direction: int) -> int:
+    """Return the rotation direction that reverses a rotation in <direction>.
+    """
+    return ROT_CCW if direction == ROT_CW else ROT_CW
+
 
 def _block_to_squares(board: Block) -> \
         list[tuple[tuple[int, int, int], tuple[int, int], int]]:
@@ -25,20 +343,194 @@ def _block_to_squares(board: Block) -> \
     in that order.
 
     The order of the tuples does not matter.
+
+    The positions of the squares are worked out in a single walk down from
+    <board>. For a Block, the result is kept by the Block's owner, so
+    redrawing an unchanged board returns the same list without walking the
+    board again; that list must not be changed.
+    """
+    if isinstance(board, Block):
+        key = (board.structural_hash(), board.position, board.size)
+        if board._owner.squares is not None \
+                and board._owner.squares[0] == key:
+            return board._owner.squares[1]
+    squares = []
+    pending = [(board, board.position, board.size)]
+    while pending:
+        block, (x, y), size = pending.pop()
+        children = block.view_children()
+        if not children:
+            squares.append((block.colour, (x, y), size))
+        else:
+            half = round(size / 2.0)
+            corners = [(x + half, y), (x, y), (x, y + half),
+                       (x + half, y + half)]
+            for child, corner in zip(children, corners):
+                pending.append((child, corner, half))
+    if isinstance(board, Block):
+        board._owner.squares = (key, squares)
+    return squares
+
+
+class _BitWriter:
+    """A sequence of bits being packed into bytes, least significant bit
+    first.
+
+    Instance Attributes:
+    - data: The bytes completed so far.
+
+    Private Instance Attributes:
+    - _pending: The bits written since the last completed byte.
+    - _count: The number of bits in <_pending>.
+    """
+    __slots__ = ('data', '_pending', '_count')
+    data: bytearray
+    _pending: int
+    _count: int
+
+    def __init__(self, data: bytes = b'') -> None:
+        """Initialize this writer to add bits after <data>.
+        """
+        self.data = bytearray(data)
+        self._pending = 0
+        self._count = 0
+
+    def write(self, value: int, width: int) -> None:
+        """Add the <width> lowest bits of <value>.
+        """
+        self._pending |= value << self._count
+        self._count += width
+        while self._count >= 8:
+            self.data.append(self._pending & 0xFF)
+            self._pending >>= 8
+            self._count -= 8
+
+    def finish(self) -> bytes:
+        """Return all the bytes written, padding the last one with zeros.
+        """
+        if self._count > 0:
+            self.data.append(self._pending)
+            self._pending = self._count = 0
+        return bytes(self.data)
+
+
+class _BitReader:
+    """A reader of the bits packed into bytes by a _BitWriter.
+
+    Private Instance Attributes:
+    - _data: The bytes being read.
+    - _offset: The index in <_data> of the next byte to read.
+    - _pending: The bits read from <_data> but not returned yet.
+    - _count: The number of bits in <_pending>.
+    """
+    __slots__ = ('_data', '_offset', '_pending', '_count')
+    _data: memoryview
+    _offset: int
+    _pending: int
+    _count: int
+
+    def __init__(self, data: memoryview, offset: int) -> None:
+        """Initialize this reader to read the bits of <data> that start at
+        index <offset>.
+        """
+        self._data = data
+        self._offset = offset
+        self._pending = 0
+        self._count = 0
+
+    def read(self, width: int) -> int:
+        """Return the next <width> bits.
+
+        Raise a BoardFormatError if there are not enough bits left.
+        """
+        while self._count < width:
+            if self._offset >= len(self._data):
+                raise BoardFormatError
+            self._pending |= self._data[self._offset] << self._count
+            self._offset += 1
+            self._count += 8
+        value = self._pending & ((1 << width) - 1)
+        self._pending >>= width
+        self._count -= width
+        return value
+
+    def at_end(self) -> bool:
+        """Return True iff every byte has been read, and the bits left over
+        from the last byte are all zero padding.
+        """
+        return self._offset == len(self._data) and self._pending == 0
+
+
+def _encode(block: Block) -> bytes:
+    """Return the encoding of <block>, which may use either backend, as
+    described in Block.to_bytes.
     """
-    if not board.children:
-        return [(board.colour, board.position, board.size)]
+    used = 0
+    pending = [block]
+    while pending:
+        node = pending.pop()
+        children = node.view_children()
+        if len(children) == 0:
+            used = max(used, node.colour_index + 1)
+        else:
+            pending.extend(children)
+    width = (used - 1).bit_length()
+
+    x, y = block.position
+    writer = _BitWriter(_BOARD_HEADER.pack(x, y, block.size, block.level,
+                                           block.max_depth, used))
+    for colour in PALETTE.colours[:used]:
+        writer.data.extend(colour)
+    pending = [block]
+    while pending:
+        node = pending.pop()
+        children = node.view_children()
+        if node.level < node.max_depth:
+            writer.write(len(children) > 0, 1)
+        if len(children) == 0:
+            writer.write(node.colour_index, width)
+        else:
+            # Visit the children in order, so that each subtree is written
+            # right after the Block it belongs to.
+            pending.extend(reversed(children))
+    return writer.finish()
+
+
+def _same_tree(block: Block, other: Block) -> bool:
+    """Return True iff <block> and <other>, which may use either backend, have
+    the same colour, level and max_depth, and so do all their corresponding
+    descendants. Positions and sizes are not compared.
+    """
+    if block is other:
+        # Subtrees shared by copies are identical, so there is no need to
+        # look inside them.
+        return True
+    children = block.view_children()
+    other_children = other.view_children()
+    if len(children) == 0 and len(other_children) == 0:
+        # Both block and other are leaves.
+        return (block.colour_index == other.colour_index
+                and block.level == other.level
+                and block.max_depth == other.max_depth)
+    elif len(children) != len(other_children):
+        # One of block or other is a leaf while the other is not.
+        return False
     else:
-        blocks = []
-        for child in board.children:
-            blocks += _block_to_squares(child)
-    return blocks
+        # Because of RIs, don't need to check any attributes other than the
+        # children, since will eventually hit base case!
+        return all(_same_tree(child, other_child)
+                   for child, other_child in zip(children, other_children))
 
 
-def generate_board(max_depth: int, size: int) -> Block:
+def generate_board(max_depth: int, size: int, linear: bool = False) -> Block:
     """Return a new game board with a depth of <max_depth> and dimensions of
     <size> by <size>.
 
+    If <linear> is True, the board is stored in flat arrays by a
+    linear_board.LinearBoard and the returned Block is a LinearBlock handle on
+    its root. Both backends offer the same interface, and they generate equal
+    boards from the same random seed.
+
     >>> board = generate_board(3, 750)
     >>> board.max_depth
     3
@@ -46,13 +538,85 @@ def generate_board(max_depth: int, size: int) -> Block:
     750
     >>> len(board.children) == 4
     True
+    >>> random.seed(148)
+    >>> tree = generate_board(4, 750)
+    >>> random.seed(148)
+    >>> tree == generate_board(4, 750, linear=True)
+    True
     """
+    if linear:
+        # Imported here because linear_board itself depends on this module.
+        from linear_board import generate_linear_board
+        return generate_linear_board(max_depth, size)
+
     board = Block((0, 0), size, random.choice(COLOUR_LIST), 0, max_depth)
     board.smash()
 
     return board
 
 
+def generate_boards(n: int, max_depth: int, size: int,
+                    seed: int | None = None) -> list[Block]:
+    """Return <n> new game boards with a depth of <max_depth> and dimensions
+    of <size> by <size>.
+
+    Each board is generated from its own stream of random numbers, spawned
+    from <seed>, so the same <seed> always gives the same boards, and each
+    board does not depend on how many others are generated with it. Each
+    board is generated level by level: the colours of all its new children
+    at a level, and whether each is smashed, come from one draw. Blocks are
+    smashed with the same probabilities as in Block.smash, but the boards
+    differ from those that generate_board makes, and the random module is not
+    used.
+
+    Precondition:
+    - NUMPY_AVAILABLE
+
+    >>> boards = generate_boards(3, 4, 750, seed=148)
+    >>> boards == generate_boards(3, 4, 750, seed=148)
+    True
+    >>> boards[:2] == generate_boards(2, 4, 750, seed=148)
+    True
+    """
+    return [_generate_from_stream(stream, max_depth, size)
+            for stream in np.random.SeedSequence(seed).spawn(n)]
+
+
+def _generate_from_stream(stream: Any, max_depth: int, size: int) -> Block:
+    """Return a new game board as described in generate_boards, generated
+    from the NumPy SeedSequence <stream>.
+    """
+    rng = np.random.default_rng(stream)
+    board = Block((0, 0), size, None, 0, max_depth)
+    if max_depth == 0:
+        board._colour = int(rng.integers(len(COLOUR_LIST)))
+    smashed = [board] if max_depth > 0 else []
+    level = 1
+    while smashed:
+        count = 4 * len(smashed)
+        draws = rng.random((2, count))
+        # The colours of COLOUR_LIST have the palette indices 0 to 3.
+        colours = (draws[0] * len(COLOUR_LIST)).astype(int).tolist()
+        if level < max_depth:
+            splits = (draws[1] < math.exp(-0.25 * level)).tolist()
+        else:
+            splits = [False] * count
+        next_smashed = []
+        for i, block in enumerate(smashed):
+            children = []
+            for k in range(4 * i, 4 * i + 4):
+                if splits[k]:
+                    child = block._make_child(None)
+                    next_smashed.append(child)
+                else:
+                    child = block._make_child(colours[k])
+                children.append(child)
+            block._children = _Children(block, children)
+        smashed = next_smashed
+        level += 1
+    return board
+
+
 class Block:
     """A square Block in the Blocky game, represented as a tree.
 
@@ -91,13 +655,81 @@ class Block:
         - this Block's colour is None.
     - If this Block has no children:
         - its colour is not None.
+
+    Copies of a Block share their unchanged subtrees with the original, so
+    create_copy takes constant time. Changing a Block through any of its
+    methods only copies the Blocks on the path from the root to that Block,
+    along with their siblings (but not the siblings' descendants).
+    To keep this safe, Blocks obtained from a board before it was copied must
+    be looked up again before they are changed.
+
+    Rotating or swapping a Block takes constant time. A rotation is recorded
+    as a pending number of quarter turns, like a lazy tag in a segment tree,
+    and is only applied to the children when they are read. Only the root of
+    a board stores its position and size: every other Block works them out
+    from its place in the tree, so moves never have to update them.
+
+    Private Attributes
+    - _owner: The owner of this Block. This Block can only be changed while
+              its owner is live.
+    - _parent: The Block whose child this Block is, or None if this Block is
+               the root of its board.
+    - _colour: The index in settings.PALETTE of this Block's colour, or None
+               if this Block is subdivided.
+    - _position: The position of this Block if it is the root of its board,
+                 or None otherwise.
+    - _size: The size of this Block if it is the root of its board, or None
+             otherwise.
+    - _rotation: The number of clockwise quarter turns by which this Block
+                 has been rotated but its children have not been yet.
+    - _hashes: For 0 <= r < 4, _hashes[r] is the structural hash of this
+               Block with its children as stored, rotated by r clockwise
+               quarter turns. None if this Block has changed since the hashes
+               were last computed.
+    - _edges: The colour counts along the top, right, bottom and left edges
+              of this Block with its children as stored, as returned by
+              edge_counts when there is no pending rotation. None if this
+              Block has changed since they were last computed.
+    - _areas: The colour counts of all the unit cells of this Block, as
+              returned by colour_counts, or None if this Block has changed
+              since they were last computed.
+    - _nodes: The number of Blocks in this Block's subtree, as returned by
+              node_count, or None if this Block has changed since it was
+              last computed.
+    - _totals: The totals over this Block's subtree returned by
+               subtree_total, by key, or None if this Block has changed
+               since any were last computed.
+
+    Private Representation Invariants:
+    - Every child of a Block with a live owner either has the same owner, or
+      has a retired owner and may be shared with other boards.
+    - If this Block has a live owner and is a child, self._parent is the
+      Block whose child it is.
+    - If self._hashes is None, then so is the _hashes of every ancestor.
+    - If self._edges is None, then so is the _edges of every ancestor.
+    - If self._areas is None, then so is the _areas of every ancestor.
+    - If self._nodes is None, then so is the _nodes of every ancestor.
+    - If self._totals is None, then so is the _totals of every ancestor.
+    - If self._rotation != 0, this Block has four children.
     """
-    position: tuple[int, int]
-    size: int
-    colour: tuple[int, int, int] | None
+    __slots__ = ('level', 'max_depth', '_colour', '_position', '_size',
+                 '_children', '_owner', '_parent', '_rotation', '_hashes',
+                 '_edges', '_areas', '_nodes', '_totals')
     level: int
     max_depth: int
-    children: list[Block]
+    _colour: int | None
+    _children: _Children
+    _owner: _Owner
+    _parent: Block | None
+    _position: tuple[int, int] | None
+    _size: int | None
+    _rotation: int
+    _hashes: tuple[int, int, int, int] | None
+    _edges: tuple[dict[int, int], dict[int, int], dict[int, int],
+                  dict[int, int]] | None
+    _areas: dict[int, int] | None
+    _nodes: int | None
+    _totals: dict[object, int] | None
 
     def __init__(self, position: tuple[int, int], size: int,
                  colour: tuple[int, int, int] | None, level: int,
@@ -123,12 +755,596 @@ class Block:
         >>> block.max_depth
         1
         """
-        self.position = position
-        self.size = size
-        self.colour = colour
+        self._position = position
+        self._size = size
+        self._colour = None if colour is None else PALETTE.index(colour)
         self.level = level
         self.max_depth = max_depth
-        self.children = []
+        self._owner = _Owner()
+        self._parent = None
+        self._children = _Children(self)
+        self._rotation = 0
+        self._hashes = None
+        self._edges = None
+        self._areas = None
+        self._nodes = None
+        self._totals = None
+
+    @property
+    def position(self) -> tuple[int, int]:
+        """The (x, y) coordinates of the upper left corner of this Block.
+        """
+        return self._geometry()[0]
+
+    @property
+    def size(self) -> int:
+        """The height and width of this square Block.
+        """
+        return self._geometry()[1]
+
+    def _geometry(self) -> tuple[tuple[int, int], int]:
+        """Return the position and size of this Block, worked out from the
+        position and size of its board's root and the path down to it.
+        """
+        root, slots = self._locate()
+        (x, y), size = root._position, root._size
+        for slot in slots:
+            half = round(size / 2.0)
+            x, y = [(x + half, y), (x, y), (x, y + half),
+                    (x + half, y + half)][slot]
+            size = half
+        return (x, y), size
+
+    def _locate(self) -> tuple[Block, list[int]]:
+        """Return the root of this Block's board, and the indices of the
+        children leading from the root to this Block, allowing for rotations
+        that have not been applied to the children yet.
+
+        Raise a SharedBlockError if this Block is no longer part of the board
+        it was obtained from.
+        """
+        ancestors = []
+        node = self
+        while node._parent is not None:
+            parent = node._parent
+            siblings = parent._children
+            for i in range(len(siblings)):
+                if siblings[i] is node:
+                    break
+            else:
+                raise SharedBlockError
+            ancestors.append((parent, i))
+            node = parent
+        slots = []
+        turns = 0
+        for parent, i in reversed(ancestors):
+            turns = (turns + parent._rotation) % 4
+            # A pending rotation by <turns> moves child i into slot i - turns.
+            slots.append((i - turns) % 4)
+        return node, slots
+
+    def raster(self) -> Any:
+        """Return a raster of this Block, as described in the raster module,
+        or None if NumPy is not installed.
+
+        If this Block can be changed, the raster is a view of a raster of its
+        whole board, which is made the first time it is needed and then kept
+        up to date as the board changes. It must only be read. Otherwise, a
+        new raster is returned.
+
+        >>> board = Block((0, 0), 750, COLOUR_LIST[1], 0, 1)
+        >>> board.smash()
+        True
+        >>> board.children[1].colour = COLOUR_LIST[0]
+        >>> raster = board.raster()
+        >>> int(raster[0, 0])
+        0
+        >>> board.children[1].paint(COLOUR_LIST[2])
+        True
+        >>> int(raster[0, 0])
+        2
+        """
+        if not NUMPY_AVAILABLE:
+            return None
+        owner = self._owner
+        if not owner.live:
+            return new_raster(self)
+        if owner.raster is None:
+            owner.raster = new_raster(self._locate()[0])
+        x, y, n = self.cells()
+        return owner.raster[x:x + n, y:y + n]
+
+    def cells(self) -> tuple[int, int, int]:
+        """Return the column and row of the upper left unit cell of this Block
+        in a raster of its board, and its width in unit cells.
+
+        >>> board = Block((0, 0), 750, COLOUR_LIST[1], 0, 2)
+        >>> board.smash()
+        True
+        >>> board.children[0].cells()
+        (2, 0, 2)
+        """
+        root, slots = self._locate()
+        x = y = 0
+        n = 2 ** (self.max_depth - root.level)
+        for slot in slots:
+            n //= 2
+            x, y = [(x + n, y), (x, y), (x, y + n), (x + n, y + n)][slot]
+        return x, y, n
+
+    def _update_raster(self, change: Callable, *args: object) -> None:
+        """If this Block's board keeps a raster, make <change> to this Block's
+        region of it by calling change(raster, x, y, n, *args), where x, y and
+        n describe the region as in the raster module. Then tell the board's
+        blob trackers that the region has changed.
+        """
+        owner = self._owner
+        if owner.raster is not None or owner.trackers:
+            x, y, n = self.cells()
+            if owner.raster is not None:
+                change(owner.raster, x, y, n, *args)
+            for tracker in owner.trackers:
+                tracker.changed(x, y, n)
+
+    def _drop_raster(self) -> None:
+        """Record that this Block's board has changed in a way that is not
+        made to its raster, so its raster and blobs must be found again from
+        the whole board.
+        """
+        self._owner.raster = None
+        for tracker in self._owner.trackers:
+            tracker.reset()
+
+    @property
+    def colour(self) -> tuple[int, int, int] | None:
+        """If this block is not subdivided, its colour. Otherwise, None.
+        """
+        if self._colour is None:
+            return None
+        return PALETTE.colours[self._colour]
+
+    @colour.setter
+    def colour(self, colour: tuple[int, int, int] | None) -> None:
+        self._check_changeable()
+        self._colour = None if colour is None else PALETTE.index(colour)
+        self._invalidate_caches()
+        self._drop_raster()
+
+    @property
+    def colour_index(self) -> int | None:
+        """If this block is not subdivided, the index of its colour in
+        settings.PALETTE. Otherwise, None.
+
+        >>> Block((0, 0), 750, COLOUR_LIST[2], 0, 1).colour_index
+        2
+        """
+        return self._colour
+
+    def structural_hash(self) -> int:
+        """Return a 64-bit Zobrist-style hash of this Block and all its
+        descendants.
+
+        The hash is built from the colour and level of every leaf and the
+        child slot of every Block below this one. Equal Blocks always have
+        equal hashes. Hashes are cached and, after a change, recomputed only
+        along the path from the changed Block to the root. Each Block caches
+        its hash under all four rotations, so a rotation that has not been
+        applied to the children yet does not need to be applied to hash them.
+
+        >>> b1 = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> b2 = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> b1.structural_hash() == b2.structural_hash()
+        True
+        >>> b1.smash()
+        True
+        >>> b1.structural_hash() == b2.structural_hash()
+        False
+        """
+        return self._rotated_hashes()[self._rotation]
+
+    def rotated_hash(self, turns: int) -> int:
+        """Return the structural hash that this Block would have after being
+        rotated by <turns> clockwise quarter turns, without rotating it.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> block.rotated_hash(1) == block.structural_hash()
+        True
+        """
+        return self._rotated_hashes()[(self._rotation + turns) % 4]
+
+    def _rotated_hashes(self) -> tuple[int, int, int, int]:
+        """Return this Block's <_hashes>, computing them if necessary.
+        """
+        if self._hashes is None:
+            children = self._children
+            if len(children) == 0:
+                self._hashes = (_leaf_hash(self._colour, self.level),) * 4
+            else:
+                placed = []
+                for r in range(4):
+                    block_hash = 0
+                    for slot in range(4):
+                        # Rotating by r moves child (slot + r) into <slot>.
+                        child = children[(slot + r) % 4]
+                        child_hash = child._rotated_hashes()[
+                            (child._rotation + r) % 4]
+                        block_hash ^= _placed_hash(child_hash, child.level,
+                                                   slot)
+                    placed.append(block_hash)
+                self._hashes = tuple(placed)
+        return self._hashes
+
+    def edge_counts(self) -> tuple[dict[int, int], dict[int, int],
+                                   dict[int, int], dict[int, int]]:
+        """Return, for the top, right, bottom and left edges of this Block in
+        that order, a dictionary mapping the index in settings.PALETTE of each
+        colour on that edge to the number of unit cells of that colour along
+        it.
+
+        Like hashes, edge counts are cached and, after a change, recomputed
+        only along the path from the changed Block to the root. A rotation
+        only reorders the edges. The returned dictionaries must not be
+        changed.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[1], 0, 2)
+        >>> block.edge_counts()[0]
+        {1: 4}
+        >>> block.smash()
+        True
+        >>> sum(block.edge_counts()[3].values())
+        4
+        """
+        edges = self._rotated_edges()
+        rotation = self._rotation
+        # Rotating clockwise moves the left edge to the top.
+        return tuple(edges[(e - rotation) % 4] for e in range(4))
+
+    def _rotated_edges(self) -> tuple[dict[int, int], dict[int, int],
+                                      dict[int, int], dict[int, int]]:
+        """Return this Block's <_edges>, computing them if necessary.
+        """
+        if self._edges is None:
+            children = self._children
+            if len(children) == 0:
+                counts = {self._colour: 2 ** (self.max_depth - self.level)}
+                self._edges = (counts,) * 4
+            else:
+                upper_right, upper_left, lower_left, lower_right = \
+                    [child.edge_counts() for child in children]
+                self._edges = (
+                    _add_counts(upper_left[0], upper_right[0]),
+                    _add_counts(upper_right[1], lower_right[1]),
+                    _add_counts(lower_left[2], lower_right[2]),
+                    _add_counts(upper_left[3], lower_left[3]))
+        return self._edges
+
+    def colour_counts(self) -> dict[int, int]:
+        """Return a dictionary mapping the index in settings.PALETTE of each
+        colour in this Block to the number of its unit cells of that colour.
+
+        Like edge counts, colour counts are cached and, after a change,
+        recomputed only along the path from the changed Block to the root.
+        Rotations and swaps do not change them. The returned dictionary must
+        not be changed.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[1], 0, 2)
+        >>> block.colour_counts()
+        {1: 16}
+        >>> block.smash()
+        True
+        >>> sum(block.colour_counts().values())
+        16
+        """
+        if self._areas is None:
+            children = self._children
+            if len(children) == 0:
+                self._areas = {self._colour:
+                               4 ** (self.max_depth - self.level)}
+            else:
+                counts = {}
+                for child in children:
+                    counts = _add_counts(counts, child.colour_counts())
+                self._areas = counts
+        return self._areas
+
+    def node_count(self) -> int:
+        """Return the number of Blocks in this Block's subtree, including this
+        Block.
+
+        Like colour counts, node counts are cached and, after a change,
+        recomputed only along the path from the changed Block to the root.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[1], 0, 2)
+        >>> block.node_count()
+        1
+        >>> block.smash()
+        True
+        >>> block.node_count() >= 5
+        True
+        """
+        if self._nodes is None:
+            self._nodes = 1 + sum(child.node_count()
+                                  for child in self._children)
+        return self._nodes
+
+    def subtree_total(self, key: object,
+                      count: Callable[[Block], int]) -> int:
+        """Return the sum of <count>(block) over every Block in this Block's
+        subtree, including this Block.
+
+        Totals are cached under <key> and, like node counts, recomputed after
+        a change only along the path from the changed Block to the root. So
+        each <count> must have a <key> of its own, <count>(block) must depend
+        only on <block>'s subtree, and the total must not change when a
+        subtree is rotated.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[1], 0, 2)
+        >>> block.smash()
+        True
+        >>> block.subtree_total('nodes', lambda b: 1) == block.node_count()
+        True
+        """
+        if self._totals is None:
+            self._totals = {}
+        total = self._totals.get(key)
+        if total is None:
+            total = count(self) + sum(child.subtree_total(key, count)
+                                      for child in self.view_children())
+            self._totals[key] = total
+        return total
+
+    def _invalidate_caches(self) -> None:
+        """Record that this Block has changed, so its structural hash, edge
+        counts, colour counts, node count and subtree totals, and those of
+        its ancestors, must be recomputed.
+        """
+        node = self
+        while node is not None and (node._hashes is not None
+                                    or node._edges is not None
+                                    or node._areas is not None
+                                    or node._nodes is not None
+                                    or node._totals is not None):
+            node._hashes = None
+            node._edges = None
+            node._areas = None
+            node._nodes = None
+            node._totals = None
+            node = node._parent
+
+    @property
+    def children(self) -> list[Block]:
+        """The blocks into which this block is subdivided.
+
+        If this Block can be changed, any child that is still shared with a
+        copy of the board is copied first, so the children returned can be
+        changed too. Use view_children to read the children without copying
+        them.
+        """
+        self._settle()
+        if self._owner.live:
+            children = self._children
+            for i in range(len(children)):
+                if children[i]._owner is not self._owner:
+                    list.__setitem__(children, i, children[i]._clone(self))
+        return self._children
+
+    @children.setter
+    def children(self, children: list[Block]) -> None:
+        self._check_changeable()
+        self._invalidate_caches()
+        self._children = _Children(self, [self._adopt(child)
+                                          for child in children])
+        self._rotation = 0
+        self._drop_raster()
+
+    @property
+    def journal(self) -> Journal | None:
+        """The journal recording the moves made on this Block's board, or None
+        if the board does not keep one.
+        """
+        return self._owner.journal
+
+    def start_journal(self) -> Journal:
+        """Start recording the moves made on this board in a new journal, and
+        return that journal.
+
+        Copies of this board do not keep a journal.
+
+        Precondition:
+        - This Block is the root of its board.
+
+        >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> journal = board.start_journal()
+        >>> board.smash()
+        True
+        >>> journal.undo()
+        True
+        >>> board.children
+        []
+        >>> journal.redo()
+        True
+        >>> len(board.children)
+        4
+        """
+        self._check_changeable()
+        self._owner.journal = Journal(self)
+        return self._owner.journal
+
+    def track_blobs(self, colour: tuple[int, int, int]) -> BlobTracker:
+        """Start keeping track of the blobs of <colour> on this board as it
+        changes, and return the tracker that does so.
+
+        Copies of this board do not keep the tracker.
+
+        Precondition:
+        - This Block is the root of its board.
+
+        >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> tracker = board.track_blobs(COLOUR_LIST[0])
+        >>> board.smash()
+        True
+        >>> for child, colour in zip(board.children, [0, 1, 0, 1]):
+        ...     child.colour = COLOUR_LIST[colour]
+        >>> tracker.largest()
+        1
+        >>> board.children[3].paint(COLOUR_LIST[0])
+        True
+        >>> tracker.largest()
+        3
+        """
+        self._check_changeable()
+        tracker = BlobTracker(self, PALETTE.index(colour))
+        self._owner.trackers.append(tracker)
+        return tracker
+
+    def _path(self) -> tuple[int, ...]:
+        """Return the indices of the children leading from the root of this
+        Block's board to this Block.
+        """
+        return tuple(self._locate()[1])
+
+    def _record(self, kind: str, other: object) -> None:
+        """Record a change of <kind> to this Block, which can be reversed
+        using <other>, in its board's journal, if the board keeps one.
+        """
+        journal = self._owner.journal
+        if journal is not None:
+            journal.record(self._path(), kind, other)
+
+    def _exchange_contents(self, contents: tuple) -> tuple:
+        """Replace this Block's colour and children with <contents>, a
+        (colour, children) tuple, and return the ones it had before.
+        """
+        self._settle()
+        previous = (self._colour, tuple(self._children))
+        self._colour, children = contents
+        self._invalidate_caches()
+        for child in children:
+            if child._owner is self._owner:
+                child._parent = self
+        self._children = _Children(self, children)
+        self._update_raster(paint_region, self)
+        return previous
+
+    def view_children(self) -> list[Block]:
+        """Return the blocks into which this block is subdivided, without
+        copying any that are shared with copies of the board.
+
+        The returned Blocks must only be read, never changed.
+        """
+        self._settle()
+        return self._children
+
+    def _settle(self) -> None:
+        """Apply this Block's pending rotation to its children.
+
+        This only changes how this Block is stored, never what it looks like,
+        so it is done even if this Block is shared with copies of the board.
+        Any child that may be shared is copied before it is changed.
+        """
+        rotation = self._rotation
+        if not rotation:
+            return
+        children = self._children
+        # Rotating clockwise moves child (i + 1) into slot i.
+        list.__setitem__(children, slice(None),
+                         [children[(i + rotation) % 4] for i in range(4)])
+        if self._hashes is not None:
+            self._hashes = tuple(self._hashes[(r + rotation) % 4]
+                                 for r in range(4))
+        if self._edges is not None:
+            self._edges = tuple(self._edges[(e - rotation) % 4]
+                                for e in range(4))
+        exclusive = self._owner.live
+        for i in range(4):
+            child = children[i]
+            if child._children:
+                if not exclusive or child._owner is not self._owner:
+                    child = child._clone(self)
+                    list.__setitem__(children, i, child)
+                child._rotation = (child._rotation + rotation) % 4
+        self._rotation = 0
+
+    def _check_changeable(self) -> None:
+        """Raise a SharedBlockError if this Block may be shared with a copy of
+        its board.
+        """
+        if not self._owner.live:
+            raise SharedBlockError
+
+    def _adopt(self, block: Block) -> Block:
+        """Make <block> part of this Block's board, as one of its children,
+        and return it.
+
+        A Block that may be shared with another board is left shared: it will
+        be copied the first time it is reached through self.children.
+        """
+        self._check_changeable()
+        self._invalidate_caches()
+        self._drop_raster()
+        if block._owner is self._owner or not block._owner.live:
+            block._parent = self
+            return block
+        # <block> comes from a separately built tree: take it over entirely.
+        foreign = block._owner
+        block._parent = self
+        block._position = block._size = None
+        pending = [block]
+        while pending:
+            node = pending.pop()
+            node._owner = self._owner
+            for child in node._children:
+                if child._owner is foreign:
+                    child._parent = node
+                    pending.append(child)
+        return block
+
+    def _clone(self, parent: Block | None) -> Block:
+        """Return a shallow copy of this Block, owned by <parent>'s owner (or
+        by a new owner if <parent> is None), whose children are shared with
+        this Block.
+
+        This Block's children must not be changed in place afterwards, so
+        this Block's owner must already be retired.
+        """
+        block = Block.__new__(Block)
+        block._position = self._position
+        block._size = self._size
+        block._colour = self._colour
+        block.level = self.level
+        block.max_depth = self.max_depth
+        block._owner = _Owner() if parent is None else parent._owner
+        block._parent = parent
+        block._children = _Children(block, self._children)
+        block._rotation = self._rotation
+        block._hashes = self._hashes
+        block._edges = self._edges
+        block._areas = self._areas
+        block._nodes = self._nodes
+        block._totals = self._totals
+        return block
+
+    def _make_child(self, colour: int | None) -> Block:
+        """Return a new leaf whose colour has the palette index <colour>,
+        owned by this Block's owner, that can be added to this Block's
+        children.
+        """
+        block = Block.__new__(Block)
+        block._position = None
+        block._size = None
+        block._colour = colour
+        block.level = self.level + 1
+        block.max_depth = self.max_depth
+        block._owner = self._owner
+        block._parent = self
+        block._children = _Children(block)
+        block._rotation = 0
+        block._hashes = None
+        block._edges = None
+        block._areas = None
+        block._nodes = None
+        block._totals = None
+        return block
 
     def __str__(self) -> str:
         """Return this Block in a string format.
@@ -137,18 +1353,28 @@ class Block:
         >>> str(block)
         'Leaf: colour=Pacific Point, pos=(0, 0), size=750, level=0'
         """
-        if len(self.children) == 0:
-            indents = '\t' * self.level
+        return self._describe(self.position, self.size)
+
+    def _describe(self, position: tuple[int, int], size: int) -> str:
+        """Return this Block in the string format of __str__, as if it were at
+        <position> with dimensions <size> by <size>.
+        """
+        children = self.view_children()
+        indents = '\t' * self.level
+        if len(children) == 0:
             colour = colour_name(self.colour)
-            return f'{indents}Leaf: colour={colour}, pos={self.position}, ' \
-                   f'size={self.size}, level={self.level}'
+            return f'{indents}Leaf: colour={colour}, pos={position}, ' \
+                   f'size={size}, level={self.level}'
         else:
-            indents = '\t' * self.level
-            result = f'{indents}Parent: pos={self.position},' \
-                     f'size={self.size}, level={self.level}'
+            result = f'{indents}Parent: pos={position},' \
+                     f'size={size}, level={self.level}'
 
-            for child in self.children:
-                result += f'\n{child}'
+            x, y = position
+            half = round(size / 2.0)
+            corners = [(x + half, y), (x, y), (x, y + half),
+                       (x + half, y + half)]
+            for child, corner in zip(children, corners):
+                result += '\n' + child._describe(corner, half)
 
             return result
 
@@ -164,21 +1390,14 @@ class Block:
         >>> b1 == b3
         False
         """
-        if len(self.children) == 0 and len(other.children) == 0:
-            # Both self and other are leaves.
-            return (self.position == other.position
-                    and self.size == other.size
-                    and self.colour == other.colour
-                    and self.level == other.level
-                    and self.max_depth == other.max_depth)
-        elif len(self.children) != len(other.children):
-            # One of self or other is a leaf while the other is not.
+        if self is other:
+            return True
+        if isinstance(other, Block) \
+                and self.structural_hash() != other.structural_hash():
             return False
-        else:
-            # Both self and other have four children.
-            # Because of RIs, don't need to check any attributes other
-            # than the children, since will eventually hit base case!
-            return self.children == other.children  # elementwise compare
+        return (self.position == other.position
+                and self.size == other.size
+                and _same_tree(self, other))
 
     def child_size(self) -> int:
         """Return the size of this Block's children.
@@ -202,9 +1421,14 @@ class Block:
         descendants to have positions consistent with this Block's position.
 
         <position> is the (x, y) coordinates of the upper-left corner of this
-        Block.
+        Block. The descendants work out their positions from this Block's, so
+        they need no updating.
+
+        Precondition:
+        - This Block is the root of its board.
         """
-        # TODO: Implement this method
+        self._check_changeable()
+        self._position = position
 
     def smashable(self) -> bool:
         """Return True iff this block can be smashed.
@@ -212,7 +1436,7 @@ class Block:
         A block can be smashed if it has no children and its level is not at
         max_depth.
         """
-        return self.level != self.max_depth and len(self.children) == 0
+        return self.level != self.max_depth and len(self._children) == 0
 
     def smash(self) -> bool:
         """ Return True iff the smash was performed successfully.
@@ -256,37 +1480,36 @@ class Block:
         >>> b1.max_depth == max_depth
         True
         """
-        # create 4 new arbitrary children, (pick at random)
         if self.smashable():
-            self.colour = None
-            child_pos = self.children_positions()
-            colours = COLOUR_LIST.copy()
-            self.children = [
-                Block(child_pos[0],
-                      self.child_size(),
-                      random.choice(colours),
-                      self.level + 1, self.max_depth),
-
-                Block(child_pos[1],
-                      self.child_size(),
-                      random.choice(colours),
-                      self.level + 1, self.max_depth),
-
-                Block(child_pos[2],
-                      self.child_size(),
-                      random.choice(colours),
-                      self.level + 1, self.max_depth),
-
-                Block(child_pos[3],
-                      self.child_size(),
-                      random.choice(colours),
-                      self.level + 1, self.max_depth)
-            ]
-
-            for child in self.children:
-                if random.random() < math.exp(-0.25 * child.level):
-                    child.smash()
+            self._check_changeable()
+            colour = self._colour
+            self._smash()
+            self._update_raster(paint_region, self)
+            self._record('contents', (colour, ()))
             return True
+        return False
+
+    def _smash(self) -> None:
+        """Smash this Block, which must be smashable, following the procedure
+        described in smash.
+        """
+        # create 4 new arbitrary children, (pick at random)
+        self._colour = None
+        self._invalidate_caches()
+        # The colours of COLOUR_LIST have the palette indices 0 to 3.
+        colours = range(len(COLOUR_LIST))
+        self._children = _Children(self, [
+            self._make_child(random.choice(colours)),
+            self._make_child(random.choice(colours)),
+            self._make_child(random.choice(colours)),
+            self._make_child(random.choice(colours))
+        ])
+        self._rotation = 0
+
+        for child in self._children:
+            if random.random() < math.exp(-0.25 * child.level) \
+                    and child.smashable():
+                child._smash()
 
     def swap(self, direction: int) -> bool:
         """Swap the child Blocks of this Block.
@@ -300,24 +1523,30 @@ class Block:
         Precondition:
         - <direction> is either (SWAP_VERT, SWAP_HORZ)
         """
-        if not self.children:
+        if not self._children:
             return False
         else:
-            if direction == 'SWAP_VERT':
-                self.children[0], self.children[1], \
-                    self.children[2], self.children[3] = \
-                    self.children[3], self.children[2], \
-                    self.children[1], self.children[0]
-
-            elif direction == 'SWAP_HORZ':
-                self.children[0], self.children[1], \
-                    self.children[2], self.children[3] = \
-                    self.children[1], self.children[0], \
-                    self.children[3], self.children[2]
-
-            self._update_children_positions(self.position)
+            self._check_changeable()
+            self._swap(direction)
+            self._record('swap', direction)
             return True
 
+    def _swap(self, direction: int) -> None:
+        """Swap the child Blocks of this Block, which must have children, in
+        <direction>.
+
+        The children are only reordered; their positions are updated lazily.
+        """
+        self._settle()
+        children = self._children
+        if direction == SWAP_VERT:
+            order = (3, 2, 1, 0)
+        else:
+            order = (1, 0, 3, 2)
+        list.__setitem__(children, slice(None), [children[i] for i in order])
+        self._invalidate_caches()
+        self._update_raster(swap_region, direction == SWAP_VERT)
+
     def rotate(self, direction: int) -> bool:
         """Rotate this Block and all its descendents.
 
@@ -330,34 +1559,42 @@ class Block:
         Preconditions:
         - direction in (ROT_CW, ROT_CCW)
         """
-        if len(self.children) == 0:
+        if len(self._children) == 0:
             return False
         else:
-            if direction == 'ROT_CW':
-                self.children[0], self.children[1], \
-                    self.children[2], self.children[3] = \
-                    self.children[1], self.children[2], \
-                    self.children[3], self.children[0]
-
-            elif direction == 'ROT_CCW':
-                self.children[0], self.children[1], \
-                    self.children[2], self.children[3] = \
-                    self.children[3], self.children[0], \
-                    self.children[1], self.children[2]
-
-            self._update_children_positions(self.position)
-            for item in self.children:
-                item.rotate(direction)
+            self._check_changeable()
+            self._rotate(direction)
+            self._record('rotate', direction)
             return True
 
+    def _rotate(self, direction: int) -> None:
+        """Rotate this Block and all its descendents in <direction>.
+
+        This only records a pending rotation, which is applied to the children
+        when they are next read. This Block's cached hashes already cover
+        every rotation, and a rotation only reorders its edge counts, so only
+        its ancestors' caches are invalidated.
+        """
+        if len(self._children) == 0:
+            return
+        self._rotation = (self._rotation + _QUARTER_TURNS[direction]) % 4
+        self._update_raster(rotate_region, _QUARTER_TURNS[direction])
+        if self._parent is not None:
+            self._parent._invalidate_caches()
+
     def paint(self, colour: tuple[int, int, int]) -> bool:
         """Change this Block's colour iff it is a leaf at a level of max_depth
         and its colour is different from <colour>.
 
         Return True iff this Block's colour was changed.
         """
-        if self.level == self.max_depth and self.colour != colour:
-            self.colour = colour
+        index = PALETTE.index(colour)
+        if self.level == self.max_depth and self._colour != index:
+            self._check_changeable()
+            self._record('contents', (self._colour, ()))
+            self._colour = index
+            self._invalidate_caches()
+            self._update_raster(paint_region, self)
             return True
         else:
             return False
@@ -376,40 +1613,130 @@ class Block:
 
         Return True iff this Block was turned into a leaf node.
         """
-        if self.level != (self.max_depth - 1) or len(self.children) == 0:
-            # children block are not leaves or no children
+        majority = self._majority()
+        if majority is None:
             return False
         else:
+            self._check_changeable()
+            self._settle()
+            self._record('contents', (None, tuple(self._children)))
+            self._children = _Children(self)
+            self._rotation = 0
+            self._colour = majority
+            self._invalidate_caches()
+            self._update_raster(paint_region, self)
+            return True
+
+    def combinable(self) -> bool:
+        """Return True iff this block can be combined.
+
+        A block can be combined if its level is one less than max_depth, it
+        has children, and its children have a majority colour, as described
+        in combine.
+        """
+        return self._majority() is not None
+
+    def _majority(self) -> int | None:
+        """Return the palette index of the majority colour of this Block's
+        children, as described in combine, or None if this Block cannot be
+        combined.
+        """
+        if self.level != (self.max_depth - 1) or len(self._children) == 0:
+            # children block are not leaves or no children
+            return None
+        majority = None
+        # Count the children of each colour in COLOUR_LIST, by index.
+        colours = [0] * len(COLOUR_LIST)
+        for child in self._children:
+            if child._colour < len(colours):
+                colours[child._colour] += 1
+        twos = []
+        for col in range(len(colours)):
+            if colours[col] > 2:
+                majority = col
+            elif colours[col] == 2:
+                twos.append(col)
+        if len(twos) == 1:
+            majority = twos[0]
+        elif len(twos) == 2:
             majority = None
-            colours = {}
-            for col in COLOUR_LIST:
-                colours[col] = 0
-            for child in self.children:
-                if child.colour in colours:
-                    colours[child.colour] += 1
-
-            twos = []
-            for col in colours:
-                if colours[col] > 2:
-                    majority = col
-                elif colours[col] == 2:
-                    twos.append(col)
-            if len(twos) == 1:
-                majority = twos[0]
-            elif len(twos) == 2:
-                majority = None
-
-            if majority is None:
-                return False
+        return majority
+
+    def to_bytes(self) -> bytes:
+        """Return a compact encoding of this Block and all its descendants,
+        from which Block.from_bytes can rebuild it.
+
+        The encoding starts with this Block's position, size, level and
+        max_depth, followed by the RGB values of the colours of settings.PALETTE
+        up to the last one used. Then every Block is written in pre-order as
+        one bit that says whether it is subdivided (left out for Blocks at
+        max_depth, which cannot be), and each leaf as the palette index of its
+        colour, in as few bits as those colours need. With the four colours of
+        COLOUR_LIST, that is two bits per leaf.
+
+        >>> board = Block((0, 0), 750, COLOUR_LIST[3], 0, 1)
+        >>> len(board.to_bytes()) - _BOARD_HEADER.size - 3 * len(COLOUR_LIST)
+        1
+        >>> board.smash()
+        True
+        >>> Block.from_bytes(board.to_bytes()) == board
+        True
+        """
+        return _encode(self)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> Block:
+        """Return a new board that is equal to the Block encoded in <data> by
+        Block.to_bytes. <data> may be any bytes-like object.
+
+        Raise a BoardFormatError if <data> does not encode a Block.
+        """
+        data = memoryview(data).cast('B')
+        try:
+            x, y, size, level, max_depth, used = \
+                _BOARD_HEADER.unpack_from(data)
+        except struct.error:
+            raise BoardFormatError
+        offset = _BOARD_HEADER.size
+        if level > max_depth or len(data) < offset + 3 * used:
+            raise BoardFormatError
+        try:
+            indices = [PALETTE.index(tuple(data[offset + 3 * i:
+                                                offset + 3 * i + 3]))
+                       for i in range(used)]
+        except PaletteFullError:
+            # The payload names more new colours than the palette can hold.
+            raise BoardFormatError
+        width = (used - 1).bit_length()
+        reader = _BitReader(data, offset + 3 * used)
+
+        board = Block((x, y), size, None, level, max_depth)
+        pending = [board]
+        while pending:
+            block = pending.pop()
+            if block.level < max_depth and reader.read(1):
+                children = [block._make_child(None) for _ in range(4)]
+                block._children = _Children(block, children)
+                pending.extend(reversed(children))
             else:
-                self.children = []
-                self.colour = majority
-                return True
+                index = reader.read(width)
+                if index >= used:
+                    raise BoardFormatError
+                block._colour = indices[index]
+        if not reader.at_end():
+            raise BoardFormatError
+        return board
 
     def create_copy(self) -> Block:
-        """Return a new Block that is a deep copy of this Block.
+        """Return a new Block that is a copy of this Block.
+
+        The copy shares its descendants with this Block until either of them
+        is changed, so it behaves like a deep copy but takes constant time.
+        Changing a Block later only copies the Blocks on the path from its
+        board's root to it, and their siblings.
 
-        Remember that a deep copy has new blocks (not aliases) at every level.
+        Blocks previously obtained from this Block's board must be looked up
+        again from the root before being changed.
 
         >>> block = generate_board(3, 750)
         >>> copy = block.create_copy()
@@ -417,13 +1744,40 @@ class Block:
         True
         >>> block == copy
         True
+        >>> block = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> block.smash()
+        True
+        >>> copy = block.create_copy()
+        >>> colour = block.children[0].colour
+        >>> copy.children[0].paint(COLOUR_LIST[0] if colour == COLOUR_LIST[1]
+        ...                        else COLOUR_LIST[1])
+        True
+        >>> block.children[0].colour == colour
+        True
+        >>> block == copy
+        False
         """
-        block = Block(self.position, self.size, self.colour, self.level,
-                      self.max_depth)
-        if len(self.children) > 0:
-            for child in self.children:
-                block.children.append(child.create_copy())
-        return block
+        owner = self._owner
+        if owner.live:
+            # From now on, this Block's descendants are shared with the copy.
+            # Only the path from the root to this Block stays in place.
+            owner.live = False
+            path_owner = _Owner()
+            path_owner.journal = owner.journal
+            path_owner.raster = owner.raster
+            path_owner.trackers = owner.trackers
+            owner.raster = None
+            owner.trackers = []
+            node = self
+            while node is not None:
+                node._owner = path_owner
+                node = node._parent
+        copy = self._clone(None)
+        copy._position, copy._size = self._geometry()
+        if self._owner.raster is not None:
+            x, y, n = self.cells()
+            copy._owner.raster = self._owner.raster[x:x + n, y:y + n].copy()
+        return copy
 
 
 if __name__ == '__main__':
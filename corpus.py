@@ -0,0 +1,148 @@
+from __future__ import annotations
+import mmap
+import struct
+import sys
+from array import array
+from typing import Iterable, Iterator
+
+from block import Block
+
+# A corpus file holds many boards, each encoded by Block.to_bytes. It is laid
+# out as:
+# - a header: _MAGIC and the format version,
+# - the encoded boards, one after the other,
+# - an index: the offset in the file of each board, followed by the offset
+#   just past the last board, as unsigned 64-bit integers,
+# - a footer: the number of boards, the offset of the index, and _MAGIC.
+# All integers are little-endian. Since the index is at the end, boards can be
+# written as they are generated, and a corpus can be memory-mapped and read
+# one board at a time.
+_MAGIC = b'BLOCKYCO'
+_VERSION = 1
+_HEADER = struct.Struct('<8sI')
+_OFFSET = struct.Struct('<Q')
+_FOOTER = struct.Struct('<QQ8s')
+
+
+class CorpusFormatError(Exception):
+    """ An exception to be raised when a file is not a corpus of boards.
+    """
+    pass
+
+
+def write_corpus(path: str, boards: Iterable[Block]) -> int:
+    """Write <boards> to a new corpus file at <path>, and return the number of
+    boards written.
+
+    The boards are written one at a time, so <boards> may be a generator that
+    yields more boards than fit in memory.
+    """
+    offsets = array('Q')
+    with open(path, 'wb') as file:
+        file.write(_HEADER.pack(_MAGIC, _VERSION))
+        position = _HEADER.size
+        for board in boards:
+            data = board.to_bytes()
+            offsets.append(position)
+            file.write(data)
+            position += len(data)
+        count = len(offsets)
+        offsets.append(position)
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        file.write(offsets.tobytes())
+        file.write(_FOOTER.pack(count, position, _MAGIC))
+    return count
+
+
+class Corpus:
+    """A corpus file of boards, memory-mapped so that its boards are only read
+    from the file as they are needed.
+
+    A Corpus can be used as a sequence of boards, and as a context manager
+    that closes it.
+
+    Private Instance Attributes:
+    - _file: The open corpus file.
+    - _map: The memory map of <_file>.
+    - _count: The number of boards in the corpus.
+    - _index: The offset in the file of the index of board offsets.
+
+    Representation Invariants:
+    - self._count >= 0
+    """
+    _file: object
+    _map: mmap.mmap
+    _count: int
+    _index: int
+
+    def __init__(self, path: str) -> None:
+        """Open the corpus file at <path>.
+
+        Raise a CorpusFormatError if the file is not a corpus.
+        """
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            # The file is empty, so it cannot be mapped.
+            self._file.close()
+            raise CorpusFormatError
+        size = len(self._map)
+        if size < _HEADER.size + _OFFSET.size + _FOOTER.size \
+                or _HEADER.unpack_from(self._map) != (_MAGIC, _VERSION):
+            self.close()
+            raise CorpusFormatError
+        self._count, self._index, magic = \
+            _FOOTER.unpack_from(self._map, size - _FOOTER.size)
+        if magic != _MAGIC or self._index + (self._count + 1) * _OFFSET.size \
+                != size - _FOOTER.size:
+            self.close()
+            raise CorpusFormatError
+
+    def __len__(self) -> int:
+        """Return the number of boards in this corpus.
+        """
+        return self._count
+
+    def raw(self, i: int) -> bytes:
+        """Return the encoding of board <i> of this corpus, as made by
+        Block.to_bytes.
+
+        Raise an IndexError if there is no board <i>.
+        """
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError
+        start, = _OFFSET.unpack_from(self._map, self._index + i * _OFFSET.size)
+        end, = _OFFSET.unpack_from(self._map,
+                                   self._index + (i + 1) * _OFFSET.size)
+        return self._map[start:end]
+
+    def __getitem__(self, i: int) -> Block:
+        """Return a new board equal to board <i> of this corpus.
+
+        Raise an IndexError if there is no board <i>.
+        """
+        return Block.from_bytes(self.raw(i))
+
+    def __iter__(self) -> Iterator[Block]:
+        """Return an iterator over new boards equal to those of this corpus,
+        decoding each one only when it is reached.
+        """
+        for i in range(self._count):
+            yield self[i]
+
+    def close(self) -> None:
+        """Close this corpus, which must not be used afterwards.
+        """
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> Corpus:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
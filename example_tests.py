@@ -1,12 +1,27 @@
+import math
+import random
+import time
 import pytest
-from block import Block
-from state import _block_to_squares
-from goal import BlobGoal, PerimeterGoal, flatten, generate_goals
-from player import _get_block, HumanPlayer, SmartPlayer, RandomPlayer, create_players
-from settings import COLOUR_LIST
+from concurrent.futures import Future, ProcessPoolExecutor, \
+    ThreadPoolExecutor
+from typing import Any
+from block import Block, BoardFormatError, SharedBlockError, \
+    generate_board, generate_boards
+from blob import blob_sizes
+from corpus import Corpus, CorpusFormatError, write_corpus
+from linear_board import LinearBlock, from_block
+from raster import NUMPY_AVAILABLE, new_raster, np, stack_rasters
+from state import GameData, MainState, _block_to_squares
+from goal import BlobGoal, PerimeterGoal, flatten, flatten_array, \
+    generate_goals, score_goals, ScoreCache, _flatten_list
+from player import _decoded_boards, _get_block, _score_trials, \
+    BeamSearchPlayer, HumanPlayer, MCTSPlayer, SmartPlayer, RandomPlayer, \
+    create_players
+from settings import COLOUR_LIST, MAX_PALETTE_SIZE, PALETTE, Palette
 from actions import Action, KEY_ACTION, ROTATE_CLOCKWISE, \
     ROTATE_COUNTER_CLOCKWISE, \
-    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE
+    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE, \
+    legal_moves, random_legal_move, _move_count
 
 
 def set_children(block: Block, colours: list[tuple[int, int, int]] | None) \
@@ -242,6 +257,969 @@ class TestBlock:
         assert id(board) != id(copy)
         assert board == copy
 
+    def test_create_copy_shares_subtrees(self) -> None:
+        """Test that a copy shares the original's subtrees until one of them
+        is changed, and that changing the copy leaves the original intact."""
+        board = board_4x4()
+        copy = board.create_copy()
+        assert copy.view_children()[0] is board.view_children()[0]
+
+        assert copy.children[0].children[2].paint(COLOUR_LIST[2])
+        assert copy == board_4x4_paint()
+        assert board == board_4x4()
+        assert copy.view_children()[0] is not board.view_children()[0]
+
+    def test_create_copy_stale_block(self) -> None:
+        """Test that a Block obtained before its board was copied cannot be
+        changed, but the same Block looked up again can."""
+        board = board_4x4()
+        block = board.children[0]
+        board.create_copy()
+        with pytest.raises(SharedBlockError):
+            block.rotate(1)
+
+        assert board.children[0].rotate(1)
+        assert board == board_4x4_rotate1()
+
+
+class TestStructuralHash:
+    """Tests for Block.structural_hash.
+    """
+
+    def test_hash_tracks_moves(self) -> None:
+        """Test that each move changes the hash to that of the resulting
+        board, and undoing it restores the original hash."""
+        moves = [
+            (lambda board: board.swap(0), board_4x4_swap0()),
+            (lambda board: board.children[0].rotate(1), board_4x4_rotate1()),
+            (lambda board: board.children[0].children[2].paint(
+                COLOUR_LIST[2]), board_4x4_paint()),
+            (lambda board: board.children[0].combine(), board_4x4_combine())
+        ]
+        original = board_4x4().structural_hash()
+        for move, expected in moves:
+            board = board_4x4()
+            journal = board.start_journal()
+            assert board.structural_hash() == original
+            assert move(board)
+            assert board.structural_hash() == expected.structural_hash()
+            assert board.structural_hash() != original
+            journal.undo()
+            assert board.structural_hash() == original
+
+    def test_hash_depends_on_slot(self) -> None:
+        """Test that swapping two differently coloured children changes the
+        hash, and that the hash matches the linear backend's."""
+        board = board_4x4()
+        swapped = board.create_copy()
+        assert swapped.children[0].swap(1)
+        assert swapped.structural_hash() != board.structural_hash()
+        assert from_block(swapped).structural_hash() == \
+            swapped.structural_hash()
+
+    def test_hash_tracks_list_changes(self) -> None:
+        """Test that changing a children list in place, other than by
+        adding to it, changes the hash to that of the resulting board."""
+        board = board_4x4()
+        board.structural_hash()
+        board.children.reverse()
+        expected = Block((0, 0), 750, None, 0, 2)
+        set_children(expected, [COLOUR_LIST[3], COLOUR_LIST[1],
+                                COLOUR_LIST[2], None])
+        set_children(expected.children[3], [COLOUR_LIST[0], COLOUR_LIST[1],
+                                            COLOUR_LIST[1], COLOUR_LIST[3]])
+        assert board.structural_hash() == expected.structural_hash()
+        assert board == expected
+        child = board.children.pop()
+        board.children.insert(0, child)
+        assert board.structural_hash() != expected.structural_hash()
+        board.children.remove(child)
+        board.children.append(child)
+        assert board.structural_hash() == expected.structural_hash()
+        del board.children[:]
+        board.colour = COLOUR_LIST[0]
+        assert board.structural_hash() == board_1x1().structural_hash()
+
+
+class TestLazyRotation:
+    """Tests for applying rotations to a Block's children lazily.
+    """
+
+    def test_rotate_is_lazy(self) -> None:
+        """Test that rotating a board leaves its descendants untouched until
+        they are read, and that they are correct once they are."""
+        board = board_4x4()
+        expected = from_block(board_4x4())
+        grandchild = board.children[0].children[0]
+        assert board.rotate(1)
+        assert expected.rotate(1)
+        assert board.children[3].children[3] is grandchild
+        assert board == expected
+
+    def test_rotations_cancel(self) -> None:
+        """Test that opposite rotations and four quarter turns leave the board
+        and its hash unchanged."""
+        board = board_4x4()
+        original = board.structural_hash()
+        assert board.rotate(1)
+        assert board.rotate(1)
+        assert board.children[2].rotate(3)
+        assert board.rotate(3)
+        assert board.structural_hash() != original
+        assert board.rotate(3)
+        assert board.children[0].rotate(1)
+        assert board.structural_hash() == original
+        assert board == board_4x4()
+
+    def test_random_moves_match_linear_board(self) -> None:
+        """Test that random moves on a lazy board give the same board and hash
+        as the same moves made eagerly on the linear backend."""
+        random.seed(7)
+        board = generate_board(4, 64)
+        linear = from_block(board)
+        for _ in range(100):
+            blocks, handles = [board], [linear]
+            i = 0
+            while i < len(blocks):
+                blocks.extend(blocks[i].children)
+                handles.extend(handles[i].children)
+                i += 1
+            index = random.randrange(len(blocks))
+            move = random.choice(['rotate', 'swap'])
+            direction = random.choice([0, 1] if move == 'swap' else [1, 3])
+            assert getattr(blocks[index], move)(direction) == \
+                getattr(handles[index], move)(direction)
+            assert board.structural_hash() == linear.structural_hash()
+        assert board == linear
+        assert _block_to_squares(board) == _block_to_squares(linear)
+
+
+class TestImplicitCoordinates:
+    """Tests for working out the positions and sizes of Blocks from the root.
+    """
+
+    def test_positions_follow_moves(self) -> None:
+        """Test that a Block's position and size reflect moves made above it
+        straight away, and that moving the root moves every Block."""
+        board = board_4x4()
+        grandchild = board.children[0].children[0]
+        assert grandchild.position == (563, 0)
+        assert grandchild.size == 188
+        assert board.rotate(1)
+        assert grandchild.position == (563, 563)
+        assert board.swap(0)
+        assert grandchild.position == (188, 563)
+        board._update_children_positions((10, 20))
+        assert grandchild.position == (198, 583)
+        assert not hasattr(grandchild, '__dict__')
+
+    def test_block_to_squares_after_move(self) -> None:
+        """Test that the squares drawn for a board are redrawn after a move,
+        but not for a copy of an unchanged board."""
+        board = board_4x4()
+        squares = _block_to_squares(board)
+        assert _block_to_squares(board.create_copy()) == squares
+        assert board.children[0].rotate(1)
+        assert sorted(_block_to_squares(board)) == \
+            sorted(_block_to_squares(board_4x4_rotate1()))
+        assert sorted(_block_to_squares(board)) != sorted(squares)
+
+    def test_block_to_squares_kept_per_board(self) -> None:
+        """Test that each board keeps its own squares, so drawing two boards
+        in turn does not walk either again."""
+        first, second = board_4x4(), board_4x4_paint()
+        squares = [_block_to_squares(first), _block_to_squares(second)]
+        assert _block_to_squares(first) is squares[0]
+        assert _block_to_squares(second) is squares[1]
+
+
+class TestPalette:
+    """Tests for storing colours as indices into settings.PALETTE.
+    """
+
+    def test_colour_list_indices(self) -> None:
+        """Test that the colours of COLOUR_LIST keep their indices, and that a
+        new colour is added to the palette once."""
+        palette = Palette(COLOUR_LIST)
+        assert [palette.index(colour) for colour in COLOUR_LIST] == \
+            list(range(len(COLOUR_LIST)))
+        assert palette.index((1, 2, 3)) == len(COLOUR_LIST)
+        assert palette.index((1, 2, 3)) == len(COLOUR_LIST)
+        assert len(palette) == len(COLOUR_LIST) + 1
+
+    def test_block_stores_index(self) -> None:
+        """Test that Blocks store palette indices but still report, paint and
+        flatten RGB colours."""
+        board = board_4x4()
+        leaf = board.children[1]
+        assert leaf.colour_index == 2
+        assert leaf.colour == COLOUR_LIST[2]
+        corner = board.children[0].children[0]
+        assert corner.paint((10, 20, 30))
+        assert corner.colour == (10, 20, 30)
+        assert corner.colour_index == PALETTE.index((10, 20, 30))
+        assert flatten(board)[3][0] == (10, 20, 30)
+        assert from_block(board) == board
+
+    def test_blob_does_not_wrap(self) -> None:
+        """Test that a blob touching one edge of the board is not joined to
+        cells on the opposite edge."""
+        board = Block((0, 0), 750, None, 0, 2)
+        set_children(board, [None] * 4)
+        for child in board.children:
+            set_children(child, [COLOUR_LIST[1]] * 4)
+        assert board.children[1].children[1].paint(COLOUR_LIST[0])
+        assert board.children[0].children[0].paint(COLOUR_LIST[0])
+        assert BlobGoal(COLOUR_LIST[0]).score(board) == 1
+
+
+@pytest.mark.skipif(not NUMPY_AVAILABLE, reason='NumPy is not installed')
+class TestRaster:
+    """Tests for keeping a raster of a board in step with its moves.
+    """
+
+    def test_raster_matches_flatten(self) -> None:
+        """Test that a board's raster holds the palette indices of the cells
+        returned by flatten."""
+        board = board_4x4()
+        expected = [[PALETTE.index(cell) for cell in column]
+                    for column in flatten(board)]
+        assert board.raster().tolist() == expected
+        assert board.children[0].raster().tolist() == \
+            [column[:2] for column in expected[2:]]
+
+    def test_raster_follows_moves(self) -> None:
+        """Test that the raster of a board is kept up to date by every move,
+        and by undoing and redoing them, without being rebuilt."""
+        random.seed(11)
+        board = generate_board(4, 750)
+        journal = board.start_journal()
+        raster = board.raster()
+        moves = [lambda b: b.rotate(1), lambda b: b.children[2].rotate(3),
+                 lambda b: b.swap(1), lambda b: b.children[0].swap(0),
+                 lambda b: b.children[3].smash() or b.children[3].combine()]
+        for move in moves:
+            journal.begin_move()
+            journal.end_move(move(board))
+            assert board.raster().base is raster.base
+            assert (raster == new_raster(board)).all()
+        while journal.undo():
+            assert (raster == new_raster(board)).all()
+
+    def test_copy_has_own_raster(self) -> None:
+        """Test that changing a copy of a board does not change the original's
+        raster."""
+        board = board_4x4()
+        before = board.raster().copy()
+        copy = board.create_copy()
+        assert copy.children[1].smash()
+        assert (board.raster() == before).all()
+        assert (copy.raster() == new_raster(copy)).all()
+
+
+class TestSerialization:
+    """Tests for encoding boards as bytes, and for corpus files of boards.
+    """
+
+    def test_round_trip(self) -> None:
+        """Test that decoding the encoding of a board gives an equal board,
+        including colours outside COLOUR_LIST."""
+        random.seed(5)
+        for depth in range(5):
+            board = generate_board(depth, 750)
+            assert Block.from_bytes(board.to_bytes()) == board
+        board = board_4x4()
+        assert board.children[0].children[3].paint((12, 34, 56))
+        assert board.children[0].rotate(1)
+        copy = Block.from_bytes(bytearray(board.to_bytes()))
+        assert copy == board
+        assert copy.to_bytes() == board.to_bytes()
+
+    def test_bad_bytes(self) -> None:
+        """Test that truncated or padded encodings are rejected."""
+        data = board_4x4().to_bytes()
+        for bad in [b'', data[:-1], data + b'\x00']:
+            with pytest.raises(BoardFormatError):
+                Block.from_bytes(bad)
+
+    def test_bad_bytes_full_palette(self, monkeypatch) -> None:
+        """Test that an encoding with a colour that does not fit in the
+        palette is rejected."""
+        colours = COLOUR_LIST + [(i, 0, 255) for i in
+                                 range(MAX_PALETTE_SIZE - len(COLOUR_LIST))]
+        monkeypatch.setattr(PALETTE, 'colours', colours)
+        monkeypatch.setattr(PALETTE, '_indices', {colour: i for i, colour
+                                                  in enumerate(colours)})
+        board = Block((0, 0), 750, COLOUR_LIST[0], 0, 0)
+        data = bytearray(board.to_bytes())
+        # Replace the only colour in the encoding with one not in the palette.
+        data[-3:] = bytes([255, 255, 0])
+        with pytest.raises(BoardFormatError):
+            Block.from_bytes(data)
+
+    def test_corpus(self, tmp_path) -> None:
+        """Test that a corpus written from a generator gives back the same
+        boards, in order."""
+        random.seed(9)
+        boards = [generate_board(3, 750) for _ in range(20)]
+        path = str(tmp_path / 'boards.corpus')
+        assert write_corpus(path, (board for board in boards)) == 20
+        with Corpus(path) as corpus:
+            assert len(corpus) == 20
+            assert corpus[-1] == boards[-1]
+            assert corpus.raw(3) == boards[3].to_bytes()
+            assert list(corpus) == boards
+        (tmp_path / 'empty').write_bytes(b'')
+        with pytest.raises(CorpusFormatError):
+            Corpus(str(tmp_path / 'empty'))
+
+
+@pytest.mark.skipif(not NUMPY_AVAILABLE, reason='NumPy is not installed')
+class TestGenerateBoards:
+    """Tests for generate_boards.
+    """
+
+    def test_seeded(self) -> None:
+        """Test that a seed always gives the same boards, that each board only
+        depends on its place in the batch, and that the random module is not
+        used."""
+        random.seed(1)
+        state = random.getstate()
+        boards = generate_boards(10, 5, 750, seed=42)
+        assert random.getstate() == state
+        assert boards == generate_boards(10, 5, 750, seed=42)
+        assert boards[:4] == generate_boards(4, 5, 750, seed=42)
+        assert boards != generate_boards(10, 5, 750, seed=43)
+        for board in boards:
+            assert board.size == 750 and board.max_depth == 5
+            assert len(board.children) == 4
+
+    def test_smash_probabilities(self) -> None:
+        """Test that Blocks at each level are smashed about as often as
+        Block.smash would smash them."""
+        smashed = [0] * 5
+        total = [0] * 5
+        for board in generate_boards(300, 4, 750, seed=7):
+            pending = [board]
+            while pending:
+                block = pending.pop()
+                total[block.level] += 1
+                smashed[block.level] += len(block.children) > 0
+                pending.extend(block.children)
+        assert smashed[0] == total[0]
+        for level in range(1, 4):
+            assert abs(smashed[level] / total[level]
+                       - math.exp(-0.25 * level)) < 0.05
+        assert smashed[4] == 0
+
+
+@pytest.mark.skipif(not NUMPY_AVAILABLE, reason='NumPy is not installed')
+class TestFlattenArray:
+    """Tests for flatten_array and the goals that score from arrays.
+    """
+
+    def test_matches_flatten(self) -> None:
+        """Test that flatten_array and flatten agree, cell by cell, with the
+        list-based flatten."""
+        random.seed(3)
+        for depth in range(6):
+            board = generate_board(depth, 750)
+            cells = _flatten_list(board)
+            assert flatten_array(board).tolist() == cells
+            assert flatten(board) == [[COLOUR_LIST[cell] for cell in column]
+                                      for column in cells]
+
+    def test_perimeter_matches_lists(self) -> None:
+        """Test that PerimeterGoal scores the same from an array as from the
+        list-based flatten."""
+        random.seed(4)
+        for _ in range(20):
+            board = generate_board(4, 750)
+            cells = _flatten_list(board)
+            for colour in COLOUR_LIST:
+                target = PALETTE.index(colour)
+                expected = sum(column[0] == target for column in cells) \
+                    + sum(column[-1] == target for column in cells) \
+                    + cells[0].count(target) + cells[-1].count(target)
+                assert PerimeterGoal(colour).score(board) == expected
+
+
+class TestEdgeCounts:
+    """Tests for the colour counts that Blocks cache along their edges.
+    """
+
+    @staticmethod
+    def _edges_from_cells(board: Block) -> list[dict[int, int]]:
+        """Return the colour counts along the top, right, bottom and left
+        edges of <board>, counted from its flattened cells."""
+        cells = _flatten_list(board)
+        lines = [[column[0] for column in cells], cells[-1],
+                 [column[-1] for column in cells], cells[0]]
+        return [{colour: line.count(colour) for colour in set(line)}
+                for line in lines]
+
+    def test_match_cells_after_moves(self) -> None:
+        """Test that the edge counts of a board and its subtrees agree with
+        its flattened cells after random moves."""
+        random.seed(13)
+        board = generate_board(4, 750)
+        board.edge_counts()
+        for _ in range(300):
+            block = board
+            while block.children and random.random() < 0.7:
+                block = random.choice(block.children)
+            move = random.randrange(5)
+            if move == 0:
+                block.rotate(random.choice([1, 3]))
+            elif move == 1:
+                block.swap(random.choice([0, 1]))
+            elif move == 2:
+                block.paint(random.choice(COLOUR_LIST))
+            elif move == 3:
+                block.combine()
+            else:
+                block.smash()
+            assert list(board.edge_counts()) == self._edges_from_cells(board)
+            assert list(block.edge_counts()) == self._edges_from_cells(block)
+
+    def test_copies_keep_their_own_counts(self) -> None:
+        """Test that changing a copy does not change the edge counts of the
+        board it was copied from."""
+        random.seed(14)
+        board = generate_board(3, 750)
+        expected = self._edges_from_cells(board)
+        copy = board.create_copy()
+        copy.rotate(1)
+        copy.paint(COLOUR_LIST[0])
+        copy.smash()
+        assert list(board.edge_counts()) == expected
+        assert list(copy.edge_counts()) == self._edges_from_cells(copy)
+
+
+class TestBlobSizes:
+    """Tests for finding blobs by joining leaves.
+    """
+
+    @staticmethod
+    def _sizes_from_cells(board: Block, target: int) -> list[int]:
+        """Return the sizes of the blobs of colour <target> in <board>,
+        found by a flood fill of its flattened cells."""
+        cells = _flatten_list(board)
+        n = len(cells)
+        seen = set()
+        sizes = []
+        for start in [(i, j) for i in range(n) for j in range(n)]:
+            if start in seen or cells[start[0]][start[1]] != target:
+                continue
+            seen.add(start)
+            stack = [start]
+            size = 0
+            while stack:
+                i, j = stack.pop()
+                size += 1
+                for cell in [(i + 1, j), (i - 1, j), (i, j + 1), (i, j - 1)]:
+                    if 0 <= cell[0] < n and 0 <= cell[1] < n \
+                            and cell not in seen \
+                            and cells[cell[0]][cell[1]] == target:
+                        seen.add(cell)
+                        stack.append(cell)
+            sizes.append(size)
+        return sorted(sizes)
+
+    def test_match_flood_fill(self) -> None:
+        """Test that the blobs found from the leaves of random boards, on
+        both backends, match a flood fill of their cells."""
+        random.seed(15)
+        for depth in range(6):
+            for _ in range(5):
+                board = generate_board(depth, 750)
+                if board.children:
+                    board.children[0].rotate(1)
+                for target in range(len(COLOUR_LIST)):
+                    expected = self._sizes_from_cells(board, target)
+                    assert sorted(blob_sizes(board, target)) == expected
+                    assert sorted(blob_sizes(from_block(board), target)) == \
+                        expected
+
+    def test_deep_uniform_board(self) -> None:
+        """Test that a deep board of one colour is scored as one blob."""
+        random.seed(16)
+        board = generate_board(7, 750)
+        pending = [board]
+        while pending:
+            block = pending.pop()
+            if block.children:
+                pending.extend(block.children)
+            else:
+                block.colour = COLOUR_LIST[2]
+        assert BlobGoal(COLOUR_LIST[2]).score(board) == 128 * 128
+        assert BlobGoal(COLOUR_LIST[0]).score(board) == 0
+
+    def test_undiscovered_blob_size_large_blob(self) -> None:
+        """Test that a blob of more cells than the recursion limit is
+        measured without recursing."""
+        cells = [[COLOUR_LIST[1]] * 128 for _ in range(128)]
+        visited = [[-1] * 128 for _ in range(128)]
+        goal = BlobGoal(COLOUR_LIST[1])
+        assert goal._undiscovered_blob_size((5, 7), cells, visited) == \
+            128 * 128
+        assert all(cell == 1 for column in visited for cell in column)
+
+
+class TestScoreGoals:
+    """Tests for scoring many goals on one board at once.
+    """
+
+    def test_match_each_goal(self) -> None:
+        """Test that score_goals agrees with scoring each goal on its own,
+        on both backends."""
+        random.seed(18)
+        goals = [PerimeterGoal(colour) for colour in COLOUR_LIST] \
+            + [BlobGoal(colour) for colour in COLOUR_LIST]
+        for depth in range(6):
+            board = generate_board(depth, 750)
+            expected = [goal.score(board) for goal in goals]
+            assert score_goals(board, goals) == expected
+            assert score_goals(from_block(board), goals) == expected
+
+    def test_calculate_all_scores(self) -> None:
+        """Test that GameData scores every player as calculate_score does.
+        """
+        random.seed(19)
+        data = GameData(generate_board(4, 750), create_players(0, 4, []))
+        data.players[1].penalty = 3
+        assert data.calculate_all_scores() == \
+            [data.calculate_score(player.id) for player in data.players]
+
+
+class TestScoreCache:
+    """Tests for the LRU cache of goal scores.
+    """
+
+    def test_evicts_least_recently_used(self) -> None:
+        """Test that a full cache forgets the score used least recently, and
+        counts hits and misses."""
+        cache = ScoreCache(2)
+        goal = BlobGoal(COLOUR_LIST[0])
+        boards = [Block((0, 0), 750, COLOUR_LIST[i], 0, 2) for i in range(3)]
+        assert cache.score(goal, boards[0]) == 16
+        assert cache.score(goal, boards[1]) == 0
+        assert cache.score(goal, boards[0]) == 16
+        assert cache.score(goal, boards[2]) == 0
+        assert len(cache) == 2
+        assert (cache.hits, cache.misses) == (1, 3)
+        cache.score(goal, boards[0])
+        cache.score(goal, boards[1])
+        assert (cache.hits, cache.misses) == (2, 4)
+        cache.clear()
+        assert (len(cache), cache.hits, cache.misses) == (0, 0, 0)
+
+    def test_score_goals_with_cache(self) -> None:
+        """Test that scoring through a cache gives the same scores, and finds
+        them all in the cache the second time."""
+        random.seed(20)
+        cache = ScoreCache()
+        goals = [PerimeterGoal(COLOUR_LIST[0]), BlobGoal(COLOUR_LIST[1])]
+        board = generate_board(4, 750)
+        expected = score_goals(board, goals)
+        assert score_goals(board, goals, cache) == expected
+        assert score_goals(board.create_copy(), goals, cache) == expected
+        assert (cache.hits, cache.misses) == (2, 2)
+        board.swap(0)
+        assert score_goals(board, goals, cache) == score_goals(board, goals)
+
+
+class TestBlobTracker:
+    """Tests for keeping the blobs of a board up to date as it changes.
+    """
+
+    def test_matches_blob_sizes_after_moves(self) -> None:
+        """Test that tracked blobs match those found from scratch after
+        random moves, undos and copies."""
+        random.seed(21)
+        board = generate_board(4, 750)
+        journal = board.start_journal()
+        trackers = [board.track_blobs(colour) for colour in COLOUR_LIST]
+        for _ in range(300):
+            block = board
+            while block.children and random.random() < 0.7:
+                block = random.choice(block.children)
+            move = random.randrange(7)
+            if move == 0:
+                block.rotate(random.choice([1, 3]))
+            elif move == 1:
+                block.swap(random.choice([0, 1]))
+            elif move == 2:
+                block.paint(random.choice(COLOUR_LIST))
+            elif move == 3:
+                block.combine()
+            elif move == 4:
+                block.smash()
+            elif move == 5:
+                journal.undo()
+            else:
+                block.create_copy().smash()
+            for tracker in trackers:
+                assert sorted(tracker.sizes()) == \
+                    sorted(blob_sizes(board, tracker.target))
+
+    def test_copy_does_not_keep_tracker(self) -> None:
+        """Test that changing a copy of a board does not change the blobs
+        tracked on the board."""
+        board = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+        tracker = board.track_blobs(COLOUR_LIST[0])
+        copy = board.create_copy()
+        copy.smash()
+        copy.children[0].colour = COLOUR_LIST[1]
+        assert tracker.largest() == 16
+
+
+@pytest.mark.skipif(not NUMPY_AVAILABLE, reason='NumPy is not installed')
+class TestScoreMany:
+    """Tests for scoring goals on a stack of rasters at once.
+    """
+
+    def test_matches_score(self) -> None:
+        """Test that score_many agrees with scoring each board on its own.
+        """
+        random.seed(22)
+        boards = [generate_board(4, 750) for _ in range(30)]
+        for board in boards[:10]:
+            if board.children:
+                board.children[0].rotate(1)
+        rasters = stack_rasters(boards)
+        # Stacking does not make the boards keep rasters of their own.
+        assert all(board._owner.raster is None for board in boards)
+        for colour in COLOUR_LIST:
+            for goal in [PerimeterGoal(colour), BlobGoal(colour)]:
+                assert goal.score_many(rasters) == \
+                    [goal.score(board) for board in boards]
+
+    def test_winding_blob(self) -> None:
+        """Test that a blob that winds back and forth across the board is
+        counted as one."""
+        cells = [[1] * 8 for _ in range(8)]
+        for column in range(1, 8, 2):
+            for row in range(7):
+                cells[column][row if column % 4 == 1 else row + 1] = 0
+        rasters = np.array([cells, cells], dtype=np.uint8)
+        # The walls are four blobs of 7 cells, around one blob of 36.
+        assert BlobGoal(COLOUR_LIST[1]).score_many(rasters) == [36, 36]
+        assert BlobGoal(COLOUR_LIST[0]).score_many(rasters) == [7, 7]
+
+
+class TestUpperBound:
+    """Tests for the score upper bounds used to prune moves.
+    """
+
+    def test_bounds_are_admissible(self) -> None:
+        """Test that no action scores more than its bound, and that rotations
+        of a perimeter goal are bounded exactly."""
+        random.seed(23)
+        actions = [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE,
+                   SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, COMBINE, PAINT,
+                   PASS]
+        for _ in range(15):
+            board = generate_board(4, 750)
+            for colour in COLOUR_LIST:
+                for goal in [PerimeterGoal(colour), BlobGoal(colour)]:
+                    for action in actions:
+                        copy = board.create_copy()
+                        block = copy
+                        while block.children and random.random() < 0.6:
+                            block = random.choice(block.children)
+                        bound = goal.upper_bound(copy, block, action)
+                        if action.apply(block, {'colour': colour}):
+                            score = goal.score(copy) - action.penalty
+                            assert score <= bound
+                            if isinstance(goal, PerimeterGoal) and \
+                                    action in (ROTATE_CLOCKWISE,
+                                               ROTATE_COUNTER_CLOCKWISE):
+                                assert score == bound
+
+    def test_pruning_keeps_smart_player_moves(self, monkeypatch) -> None:
+        """Test that SmartPlayer chooses the same moves whether or not it
+        skips moves by their bounds."""
+        def choose(goal_type: type, seed: int) -> tuple:
+            random.seed(seed)
+            board = generate_board(4, 750)
+            player = SmartPlayer(0, goal_type(COLOUR_LIST[seed % 4]), 20)
+            player._proceed = True
+            move = player.generate_move(board)
+            return move and (move[0], move[1].position, move[1].level)
+
+        for goal_type in [PerimeterGoal, BlobGoal]:
+            pruned = [choose(goal_type, seed) for seed in range(15)]
+            monkeypatch.setattr(goal_type, 'upper_bound',
+                                lambda *args: math.inf)
+            assert [choose(goal_type, seed) for seed in range(15)] == pruned
+
+    def test_linear_board_bounds(self) -> None:
+        """Test that the bounds on a linear board are the same as on the tree
+        board it was made from."""
+        random.seed(36)
+        board = generate_board(3, 750)
+        board.children[1].rotate(1)
+        linear = from_block(board)
+        for colour in COLOUR_LIST:
+            for goal in [PerimeterGoal(colour), BlobGoal(colour)]:
+                pending = [(board, linear)]
+                while pending:
+                    block, linear_block = pending.pop()
+                    pending.extend(zip(block.children, linear_block.children))
+                    for action in KEY_ACTION.values():
+                        assert goal.upper_bound(linear, linear_block,
+                                                action) == \
+                            goal.upper_bound(board, block, action)
+
+    def test_smart_player_linear_board(self) -> None:
+        """Test that SmartPlayer chooses the same moves on a linear board as
+        on the tree board it was made from, without changing either."""
+        for seed in range(8):
+            random.seed(seed)
+            board = generate_board(4, 750)
+            linear = from_block(board)
+            goal = [PerimeterGoal, BlobGoal][seed % 2](COLOUR_LIST[seed % 4])
+            moves = []
+            for start in [board, linear]:
+                random.seed(seed)
+                player = SmartPlayer(0, goal, 20)
+                player._proceed = True
+                move = player.generate_move(start)
+                moves.append(move and (move[0], move[1].position,
+                                       move[1].level))
+            assert moves[0] == moves[1]
+            assert linear == board
+
+
+class TestLegalMoves:
+    """Tests for listing the legal moves on a board.
+    """
+
+    def test_match_trying_every_move(self) -> None:
+        """Test that legal_moves yields exactly the moves that change the
+        board, found by trying every action on every block of a copy."""
+        random.seed(25)
+        actions = [SMASH, PAINT, ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE,
+                   SWAP_HORIZONTAL, SWAP_VERTICAL, COMBINE]
+        for depth in range(1, 5):
+            for _ in range(5):
+                board = generate_board(depth, 750)
+                colour = random.choice(COLOUR_LIST)
+                if board.children and board.children[0].children:
+                    board.children[0].children[0].rotate(1)
+                encoded = board.to_bytes()
+                expected = []
+                pending = [()]
+                while pending:
+                    path = pending.pop()
+                    results = {}
+                    for action in actions:
+                        copy = board.create_copy()
+                        block = copy
+                        for index in path:
+                            block = block.children[index]
+                        if action.apply(block, {'colour': colour}):
+                            result = copy.to_bytes()
+                            results[action] = result
+                            if action is ROTATE_COUNTER_CLOCKWISE and \
+                                    result == results[ROTATE_CLOCKWISE]:
+                                continue
+                            if action is SMASH or result != encoded:
+                                expected.append((path, action))
+                    block = board
+                    for index in path:
+                        block = block.children[index]
+                    pending.extend(path + (i,)
+                                   for i in range(len(block.children)))
+                moves = list(legal_moves(board, colour))
+                assert len(moves) == len(set(moves))
+                assert set(moves) == set(expected)
+                assert board.to_bytes() == encoded
+
+    def test_uniform_board_has_few_moves(self) -> None:
+        """Test that on a board whose four children look alike, no rotation
+        or swap is listed, and only the children can be smashed."""
+        board = Block((0, 0), 750, COLOUR_LIST[2], 0, 2)
+        board.smash()
+        for child in board.children:
+            child.children = []
+            child.colour = COLOUR_LIST[2]
+        moves = list(legal_moves(board, COLOUR_LIST[2]))
+        assert sorted(action.short_name for _, action in moves) == \
+            ['smash'] * 4
+        assert random_legal_move(board, COLOUR_LIST[2]) in moves
+
+    def test_linear_board_moves(self) -> None:
+        """Test that a linear board has the same legal moves as the tree
+        board it was made from."""
+        random.seed(26)
+        for depth in range(1, 5):
+            board = generate_board(depth, 750)
+            linear = from_block(board)
+            for colour in COLOUR_LIST:
+                expected = [(path, action) for path, action
+                            in legal_moves(board, colour)]
+                assert list(legal_moves(linear, colour)) == expected
+                assert random_legal_move(linear, colour) in expected
+
+    def test_move_counts_follow_moves(self) -> None:
+        """Test that the legal move counts cached for random_legal_move stay
+        equal to the number of legal moves as moves are made on a board and
+        its copies."""
+        random.seed(28)
+        board = generate_board(4, 750)
+        for _ in range(60):
+            for colour in COLOUR_LIST:
+                moves = list(legal_moves(board, colour))
+                assert _move_count(board, PALETTE.index(colour)) == \
+                    len(moves)
+            path, action = random_legal_move(board, COLOUR_LIST[1])
+            copy = board.create_copy()
+            target = copy
+            for index in path:
+                target = target.children[index]
+            assert action.apply(target, {'colour': COLOUR_LIST[1]})
+            board = copy if random.random() < 0.5 else board
+        board.children = []
+        board.colour = COLOUR_LIST[0]
+        assert random_legal_move(board, COLOUR_LIST[0]) == ((), SMASH)
+
+    def test_random_legal_move_is_uniform(self) -> None:
+        """Test that random_legal_move picks every legal move about equally
+        often."""
+        random.seed(27)
+        board = generate_board(3, 750)
+        moves = list(legal_moves(board, COLOUR_LIST[0]))
+        counts = dict.fromkeys(moves, 0)
+        for _ in range(200 * len(moves)):
+            counts[random_legal_move(board, COLOUR_LIST[0])] += 1
+        assert min(counts.values()) > 120
+        assert max(counts.values()) < 280
+
+
+class TestJournal:
+    """Tests for undoing and redoing moves with a Journal.
+    """
+
+    def test_undo_redo_each_move(self) -> None:
+        """Test that every kind of move can be undone and then redone.
+        """
+        moves = [
+            (lambda board: board.swap(0), board_4x4_swap0()),
+            (lambda board: board.children[0].rotate(1), board_4x4_rotate1()),
+            (lambda board: board.children[0].children[2].paint(
+                COLOUR_LIST[2]), board_4x4_paint()),
+            (lambda board: board.children[0].combine(), board_4x4_combine())
+        ]
+        for move, expected in moves:
+            board = board_4x4()
+            journal = board.start_journal()
+            assert move(board)
+            assert journal.undo()
+            assert board == board_4x4()
+            assert journal.redo()
+            assert board == expected
+            assert not journal.redo()
+
+    def test_undo_smash(self) -> None:
+        """Test that undoing a smash removes the new children, and redoing it
+        restores exactly the same children."""
+        board = board_4x4()
+        journal = board.start_journal()
+        assert board.children[1].smash()
+        smashed = board.create_copy()
+        assert journal.undo()
+        assert board == board_4x4()
+        assert journal.redo()
+        assert board == smashed
+
+    def test_action_apply_records_moves(self) -> None:
+        """Test that each applied action is one move, and that moves are
+        undone in reverse order."""
+        board = board_4x4()
+        journal = board.start_journal()
+        assert SWAP_HORIZONTAL.apply(board, {})
+        assert not COMBINE.apply(board, {})
+        assert PASS.apply(board, {})
+        assert ROTATE_CLOCKWISE.apply(board.children[1], {})
+        assert len(journal) == 3
+
+        while journal.undo():
+            pass
+        assert board == board_4x4()
+
+    def test_undo_after_copy(self) -> None:
+        """Test that a move can still be undone after the board was copied,
+        without changing the copy."""
+        board = board_4x4()
+        journal = board.start_journal()
+        assert board.children[0].children[2].paint(COLOUR_LIST[2])
+        copy = board.create_copy()
+        assert journal.undo()
+        assert board == board_4x4()
+        assert copy == board_4x4_paint()
+        assert copy.journal is None
+
+
+class TestLinearBoard:
+    """Tests that the array-backed board behaves exactly like Block.
+    """
+
+    def test_generate_board_matches_tree(self) -> None:
+        """Test that both backends generate equal boards from the same seed.
+        """
+        random.seed(2024)
+        tree = generate_board(5, 750)
+        random.seed(2024)
+        linear = generate_board(5, 750, linear=True)
+
+        assert isinstance(linear, LinearBlock)
+        assert linear == tree
+        assert _block_to_squares(linear) == _block_to_squares(tree)
+
+    def test_moves_match_tree(self) -> None:
+        """Test that every move has the same effect on both backends.
+        """
+        for move in range(6):
+            tree = board_4x4()
+            linear = from_block(tree)
+            if move == 0:
+                results = (tree.swap(0), linear.swap(0))
+            elif move == 1:
+                results = (tree.swap(1), linear.swap(1))
+            elif move == 2:
+                results = (tree.children[0].rotate(1),
+                           linear.children[0].rotate(1))
+            elif move == 3:
+                results = (tree.rotate(3), linear.rotate(3))
+            elif move == 4:
+                results = (tree.children[0].combine(),
+                           linear.children[0].combine())
+            else:
+                results = (tree.children[0].children[2].paint(COLOUR_LIST[2]),
+                           linear.children[0].children[2].paint(COLOUR_LIST[2]))
+            assert results == (True, True)
+            assert linear == tree
+
+    def test_combine_reuses_slots(self) -> None:
+        """Test that smashing after a combine reuses the released slots.
+        """
+        linear = from_block(board_4x4())
+        slots = len(linear.board.colours)
+        assert linear.children[0].combine()
+        assert linear.children[0].smash()
+        assert len(linear.board.colours) == slots
+
+    def test_create_copy(self) -> None:
+        """Test that a copy is equal but independent of the original.
+        """
+        linear = from_block(board_4x4())
+        copy = linear.children[0].create_copy()
+        assert copy == board_4x4().children[0]
+        assert copy.children[0].paint(COLOUR_LIST[2])
+        assert linear == board_4x4()
+
 
 class TestPlayer:
     """A very small collection of methods for testing the methods and functions in the
@@ -293,6 +1271,36 @@ class TestPlayer:
         assert all_players[2].id == 2
         assert all_players[3].id == 3
 
+    def test_create_mcts_players(self) -> None:
+        """Test that create_players creates MCTSPlayers last."""
+        all_players = create_players(0, 1, [2], [0.5, 1.0])
+        assert [type(player) for player in all_players] == \
+            [RandomPlayer, SmartPlayer, MCTSPlayer, MCTSPlayer]
+        assert [player.id for player in all_players] == [0, 1, 2, 3]
+
+    def test_create_beam_search_players(self) -> None:
+        """Test that create_players creates BeamSearchPlayers last, with the
+        given widths and plies."""
+        all_players = create_players(0, 1, [], [0.5], [(3, 2), (2, 1)])
+        assert [type(player) for player in all_players] == \
+            [RandomPlayer, MCTSPlayer, BeamSearchPlayer, BeamSearchPlayer]
+        assert [player.id for player in all_players] == [0, 1, 2, 3]
+        assert [(player._width, player._plies)
+                for player in all_players[2:]] == [(3, 2), (2, 1)]
+
+    def test_main_state_prepares_player(self) -> None:
+        """Test that the game prepares the player whose turn it is before
+        asking it for a move."""
+        random.seed(38)
+        players = create_players(0, 0, [], [0.5], [(2, 1)])
+        data = GameData(generate_board(2, 750), players)
+        data.max_turns = 3
+        state = MainState(data)
+        assert state.update() is state
+        assert players[0].turns_left == 3
+        players[1].prepare(players, 3)
+        assert players[1].players == players
+
     def test_random_player(self) -> None:
         """Test that RandomPlayer can be created correctly and that
         generate_move returns a move"""
@@ -310,6 +1318,8 @@ class TestPlayer:
 
         Does *not* check whether the move is a good one or not, however.
         """
+        # Ten random moves may not improve the score, so fix which are tried.
+        random.seed(1)
         player = SmartPlayer(0, PerimeterGoal(COLOUR_LIST[3]), 10)
         player._proceed = True
         board = board_4x4()
@@ -318,6 +1328,201 @@ class TestPlayer:
         assert isinstance(move[0], Action)
         assert isinstance(move[1], Block)
 
+    def test_smart_player_move_improves_score(self) -> None:
+        """Test that SmartPlayer leaves the board unchanged and returns a
+        block of the board whose move improves its score."""
+        random.seed(24)
+        for goal_type in [PerimeterGoal, BlobGoal]:
+            for colour in COLOUR_LIST:
+                board = generate_board(4, 750)
+                encoded = board.to_bytes()
+                goal = goal_type(colour)
+                player = SmartPlayer(0, goal, 30)
+                player._proceed = True
+                move = player.generate_move(board)
+                assert board.to_bytes() == encoded
+                if move is None:
+                    continue
+                action, block = move
+                before = goal.score(board)
+                assert action.apply(block, {'colour': colour})
+                if action is not SMASH:
+                    # A smash gives random colours, so it may not repeat.
+                    assert goal.score(board) - action.penalty > before
+
+    def test_score_trials_linear_board(self) -> None:
+        """Test that moves are scored the same on a linear board, which keeps
+        no journal, as on the tree board it was made from, and that neither
+        board is changed."""
+        random.seed(35)
+        board = generate_board(3, 750)
+        linear = from_block(board)
+        trials = [(path, action.short_name,
+                   random.getrandbits(64) if action is SMASH else None)
+                  for path, action in legal_moves(board, COLOUR_LIST[0])]
+        for goal in [PerimeterGoal(COLOUR_LIST[0]), BlobGoal(COLOUR_LIST[0])]:
+            assert _score_trials(linear, goal, trials, False) == \
+                _score_trials(board, goal, trials, False)
+        assert linear == board
+
+    def test_smart_player_executor_matches_serial(self) -> None:
+        """Test that a SmartPlayer whose moves are assessed in worker
+        processes chooses the same moves as one that assesses them itself."""
+        with ProcessPoolExecutor(2) as executor:
+            for seed in range(6):
+                goal_type = [PerimeterGoal, BlobGoal][seed % 2]
+                goal = goal_type(COLOUR_LIST[seed % len(COLOUR_LIST)])
+                random.seed(seed)
+                board = generate_board(3, 750)
+                moves = []
+                # Linear boards are sent to the workers in the same encoding.
+                for pool, start in [(None, board), (executor, board),
+                                    (executor, from_block(board))]:
+                    random.seed(seed)
+                    player = SmartPlayer(0, goal, 20, pool, 2)
+                    player._proceed = True
+                    move = player.generate_move(start)
+                    if move is not None:
+                        move = (move[0], move[1].position, move[1].level)
+                    moves.append(move)
+                assert moves[0] == moves[1] == moves[2]
+
+    def test_smart_player_one_batch_per_worker(self) -> None:
+        """Test that a SmartPlayer splits its moves into one batch for each
+        of its executor's workers, which decode the board once."""
+        class CountingExecutor(ThreadPoolExecutor):
+            """A pool of threads that counts the tasks given to it."""
+            submitted: int = 0
+
+            def submit(self, *args: Any, **kwargs: Any) -> Future:
+                self.submitted += 1
+                return super().submit(*args, **kwargs)
+
+        random.seed(37)
+        board = generate_board(3, 750)
+        with CountingExecutor(3) as executor:
+            player = SmartPlayer(0, BlobGoal(COLOUR_LIST[0]), 20, executor, 3)
+            player._proceed = True
+            player.generate_move(board)
+        assert executor.submitted == 3
+        assert list(_decoded_boards.values()) == [board]
+
+    def test_mcts_player_last_turn_finds_best_move(self) -> None:
+        """Test that on the last turn, MCTSPlayer tries every legal move once,
+        stops before its time limit, and makes the best of them."""
+        random.seed(31)
+        board = generate_board(3, 750)
+        encoded = board.to_bytes()
+        goal = PerimeterGoal(COLOUR_LIST[1])
+        player = MCTSPlayer(0, goal, 60.0)
+        player._proceed = True
+        action, block = player.generate_move(board)
+        assert board.to_bytes() == encoded
+        before = goal.score(board)
+        gains = []
+        for path, move in legal_moves(board, goal.colour):
+            if move is not SMASH:
+                copy = board.create_copy()
+                target = copy
+                for index in path:
+                    target = target.children[index]
+                move.apply(target, {'colour': goal.colour})
+                gains.append(goal.score(copy) - before - move.penalty)
+        assert action.apply(block, {'colour': goal.colour})
+        if action is PASS:
+            assert max(gains) <= 0
+        elif action is not SMASH:
+            assert goal.score(board) - before - action.penalty == max(gains)
+
+    def test_mcts_player_searches_until_deadline(self) -> None:
+        """Test that MCTSPlayer plays out several turns within its time limit
+        and returns a valid move without changing the board."""
+        random.seed(32)
+        board = generate_board(3, 750)
+        encoded = board.to_bytes()
+        player = MCTSPlayer(0, BlobGoal(COLOUR_LIST[2]), 0.2)
+        player._proceed = True
+        player.prepare([player], 4)
+        start = time.perf_counter()
+        action, block = player.generate_move(board)
+        assert time.perf_counter() - start < 2.0
+        assert board.to_bytes() == encoded
+        assert action.apply(block, {'colour': COLOUR_LIST[2]})
+        assert player.generate_move(board) is None
+
+    def test_mcts_player_linear_board(self) -> None:
+        """Test that MCTSPlayer searches a linear board, which keeps no
+        journal, without changing it, and returns a valid move."""
+        random.seed(35)
+        board = generate_board(3, 750)
+        linear = from_block(board)
+        player = MCTSPlayer(0, BlobGoal(COLOUR_LIST[1]), 0.2)
+        player._proceed = True
+        player.prepare([player], 3)
+        action, block = player.generate_move(linear)
+        assert linear == board
+        assert action.apply(block, {'colour': COLOUR_LIST[1]})
+
+    def test_beam_search_player_one_ply_finds_best_move(self) -> None:
+        """Test that BeamSearchPlayer, alone and searching one ply, makes the
+        best of the legal moves that are not smashes."""
+        random.seed(33)
+        board = generate_board(3, 750)
+        goal = BlobGoal(COLOUR_LIST[0])
+        before = goal.score(board)
+        gains = [0]
+        for path, move in legal_moves(board, goal.colour):
+            if move is not SMASH:
+                copy = board.create_copy()
+                target = copy
+                for index in path:
+                    target = target.children[index]
+                move.apply(target, {'colour': goal.colour})
+                gains.append(goal.score(copy) - before - move.penalty)
+        player = BeamSearchPlayer(0, goal, 4, 1)
+        player._proceed = True
+        action, block = player.generate_move(board)
+        assert action.apply(block, {'colour': goal.colour})
+        if action is not SMASH:
+            assert goal.score(board) - before - action.penalty == max(gains)
+
+    def test_beam_search_player_with_opponents(self) -> None:
+        """Test that BeamSearchPlayer searches through its opponents' moves
+        without changing the board, and returns a valid move."""
+        random.seed(34)
+        board = generate_board(3, 750)
+        encoded = board.to_bytes()
+        players = [RandomPlayer(0, PerimeterGoal(COLOUR_LIST[1])),
+                   BeamSearchPlayer(1, PerimeterGoal(COLOUR_LIST[2]), 3, 4),
+                   SmartPlayer(2, BlobGoal(COLOUR_LIST[3]), 5)]
+        player = players[1]
+        player.prepare(players, 1)
+        player._proceed = True
+        action, block = player.generate_move(board)
+        assert board.to_bytes() == encoded
+        assert action.apply(block, {'colour': COLOUR_LIST[2]})
+        assert player.generate_move(board) is None
+
+    def test_beam_search_player_linear_board(self) -> None:
+        """Test that BeamSearchPlayer chooses the same move on a linear board
+        as on the tree board it was made from, without changing either."""
+        random.seed(36)
+        board = generate_board(3, 750)
+        linear = from_block(board)
+        moves = []
+        for start in [board, linear]:
+            random.seed(36)
+            players = [BeamSearchPlayer(0, PerimeterGoal(COLOUR_LIST[0]), 3,
+                                        2),
+                       RandomPlayer(1, BlobGoal(COLOUR_LIST[1]))]
+            player = players[0]
+            player.prepare(players, 1)
+            player._proceed = True
+            action, block = player.generate_move(start)
+            moves.append((action, block.position, block.level))
+        assert moves[0] == moves[1]
+        assert linear == board
+
 
 class TestGoal:
     """A very small collection of methods for testing the sub-classes of Goal.
@@ -392,6 +1597,22 @@ class TestGoal:
             goal = PerimeterGoal(colour)
             assert goal.score(board) == expected
 
+    def test_perimeter_goal_matches_flatten(self) -> None:
+        """Test that the perimeter goal, which scores from the tree, agrees
+        with counting the edge cells of the flattened board, on both
+        backends."""
+        random.seed(12)
+        for depth in range(6):
+            board = generate_board(depth, 750)
+            cells = flatten(board)
+            for colour in COLOUR_LIST:
+                expected = sum(column[0] == colour for column in cells) \
+                    + sum(column[-1] == colour for column in cells) \
+                    + cells[0].count(colour) + cells[-1].count(colour)
+                assert PerimeterGoal(colour).score(board) == expected
+                assert PerimeterGoal(colour).score(from_block(board)) == \
+                    expected
+
     def test_perimeter_goal_one_unit_cell(self):
         """Test that the perimeter goal score for each colour of a 1x1 board
         is correct.
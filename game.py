@@ -24,14 +24,25 @@ class Game:
     def __init__(self, max_depth: int,
                  num_human: int,
                  num_random: int,
-                 smart_players: list[int]) -> None:
+                 smart_players: list[int],
+                 linear: bool = False,
+                 mcts_players: list[float] | None = None,
+                 beam_players: list[tuple[int, int]] | None = None) -> None:
         """Initialize this game, as described in the Assignment 2 handout.
 
+        <mcts_players> is a list of the number of seconds each MCTSPlayer may
+        think about a move. <beam_players> is a list of the width and the
+        number of plies of each BeamSearchPlayer.
+
+        If <linear> is True, the board is stored by the array-backed engine in
+        linear_board, which is better suited to deep boards.
+
         Preconditions:
         - 2 <= max_depth <= 5
         """
-        board = generate_board(max_depth, BOARD_SIZE)
-        players = create_players(num_human, num_random, smart_players)
+        board = generate_board(max_depth, BOARD_SIZE, linear)
+        players = create_players(num_human, num_random, smart_players,
+                                 mcts_players, beam_players)
 
         self._renderer = Renderer(BOARD_SIZE)
         self._data = GameData(board, players)
@@ -1,8 +1,17 @@
 from __future__ import annotations
 import math
 import random
+from collections import OrderedDict
+from typing import Any
 from block import Block
-from settings import colour_name, COLOUR_LIST
+from actions import Action, ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, \
+    SWAP_HORIZONTAL, SWAP_VERTICAL, PASS
+from blob import blob_sizes, blob_sizes_by_colour, largest_blobs
+from raster import NUMPY_AVAILABLE, new_raster, stack_rasters
+from settings import colour_name, COLOUR_LIST, PALETTE
+
+# The number of scores that a ScoreCache holds unless it is told otherwise.
+DEFAULT_SCORE_CACHE_SIZE = 4096
 
 
 def generate_goals(num_goals: int) -> list[Goal]:
@@ -43,23 +52,60 @@ def flatten(block: Block) -> list[list[tuple[int, int, int]]]:
     of the block at the cell location[i][j].
 
     L[0][0] represents the unit cell in the upper left corner of the Block.
+
+    A new list is built on every call. flatten_array gives the unit cells as
+    an array, without building lists of colours, and Block.raster gives a
+    view of the raster that a board keeps in step with its moves.
+    """
+    if NUMPY_AVAILABLE:
+        cells = flatten_array(block).tolist()
+    else:
+        cells = _flatten_list(block)
+    colours = PALETTE.colours
+    return [[colours[cell] for cell in column] for column in cells]
+
+
+def flatten_array(block: Block) -> Any:
+    """Return a new NumPy array representing <block> as columns and rows of
+    unit cells, indexed like the list returned by flatten: A[i, j] is the unit
+    cell at column i and row j.
+
+    Each unit cell is represented by the index of its colour in
+    settings.PALETTE. The array is filled by writing the square of every leaf
+    into it, rather than by joining lists.
+
+    Precondition:
+    - NUMPY_AVAILABLE
+
+    >>> board = Block((0, 0), 750, COLOUR_LIST[2], 0, 1)
+    >>> flatten_array(board).tolist()
+    [[2, 2], [2, 2]]
     """
-    if block.colour is not None and block.level <= block.max_depth:
+    return new_raster(block)
+
+
+def _flatten_list(block: Block) -> list[list[int]]:
+    """Return <block> as rows and columns of unit cells, like flatten, but
+    with each unit cell represented by the index of its colour in
+    settings.PALETTE.
+    """
+    if block.colour_index is not None and block.level <= block.max_depth:
         unit_cells = []
         i = 0
         rows_columns = 2**(block.max_depth - block.level)
         while len(unit_cells) < rows_columns:
-            unit_cells.append([block.colour])
+            unit_cells.append([block.colour_index])
             while len(unit_cells[i]) < rows_columns:
-                unit_cells[i].append(block.colour)
+                unit_cells[i].append(block.colour_index)
             i += 1
         return unit_cells
     else:
         flattened = []
-        top_left = flatten(block.children[1])
-        bottom_left = flatten(block.children[2])
-        top_right = flatten(block.children[0])
-        bottom_right = flatten(block.children[3])
+        children = block.view_children()
+        top_left = _flatten_list(children[1])
+        bottom_left = _flatten_list(children[2])
+        top_right = _flatten_list(children[0])
+        bottom_right = _flatten_list(children[3])
 
         rows_cols = 2**(block.max_depth - block.level)
 
@@ -73,6 +119,94 @@ def flatten(block: Block) -> list[list[tuple[int, int, int]]]:
         return flattened
 
 
+# Bit flags for the edges of a Block.
+_TOP, _BOTTOM, _LEFT, _RIGHT = 1, 2, 4, 8
+_ALL_EDGES = _TOP | _BOTTOM | _LEFT | _RIGHT
+# The edges of a Block that each of its children lies along, in the order of
+# Block.children.
+_CHILD_EDGES = (_TOP | _RIGHT, _TOP | _LEFT, _BOTTOM | _LEFT, _BOTTOM | _RIGHT)
+
+
+def _perimeter_counts(board: Block) -> dict[int, int]:
+    """Return a dictionary mapping the index in settings.PALETTE of each
+    colour on the perimeter of <board> to the number of unit cells of that
+    colour along it, counting corner cells twice.
+
+    For a Block, the counts are read from those that it caches along its
+    four edges. For any other board, they are worked out from the tree,
+    without flattening it: each leaf adds its width in unit cells once for
+    every edge of the board that it lies along. Only Blocks that lie along an
+    edge are visited.
+    """
+    counts = {}
+    if isinstance(board, Block):
+        for edge in board.edge_counts():
+            for colour, count in edge.items():
+                counts[colour] = counts.get(colour, 0) + count
+        return counts
+    # Each entry is a Block and the flags of the edges of the board that it
+    # lies along.
+    pending = [(board, _ALL_EDGES)]
+    while pending:
+        block, edges = pending.pop()
+        children = block.view_children()
+        if len(children) == 0:
+            width = 2 ** (block.max_depth - block.level)
+            counts[block.colour_index] = counts.get(block.colour_index, 0) \
+                + width * bin(edges).count('1')
+        else:
+            for child, child_edges in zip(children, _CHILD_EDGES):
+                if edges & child_edges:
+                    pending.append((child, edges & child_edges))
+    return counts
+
+
+def score_goals(board: Block, goals: list[Goal],
+                cache: ScoreCache | None = None) -> list[int]:
+    """Return the score of each of <goals> on <board>, in the same order.
+
+    The board is traversed at most once for all the PerimeterGoals and once
+    for all the BlobGoals, however many there are. Any other goal is scored
+    on its own. If a <cache> is given, only the goals whose scores it does
+    not hold are scored, and their scores are added to it.
+
+    >>> board = Block((0, 0), 750, COLOUR_LIST[1], 0, 1)
+    >>> score_goals(board, [PerimeterGoal(COLOUR_LIST[1]),
+    ...                     BlobGoal(COLOUR_LIST[1]),
+    ...                     BlobGoal(COLOUR_LIST[2])])
+    [8, 4, 0]
+    """
+    if cache is not None:
+        keys = [cache.key(goal, board) for goal in goals]
+        scores = [cache.lookup(key) for key in keys]
+        missing = [i for i in range(len(goals)) if scores[i] is None]
+        if missing:
+            found = score_goals(board, [goals[i] for i in missing])
+            for i, score in zip(missing, found):
+                scores[i] = score
+                cache.store(keys[i], score)
+        return scores
+
+    perimeter = None
+    blob_colours = {PALETTE.index(goal.colour) for goal in goals
+                    if isinstance(goal, BlobGoal)}
+    blobs = None
+    scores = []
+    for goal in goals:
+        target = PALETTE.index(goal.colour)
+        if isinstance(goal, PerimeterGoal):
+            if perimeter is None:
+                perimeter = _perimeter_counts(board)
+            scores.append(perimeter.get(target, 0))
+        elif isinstance(goal, BlobGoal):
+            if blobs is None:
+                blobs = blob_sizes_by_colour(board, blob_colours)
+            scores.append(max(blobs.get(target, []), default=0))
+        else:
+            scores.append(goal.score(board))
+    return scores
+
+
 class Goal:
     """A player goal in the game of Blocky.
 
@@ -96,6 +230,30 @@ class Goal:
         """
         raise NotImplementedError
 
+    def score_many(self, rasters: Any) -> list[int]:
+        """Return the score for this goal on each of the k boards whose
+        rasters are stacked in <rasters>, an array of shape (k, n, n) as
+        returned by raster.stack_rasters, in order.
+
+        Precondition:
+        - NUMPY_AVAILABLE
+        """
+        raise NotImplementedError
+
+    def upper_bound(self, board: Block, block: Block, action: Action) -> int:
+        """Return a number that is at least the score for this goal on
+        <board> after <action> is applied to <block>, minus the penalty of
+        <action>, however the action turns out.
+
+        The bound is found without applying <action>, much more cheaply than
+        scoring the board, so that a search can skip moves that cannot beat
+        the best move found so far.
+
+        Preconditions:
+        - <board> is the root of its board, and <block> is part of it.
+        """
+        raise NotImplementedError
+
     def description(self) -> str:
         """Return a description of this goal.
         """
@@ -118,29 +276,82 @@ class PerimeterGoal(Goal):
         The score for a PerimeterGoal is defined to be the number of unit cells
         on the perimeter whose colour is this goal's target colour. Corner cells
         count twice toward the score.
-        """
-        score = 0
-        f = flatten(board)
 
-        for i in range(len(f)):
-
-            top_col = f[i][0]
-            bot_col = f[i][len(f) - 1]
+        The score is read from the perimeter counts of every colour, as
+        found by _perimeter_counts.
+        """
+        return _perimeter_counts(board).get(PALETTE.index(self.colour), 0)
 
-            if top_col == self.colour:
-                score += 1
-            if bot_col == self.colour:
-                score += 1
+    def score_many(self, rasters: Any) -> list[int]:
+        """Return the score for this goal on each of the k boards whose
+        rasters are stacked in <rasters>, an array of shape (k, n, n) as
+        returned by raster.stack_rasters, in order.
 
-            left_col = f[0][i]
-            right_col = f[len(f) - 1][i]
+        The cells of the target colour on the four edges of every board are
+        counted at once.
 
-            if left_col == self.colour:
-                score += 1
-            if right_col == self.colour:
-                score += 1
+        Precondition:
+        - NUMPY_AVAILABLE
 
-        return score
+        >>> boards = [Block((0, 0), 750, colour, 0, 1)
+        ...           for colour in COLOUR_LIST[:2]]
+        >>> PerimeterGoal(COLOUR_LIST[1]).score_many(stack_rasters(boards))
+        [0, 8]
+        """
+        mask = rasters == PALETTE.index(self.colour)
+        scores = mask[:, 0, :].sum(axis=1) + mask[:, -1, :].sum(axis=1) \
+            + mask[:, :, 0].sum(axis=1) + mask[:, :, -1].sum(axis=1)
+        return scores.tolist()
+
+    def upper_bound(self, board: Block, block: Block, action: Action) -> int:
+        """Return a number that is at least the score for this goal on
+        <board> after <action> is applied to <block>, minus the penalty of
+        <action>, however the action turns out.
+
+        Only the cells of <block> that lie on the perimeter of <board> can
+        change. A rotation only moves <block>'s edges, so its effect is found
+        exactly from their colour counts. A swap keeps the colours along two
+        of <block>'s edges, and any other action may at most fill the cells
+        of <block> on the perimeter with the target colour.
+
+        Preconditions:
+        - <board> is the root of its board, and <block> is part of it.
+
+        >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> goal = PerimeterGoal(COLOUR_LIST[1])
+        >>> goal.upper_bound(board, board, ROTATE_CLOCKWISE)
+        0
+        >>> from actions import SMASH
+        >>> goal.upper_bound(board, board, SMASH)
+        6
+        """
+        target = PALETTE.index(self.colour)
+        width = 2 ** (board.max_depth - board.level)
+        x, y, n = block.cells()
+        # The edges of <block>, in the order of Block.edge_counts, that lie
+        # on the perimeter of <board>.
+        outer = [e for e, on_perimeter in enumerate(
+            [y == 0, x + n == width, y + n == width, x == 0]) if on_perimeter]
+        if not outer:
+            return self.score(board) - action.penalty
+        edges = block.edge_counts()
+        before = sum(edges[e].get(target, 0) for e in outer)
+        if action is ROTATE_CLOCKWISE or action is ROTATE_COUNTER_CLOCKWISE:
+            turns = 1 if action is ROTATE_CLOCKWISE else 3
+            # Rotating clockwise moves the left edge to the top.
+            after = sum(edges[(e - turns) % 4].get(target, 0) for e in outer)
+        elif action is SWAP_HORIZONTAL or action is SWAP_VERTICAL:
+            # A horizontal swap keeps the colours along the top and bottom
+            # edges, and a vertical swap those along the left and right.
+            kept = (0, 2) if action is SWAP_HORIZONTAL else (1, 3)
+            inside = block.colour_counts().get(target, 0)
+            after = sum(edges[e].get(target, 0) if e in kept
+                        else min(n, inside) for e in outer)
+        elif action is PASS:
+            after = before
+        else:
+            after = n * len(outer)
+        return self.score(board) - before + after - action.penalty
 
     def description(self) -> str:
         """Return a description of this goal.
@@ -164,22 +375,59 @@ class BlobGoal(Goal):
 
         The score for a BlobGoal is defined to be the total number of
         unit cells in the largest connected blob within this Block.
+
+        The blobs are found by joining adjacent leaves of the target colour,
+        so the cost grows with the number of leaves rather than unit cells.
         """
-        max_blob = 0
-        flat = flatten(board)
+        return max(blob_sizes(board, PALETTE.index(self.colour)), default=0)
+
+    def score_many(self, rasters: Any) -> list[int]:
+        """Return the score for this goal on each of the k boards whose
+        rasters are stacked in <rasters>, an array of shape (k, n, n) as
+        returned by raster.stack_rasters, in order.
 
-        visited = []
-        for column in range(len(flat)):
-            visited.append([])
-            for cell in range(column):
-                visited[column].append(-1)
+        The blobs of all the boards are labelled together, as described in
+        blob.largest_blobs.
 
-        for i in range(board.size):
-            for j in range(board.size):
-                new_blob = self._undiscovered_blob_size((i, j), flat, visited)
-                max_blob = max(max_blob, new_blob)
+        Precondition:
+        - NUMPY_AVAILABLE
 
-        return max_blob
+        >>> boards = [Block((0, 0), 750, colour, 0, 1)
+        ...           for colour in COLOUR_LIST[:2]]
+        >>> BlobGoal(COLOUR_LIST[0]).score_many(stack_rasters(boards))
+        [4, 0]
+        """
+        return largest_blobs(rasters, PALETTE.index(self.colour)).tolist()
+
+    def upper_bound(self, board: Block, block: Block, action: Action) -> int:
+        """Return a number that is at least the score for this goal on
+        <board> after <action> is applied to <block>, minus the penalty of
+        <action>, however the action turns out.
+
+        No blob can be larger than all the cells of the target colour, and
+        only the cells of <block> can change: rotations and swaps keep their
+        colours, and any other action may at most give them all the target
+        colour.
+
+        Preconditions:
+        - <board> is the root of its board, and <block> is part of it.
+
+        >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> goal = BlobGoal(COLOUR_LIST[1])
+        >>> goal.upper_bound(board, board, SWAP_VERTICAL)
+        0
+        >>> from actions import SMASH
+        >>> goal.upper_bound(board, board, SMASH)
+        2
+        """
+        target = PALETTE.index(self.colour)
+        total = board.colour_counts().get(target, 0)
+        if not (action is ROTATE_CLOCKWISE or action is ROTATE_COUNTER_CLOCKWISE
+                or action is SWAP_HORIZONTAL or action is SWAP_VERTICAL
+                or action is PASS):
+            inside = block.colour_counts().get(target, 0)
+            total += 4 ** (block.max_depth - block.level) - inside
+        return total - action.penalty
 
     def _undiscovered_blob_size(self, pos: tuple[int, int],
                                 board: list[list[tuple[int, int, int]]],
@@ -202,40 +450,141 @@ class BlobGoal(Goal):
 
         If <pos> is out of bounds for <board>, return 0.
         """
-        col = pos[0]
-        row = pos[1]
+        # The cells still to be visited, kept on a stack rather than in
+        # recursive calls so that large blobs do not exceed the recursion
+        # limit.
+        pending = [pos]
+        size = 0
+        while pending:
+            col, row = pending.pop()
+            if not (0 <= col < len(board) and 0 <= row < len(board[col])):
+                # out of bounds
+                continue
+            if visited[col][row] != -1:  # already visited
+                continue
+            elif board[col][row] != self.colour:  # not the target colour
+                visited[col][row] = 0
+            else:  # unvisited with target colour
+                visited[col][row] = 1
+                size += 1
+                # Visit the cells up, down, left and right of this one
+                pending.append((col, row - 1))
+                pending.append((col, row + 1))
+                pending.append((col - 1, row))
+                pending.append((col + 1, row))
+
+        return size
 
-        try:
-            cell = board[col][row]
-            vis = visited[col][row]
-        except IndexError:
-            # out of bounds
-            return 0
+    def description(self) -> str:
+        """Return a description of this goal.
+        """
+        return (f'Goal: Create the largest blob of {colour_name(self.colour)} '
+                f'anywhere within this block.')
 
-        if vis != -1:  # already visited
-            return 0
-        elif cell != self.colour:  # unvisited but not target colour
-            visited[pos[0]][pos[1]] = 0
-            return 0
-        else:  # unvisited with target colour
-            visited[pos[0]][pos[1]] = 1
-            max_blob = 1
 
-            # Recursively find connected blobs up, down, left, right of pos
-            u = self._undiscovered_blob_size((pos[0], pos[1]-1), board, visited)
-            d = self._undiscovered_blob_size((pos[0], pos[1]+1), board, visited)
-            l = self._undiscovered_blob_size((pos[0]-1, pos[1]), board, visited)
-            r = self._undiscovered_blob_size((pos[0]+1, pos[1]), board, visited)
+class ScoreCache:
+    """A cache of the scores of goals on boards, which holds at most a fixed
+    number of scores and forgets the least recently used score first.
 
-            max_blob += u + d + l + r
+    Scores are looked up by the structural hash of the board, the level and
+    maximum depth of the board, and the type and colour of the goal, so equal
+    boards share their scores, wherever they are.
 
-            return max_blob
+    Instance Attributes:
+    - max_size: The greatest number of scores this cache holds.
+    - hits: The number of scores looked up and found in this cache.
+    - misses: The number of scores looked up and not found in this cache.
 
-    def description(self) -> str:
-        """Return a description of this goal.
+    Private Instance Attributes:
+    - _scores: The scores held, keyed as returned by key, from the least to
+               the most recently used.
+
+    Representation Invariants:
+    - self.max_size >= 0
+    - len(self._scores) <= self.max_size
+    """
+    max_size: int
+    hits: int
+    misses: int
+    _scores: OrderedDict[tuple, int]
+
+    def __init__(self, max_size: int = DEFAULT_SCORE_CACHE_SIZE) -> None:
+        """Initialize an empty cache that holds at most <max_size> scores.
+
+        Preconditions:
+        - max_size >= 0
         """
-        return (f'Goal: Create the largest blob of {colour_name(self.colour)} '
-                f'anywhere within this block.')
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of scores held in this cache.
+        """
+        return len(self._scores)
+
+    def score(self, goal: Goal, board: Block) -> int:
+        """Return the score of <goal> on <board>, from this cache if it holds
+        it, and otherwise by scoring it and adding its score to this cache.
+
+        >>> cache = ScoreCache(2)
+        >>> board = Block((0, 0), 750, COLOUR_LIST[1], 0, 1)
+        >>> cache.score(PerimeterGoal(COLOUR_LIST[1]), board)
+        8
+        >>> cache.score(PerimeterGoal(COLOUR_LIST[1]), board.create_copy())
+        8
+        >>> cache.hits, cache.misses
+        (1, 1)
+        """
+        key = self.key(goal, board)
+        score = self.lookup(key)
+        if score is None:
+            score = goal.score(board)
+            self.store(key, score)
+        return score
+
+    def key(self, goal: Goal, board: Block) -> tuple:
+        """Return the key under which the score of <goal> on <board> is held.
+        """
+        return (board.structural_hash(), board.level, board.max_depth,
+                type(goal), goal.colour)
+
+    def lookup(self, key: tuple) -> int | None:
+        """Return the score held under <key>, marking it as the most recently
+        used, or None if this cache does not hold it. Count the lookup as a
+        hit or a miss.
+        """
+        score = self._scores.get(key)
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._scores.move_to_end(key)
+        return score
+
+    def store(self, key: tuple, score: int) -> None:
+        """Hold <score> under <key>, forgetting the least recently used score
+        if this cache is full.
+        """
+        if self.max_size == 0:
+            return
+        self._scores[key] = score
+        self._scores.move_to_end(key)
+        if len(self._scores) > self.max_size:
+            self._scores.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forget every score held in this cache, and reset its hit and miss
+        counts.
+        """
+        self._scores.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# The cache of scores shared by the game and the computer players.
+SCORE_CACHE = ScoreCache()
 
 
 if __name__ == '__main__':
@@ -244,7 +593,8 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'block', 'settings',
-            'math', '__future__'
+            'math', '__future__', 'raster', 'blob',
+            'collections', 'actions'
         ],
         'max-attributes': 15
     })
@@ -0,0 +1,712 @@
+from __future__ import annotations
+import random
+import math
+from array import array
+from typing import Any, Callable
+
+from settings import colour_name, COLOUR_LIST, MAX_PALETTE_SIZE, PALETTE
+from block import Block, ROT_CW, ROT_CCW, SWAP_HORZ, SWAP_VERT, \
+    _encode, _leaf_hash, _placed_hash, _same_tree
+from raster import _CHILD_OFFSETS, NUMPY_AVAILABLE, new_raster
+
+# The new order of a node's four child slots after each structural move:
+# after the move, child slot i holds what was in child slot order[i].
+_ROTATIONS = {
+    ROT_CW: (1, 2, 3, 0),
+    ROT_CCW: (3, 0, 1, 2)
+}
+_SWAPS = {
+    SWAP_HORZ: (1, 0, 3, 2),
+    SWAP_VERT: (3, 2, 1, 0)
+}
+
+# The child slots of a node that lie along each of its edges, in the order of
+# Block.edge_counts: top, right, bottom and left.
+_EDGE_CHILDREN = ((0, 1), (0, 3), (2, 3), (1, 2))
+
+# The colour index stored for a node that is subdivided. No colour in
+# settings.PALETTE has this index.
+NO_COLOUR = MAX_PALETTE_SIZE
+# The first-child offset stored for a node that is a leaf.
+NO_CHILDREN = -1
+
+
+def generate_linear_board(max_depth: int, size: int) -> LinearBlock:
+    """Return the root of a new array-backed game board with a depth of
+    <max_depth> and dimensions of <size> by <size>.
+
+    The board is generated with exactly the same sequence of random choices as
+    block.generate_board, so both backends produce equal boards from the same
+    random seed.
+
+    >>> board = generate_linear_board(3, 750)
+    >>> board.max_depth
+    3
+    >>> board.size
+    750
+    >>> len(board.children) == 4
+    True
+    """
+    board = LinearBoard((0, 0), size, random.choice(COLOUR_LIST), 0,
+                        max_depth)
+    root = board.root()
+    root.smash()
+
+    return root
+
+
+def from_block(block: Block) -> LinearBlock:
+    """Return the root of a new array-backed board that is equal to <block>,
+    which may use either backend.
+
+    >>> board = generate_linear_board(3, 750)
+    >>> from_block(board) == board
+    True
+    """
+    board = LinearBoard(block.position, block.size, block.colour,
+                        block.level, block.max_depth)
+    pending = [(block, 0)]
+    while pending:
+        source, target = pending.pop()
+        children = source.view_children()
+        if len(children) > 0:
+            first = board._allocate(source.level + 1)
+            board.colours[target] = NO_COLOUR
+            board.firsts[target] = first
+            for k, child in enumerate(children):
+                board.colours[first + k] = board.colour_index(child.colour)
+                pending.append((child, first + k))
+    return board.root()
+
+
+class LinearBoard:
+    """A Blocky board whose whole tree is stored in flat typed arrays.
+
+    Every node of the tree occupies one slot of each array. Slot 0 is always
+    the root. The four children of a node always occupy four consecutive
+    slots, stored in the same order as Block.children (upper-right,
+    upper-left, lower-left, lower-right), so moving a child within its parent
+    moves its entire subtree along with it.
+
+    Nodes are read and changed through LinearBlock handles, which offer the
+    same interface as block.Block.
+
+    Attributes
+    - position: The (x, y) coordinates of the upper left corner of the root.
+    - size: The height and width of the root.
+    - max_depth: The deepest level allowed in the overall block structure.
+    - colours: For each slot, the index of its colour in settings.PALETTE,
+               or NO_COLOUR if the node is subdivided.
+    - levels: For each slot, the level of its node.
+    - firsts: For each slot, the slot of its node's first child, or
+              NO_CHILDREN if the node is a leaf.
+
+    Private Attributes
+    - _free: The first slots of groups of four slots that were released by
+             combine and can be reused by smash.
+
+    Representation Invariants:
+    - len(self.colours) == len(self.levels) == len(self.firsts)
+    - self.colours[i] == NO_COLOUR iff self.firsts[i] != NO_CHILDREN
+    - If self.firsts[i] != NO_CHILDREN, then for 0 <= k < 4:
+        self.levels[self.firsts[i] + k] == self.levels[i] + 1
+    """
+    position: tuple[int, int]
+    size: int
+    max_depth: int
+    colours: array
+    levels: array
+    firsts: array
+    _free: list[int]
+
+    def __init__(self, position: tuple[int, int], size: int,
+                 colour: tuple[int, int, int] | None, level: int,
+                 max_depth: int) -> None:
+        """Initialize this board with a single undivided root of the given
+        <colour> at <level>, with its upper left corner at <position> and
+        dimensions <size> by <size>.
+
+        Preconditions:
+        - position[0] >= 0 and position[1] >= 0
+        - size > 0
+        - level >= 0
+        - max_depth >= level
+        """
+        self.position = position
+        self.size = size
+        self.max_depth = max_depth
+        self.colours = array('B', [self.colour_index(colour)])
+        self.levels = array('B', [level])
+        self.firsts = array('l', [NO_CHILDREN])
+        self._free = []
+
+    def root(self) -> LinearBlock:
+        """Return a handle on the root of this board.
+        """
+        return LinearBlock(self, 0, self.position, self.size, ())
+
+    def colour_index(self, colour: tuple[int, int, int] | None) -> int:
+        """Return the index of <colour> in settings.PALETTE, adding it to the
+        palette if necessary. Return NO_COLOUR if <colour> is None.
+        """
+        if colour is None:
+            return NO_COLOUR
+        return PALETTE.index(colour)
+
+    def _allocate(self, level: int) -> int:
+        """Return the first of four consecutive free slots for leaves at
+        <level>, growing the arrays if no released slots can be reused.
+        """
+        if self._free:
+            first = self._free.pop()
+            for k in range(4):
+                self.levels[first + k] = level
+                self.firsts[first + k] = NO_CHILDREN
+            return first
+        first = len(self.colours)
+        self.colours.extend([NO_COLOUR] * 4)
+        self.levels.extend([level] * 4)
+        self.firsts.extend([NO_CHILDREN] * 4)
+        return first
+
+    def _smash(self, slot: int) -> None:
+        """Subdivide the leaf at <slot> into four randomly coloured children,
+        each of which may itself be smashed, following the same random
+        procedure as Block.smash.
+        """
+        level = self.levels[slot] + 1
+        first = self._allocate(level)
+        # The colours of COLOUR_LIST have the palette indices 0 to 3.
+        colours = range(len(COLOUR_LIST))
+        for k in range(4):
+            self.colours[first + k] = random.choice(colours)
+        self.colours[slot] = NO_COLOUR
+        self.firsts[slot] = first
+
+        for k in range(4):
+            if random.random() < math.exp(-0.25 * level) \
+                    and level != self.max_depth:
+                self._smash(first + k)
+
+    def _permute(self, slot: int, order: tuple[int, int, int, int]) -> None:
+        """Reorder the children of the node at <slot> so that child i ends up
+        holding what child <order>[i] held before.
+        """
+        first = self.firsts[slot]
+        colours = [self.colours[first + k] for k in order]
+        firsts = [self.firsts[first + k] for k in order]
+        for k in range(4):
+            self.colours[first + k] = colours[k]
+            self.firsts[first + k] = firsts[k]
+
+    def _rotate(self, slot: int, direction: int) -> None:
+        """Rotate the node at <slot> and all its descendants in <direction>.
+        """
+        stack = [slot]
+        order = _ROTATIONS[direction]
+        while stack:
+            current = stack.pop()
+            if self.firsts[current] != NO_CHILDREN:
+                self._permute(current, order)
+                first = self.firsts[current]
+                stack.extend(range(first, first + 4))
+
+    def _combine(self, slot: int, colour: int) -> None:
+        """Turn the node at <slot>, whose children are all leaves, into a leaf
+        of colour index <colour>, releasing its children's slots.
+        """
+        self._free.append(self.firsts[slot])
+        self.firsts[slot] = NO_CHILDREN
+        self.colours[slot] = colour
+
+    def _copy_subtree(self, slot: int, position: tuple[int, int],
+                      size: int) -> LinearBoard:
+        """Return a new board holding a copy of the subtree rooted at <slot>,
+        with its root at <position> and dimensions <size> by <size>.
+        """
+        board = LinearBoard(position, size, None, self.levels[slot],
+                            self.max_depth)
+        if slot == 0 and not self._free:
+            # The whole board is in use, so the arrays can be copied as is.
+            board.colours = array('B', self.colours)
+            board.levels = array('B', self.levels)
+            board.firsts = array('l', self.firsts)
+            return board
+
+        board.colours[0] = self.colours[slot]
+        pending = [(slot, 0)]
+        while pending:
+            source, target = pending.pop()
+            if self.firsts[source] != NO_CHILDREN:
+                first = board._allocate(self.levels[source] + 1)
+                board.firsts[target] = first
+                for k in range(4):
+                    board.colours[first + k] = \
+                        self.colours[self.firsts[source] + k]
+                    pending.append((self.firsts[source] + k, first + k))
+        return board
+
+
+class LinearBlock:
+    """A handle on one node of a LinearBoard.
+
+    A LinearBlock offers the same interface as block.Block, so the rest of the
+    game can use either backend. Handles are cheap and created on demand:
+    two handles on the same slot of the same board describe the same Block.
+
+    Because a handle refers to a slot, not to the contents of that slot,
+    after its parent is swapped or rotated a handle describes the Block that
+    was moved into its place.
+
+    Attributes
+    - board: The board this handle refers into.
+    - index: The slot of this handle's node in <board>.
+    - position: The (x, y) coordinates of the upper left corner of this Block.
+    - size: The height and width of this square Block.
+
+    Private Attributes
+    - _path: The indices of the children leading from the root of <board> to
+             this handle's node.
+    """
+    __slots__ = ('board', 'index', 'position', 'size', '_path')
+    board: LinearBoard
+    index: int
+    position: tuple[int, int]
+    size: int
+    _path: tuple[int, ...]
+
+    def __init__(self, board: LinearBoard, index: int,
+                 position: tuple[int, int], size: int,
+                 path: tuple[int, ...]) -> None:
+        """Initialize this handle on slot <index> of <board>, describing a
+        Block with its upper left corner at <position> and dimensions <size>
+        by <size>, reached from the root of <board> by <path>.
+        """
+        self.board = board
+        self.index = index
+        self.position = position
+        self.size = size
+        self._path = path
+
+    @property
+    def colour(self) -> tuple[int, int, int] | None:
+        """The colour of this Block, or None if it is subdivided.
+        """
+        index = self.board.colours[self.index]
+        if index == NO_COLOUR:
+            return None
+        return PALETTE.colours[index]
+
+    @property
+    def colour_index(self) -> int | None:
+        """The index of this Block's colour in settings.PALETTE, or None if it
+        is subdivided.
+        """
+        index = self.board.colours[self.index]
+        if index == NO_COLOUR:
+            return None
+        return index
+
+    @property
+    def level(self) -> int:
+        """The level of this Block within the overall block structure.
+        """
+        return self.board.levels[self.index]
+
+    @property
+    def max_depth(self) -> int:
+        """The deepest level allowed in the overall block structure.
+        """
+        return self.board.max_depth
+
+    @property
+    def children(self) -> list[LinearBlock]:
+        """Handles on the four children of this Block, in the same order as
+        Block.children, or an empty list if this Block is a leaf.
+        """
+        first = self.board.firsts[self.index]
+        if first == NO_CHILDREN:
+            return []
+        size = self.child_size()
+        return [LinearBlock(self.board, first + k, pos, size,
+                            self._path + (k,))
+                for k, pos in enumerate(self.children_positions())]
+
+    @property
+    def journal(self) -> None:
+        """Linear boards do not keep a journal, so this is always None.
+        """
+        return None
+
+    def view_children(self) -> list[LinearBlock]:
+        """Return handles on the children of this Block.
+
+        Handles never share anything with copies of the board, so this is the
+        same as self.children.
+        """
+        return self.children
+
+    def raster(self) -> Any:
+        """Return a new raster of this Block, as described in the raster
+        module, or None if NumPy is not installed.
+        """
+        if not NUMPY_AVAILABLE:
+            return None
+        return new_raster(self)
+
+    def __str__(self) -> str:
+        """Return this Block in the same string format as Block.
+
+        >>> board = LinearBoard((0, 0), 750, (1, 128, 181), 0, 1)
+        >>> str(board.root())
+        'Leaf: colour=Pacific Point, pos=(0, 0), size=750, level=0'
+        """
+        indents = '\t' * self.level
+        children = self.children
+        if len(children) == 0:
+            return f'{indents}Leaf: colour={colour_name(self.colour)}, ' \
+                   f'pos={self.position}, size={self.size}, level={self.level}'
+        result = f'{indents}Parent: pos={self.position},' \
+                 f'size={self.size}, level={self.level}'
+        for child in children:
+            result += f'\n{child}'
+        return result
+
+    def __eq__(self, other: object) -> bool:
+        """Return True iff this Block and all its descendents are equivalent to
+        the <other> Block and all its descendents. <other> may use either
+        backend.
+
+        >>> b1 = LinearBoard((0, 0), 750, (0, 0, 0), 0, 1).root()
+        >>> b2 = LinearBoard((0, 0), 750, (0, 0, 0), 0, 1).root()
+        >>> b1 == b2
+        True
+        >>> b2.smash()
+        True
+        >>> b1 == b2
+        False
+        """
+        return (self.position == other.position
+                and self.size == other.size
+                and _same_tree(self, other))
+
+    def structural_hash(self) -> int:
+        """Return the same 64-bit hash of this Block and all its descendants as
+        Block.structural_hash.
+
+        Linear boards do not cache hashes, so this takes time proportional to
+        the size of this Block's subtree.
+
+        >>> board = generate_linear_board(3, 750)
+        >>> board.structural_hash() == board.create_copy().structural_hash()
+        True
+        """
+        first = self.board.firsts[self.index]
+        if first == NO_CHILDREN:
+            return _leaf_hash(self.colour_index, self.level)
+        block_hash = 0
+        for slot, child in enumerate(self.children):
+            block_hash ^= _placed_hash(child.structural_hash(), child.level,
+                                       slot)
+        return block_hash
+
+    def rotated_hash(self, turns: int) -> int:
+        """Return the same hash as Block.rotated_hash: the structural hash
+        that this Block would have after being rotated by <turns> clockwise
+        quarter turns, without rotating it.
+
+        >>> board = generate_linear_board(3, 750)
+        >>> board.rotated_hash(0) == board.structural_hash()
+        True
+        >>> copy = board.create_copy()
+        >>> copy.rotate(ROT_CW)
+        True
+        >>> board.rotated_hash(1) == copy.structural_hash()
+        True
+        """
+        if self.board.firsts[self.index] == NO_CHILDREN:
+            return _leaf_hash(self.colour_index, self.level)
+        children = self.children
+        block_hash = 0
+        for slot in range(4):
+            # After <turns> clockwise turns, child slot i holds what was in
+            # child slot i + turns, rotated by <turns> too.
+            child = children[(slot + turns) % 4]
+            block_hash ^= _placed_hash(child.rotated_hash(turns), child.level,
+                                       slot)
+        return block_hash
+
+    def node_count(self) -> int:
+        """Return the number of Blocks in this Block's subtree, including this
+        Block.
+
+        Linear boards do not cache node counts, so this takes time
+        proportional to the size of this Block's subtree.
+
+        >>> board = LinearBoard((0, 0), 750, (1, 128, 181), 0, 1)
+        >>> board.root().node_count()
+        1
+        """
+        count = 0
+        pending = [self.index]
+        while pending:
+            slot = pending.pop()
+            count += 1
+            first = self.board.firsts[slot]
+            if first != NO_CHILDREN:
+                pending.extend(range(first, first + 4))
+        return count
+
+    def subtree_total(self, key: object,
+                      count: Callable[[LinearBlock], int]) -> int:
+        """Return the sum of <count>(block) over every Block in this Block's
+        subtree, including this Block.
+
+        Linear boards do not cache totals, so <key> is not used, and this
+        calls <count> once for each Block in this Block's subtree.
+
+        >>> board = LinearBoard((0, 0), 750, (1, 128, 181), 0, 1)
+        >>> board.root().subtree_total('nodes', lambda block: 1)
+        1
+        """
+        total = 0
+        pending = [self]
+        while pending:
+            block = pending.pop()
+            total += count(block)
+            pending.extend(block.view_children())
+        return total
+
+    def cells(self) -> tuple[int, int, int]:
+        """Return the column and row of the upper left unit cell of this Block
+        in a raster of its board, and its width in unit cells, as
+        Block.cells does.
+
+        >>> board = LinearBoard((0, 0), 750, COLOUR_LIST[1], 0, 2).root()
+        >>> board.smash()
+        True
+        >>> board.children[0].cells()
+        (2, 0, 2)
+        """
+        x = y = 0
+        n = 2 ** (self.max_depth - self.board.levels[0])
+        for slot in self._path:
+            n //= 2
+            dx, dy = _CHILD_OFFSETS[slot]
+            x, y = x + dx * n, y + dy * n
+        return x, y, n
+
+    def edge_counts(self) -> tuple[dict[int, int], dict[int, int],
+                                   dict[int, int], dict[int, int]]:
+        """Return the same edge counts as Block.edge_counts: for the top,
+        right, bottom and left edges of this Block in that order, a
+        dictionary mapping the index in settings.PALETTE of each colour on
+        that edge to the number of unit cells of that colour along it.
+
+        Linear boards do not cache edge counts, so this visits every Block of
+        this Block's subtree that lies along an edge.
+
+        >>> board = LinearBoard((0, 0), 750, COLOUR_LIST[1], 0, 2).root()
+        >>> board.edge_counts()[0]
+        {1: 4}
+        >>> board.smash()
+        True
+        >>> sum(board.edge_counts()[3].values())
+        4
+        """
+        edges = []
+        for along in _EDGE_CHILDREN:
+            counts = {}
+            pending = [self.index]
+            while pending:
+                slot = pending.pop()
+                first = self.board.firsts[slot]
+                if first == NO_CHILDREN:
+                    colour = self.board.colours[slot]
+                    counts[colour] = counts.get(colour, 0) \
+                        + 2 ** (self.max_depth - self.board.levels[slot])
+                else:
+                    pending.extend(first + k for k in along)
+            edges.append(counts)
+        return tuple(edges)
+
+    def colour_counts(self) -> dict[int, int]:
+        """Return the same colour counts as Block.colour_counts: a dictionary
+        mapping the index in settings.PALETTE of each colour in this Block to
+        the number of its unit cells of that colour.
+
+        Linear boards do not cache colour counts, so this takes time
+        proportional to the size of this Block's subtree.
+
+        >>> board = LinearBoard((0, 0), 750, COLOUR_LIST[1], 0, 2).root()
+        >>> board.colour_counts()
+        {1: 16}
+        """
+        counts = {}
+        pending = [self.index]
+        while pending:
+            slot = pending.pop()
+            first = self.board.firsts[slot]
+            if first == NO_CHILDREN:
+                colour = self.board.colours[slot]
+                counts[colour] = counts.get(colour, 0) \
+                    + 4 ** (self.max_depth - self.board.levels[slot])
+            else:
+                pending.extend(range(first, first + 4))
+        return counts
+
+    def child_size(self) -> int:
+        """Return the size of this Block's children.
+        """
+        return round(self.size / 2.0)
+
+    def children_positions(self) -> list[tuple[int, int]]:
+        """Return the (x, y) coordinates of this Block's four children.
+
+        The positions are returned in this order: upper-right child, upper-left
+        child, lower-left child, lower-right child.
+        """
+        x = self.position[0]
+        y = self.position[1]
+        size = self.child_size()
+
+        return [(x + size, y), (x, y), (x, y + size), (x + size, y + size)]
+
+    def _update_children_positions(self, position: tuple[int, int]) -> None:
+        """Set the position of this Block to <position>.
+
+        The positions of descendants are derived from their ancestors whenever
+        a handle on them is created, so they never need to be updated. Moving
+        the root moves the whole board.
+        """
+        self.position = position
+        if self.index == 0:
+            self.board.position = position
+
+    def smashable(self) -> bool:
+        """Return True iff this block can be smashed.
+
+        A block can be smashed if it has no children and its level is not at
+        max_depth.
+        """
+        return (self.level != self.max_depth
+                and self.board.firsts[self.index] == NO_CHILDREN)
+
+    def smash(self) -> bool:
+        """Return True iff the smash was performed successfully.
+
+        Smashing follows exactly the same random procedure as Block.smash.
+        """
+        if not self.smashable():
+            return False
+        self.board._smash(self.index)
+        return True
+
+    def swap(self, direction: int) -> bool:
+        """Swap the child Blocks of this Block in <direction>, moving each
+        child's whole subtree in constant time.
+
+        Return True iff the swap was performed.
+
+        Precondition:
+        - <direction> is either (SWAP_VERT, SWAP_HORZ)
+        """
+        if self.board.firsts[self.index] == NO_CHILDREN:
+            return False
+        self.board._permute(self.index, _SWAPS[direction])
+        return True
+
+    def rotate(self, direction: int) -> bool:
+        """Rotate this Block and all its descendents in <direction>.
+
+        Return True iff the rotation was performed.
+
+        Preconditions:
+        - direction in (ROT_CW, ROT_CCW)
+        """
+        if self.board.firsts[self.index] == NO_CHILDREN:
+            return False
+        self.board._rotate(self.index, direction)
+        return True
+
+    def paint(self, colour: tuple[int, int, int]) -> bool:
+        """Change this Block's colour iff it is a leaf at a level of max_depth
+        and its colour is different from <colour>.
+
+        Return True iff this Block's colour was changed.
+        """
+        index = self.board.colour_index(colour)
+        if self.level == self.max_depth \
+                and self.board.colours[self.index] != index:
+            self.board.colours[self.index] = index
+            return True
+        return False
+
+    def combinable(self) -> bool:
+        """Return True iff this block can be combined, following the same
+        rules as Block.combinable.
+        """
+        return self._majority() is not None
+
+    def _majority(self) -> int | None:
+        """Return the palette index of the majority colour of this Block's
+        children, as described in Block.combine, or None if this Block cannot
+        be combined.
+        """
+        first = self.board.firsts[self.index]
+        if self.level != self.max_depth - 1 or first == NO_CHILDREN:
+            return None
+
+        counts = {}
+        for k in range(4):
+            index = self.board.colours[first + k]
+            if index < len(COLOUR_LIST):
+                counts[index] = counts.get(index, 0) + 1
+        if not counts:
+            return None
+        ranked = sorted(counts.values(), reverse=True)
+        if ranked[0] < 2 or (len(ranked) > 1 and ranked[1] == ranked[0]):
+            return None
+        return max(counts, key=counts.get)
+
+    def combine(self) -> bool:
+        """Turn this Block into a leaf based on the majority colour of its
+        children, following the same rules as Block.combine.
+
+        Return True iff this Block was turned into a leaf node.
+        """
+        majority = self._majority()
+        if majority is None:
+            return False
+        self.board._combine(self.index, majority)
+        return True
+
+    def to_bytes(self) -> bytes:
+        """Return the same compact encoding of this Block and all its
+        descendants as Block.to_bytes, from which Block.from_bytes can
+        rebuild it as a tree.
+
+        >>> board = generate_linear_board(3, 750)
+        >>> Block.from_bytes(board.to_bytes()) == board
+        True
+        """
+        return _encode(self)
+
+    def create_copy(self) -> LinearBlock:
+        """Return the root of a new board that is a deep copy of this Block.
+
+        >>> block = generate_linear_board(3, 750)
+        >>> copy = block.create_copy()
+        >>> copy.board is not block.board
+        True
+        >>> block == copy
+        True
+        """
+        board = self.board._copy_subtree(self.index, self.position, self.size)
+        return board.root()
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -1,36 +1,60 @@
 from __future__ import annotations
+import heapq
+import math
 import random
+import time
+from concurrent.futures import Executor
 import pygame
 
-from block import Block
-from goal import Goal, generate_goals
+from block import Block, Journal
+from goal import SCORE_CACHE, Goal, generate_goals
 
-from actions import Action, KEY_ACTION, ROTATE_CLOCKWISE, \
-    ROTATE_COUNTER_CLOCKWISE, \
-    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE
+from actions import Action, KEY_ACTION, PASS, ROTATE_CLOCKWISE, \
+    ROTATE_COUNTER_CLOCKWISE, SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PAINT, \
+    COMBINE, legal_moves, random_legal_move
 
+# The actions that computer players may try, by short name, so that the
+# moves to try can be sent to other processes.
+_ACTIONS = {action.short_name: action for action in [
+    ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, SWAP_HORIZONTAL,
+    SWAP_VERTICAL, SMASH, PAINT, COMBINE]}
 
-def create_players(num_human: int, num_random: int, smart_players: list[int]) \
-        -> list[Player]:
+
+def create_players(num_human: int, num_random: int, smart_players: list[int],
+                   mcts_players: list[float] | None = None,
+                   beam_players: list[tuple[int, int]] | None = None) -> \
+        list[Player]:
     """Return a new list of Player objects.
 
     <num_human> is the number of human player, <num_random> is the number of
     random players, and <smart_players> is a list of difficulty levels for each
-    SmartPlayer that is to be created.
+    SmartPlayer that is to be created. <mcts_players> is a list of the number
+    of seconds each MCTSPlayer that is to be created may think about a move.
+    <beam_players> is a list of the width and the number of plies of each
+    BeamSearchPlayer that is to be created.
 
     The list should contain <num_human> HumanPlayer objects first, then
     <num_random> RandomPlayer objects, then the same number of SmartPlayer
-    objects as the length of <smart_players>. The difficulty levels in
-    <smart_players> should be applied to each SmartPlayer object, in order.
+    objects as the length of <smart_players>, then the same number of
+    MCTSPlayer objects as the length of <mcts_players>, then the same number of
+    BeamSearchPlayer objects as the length of <beam_players>. The difficulty
+    levels in <smart_players>, the time limits in <mcts_players>, and the
+    widths and plies in <beam_players> should be applied to each SmartPlayer,
+    MCTSPlayer and BeamSearchPlayer object, in order.
 
     Player ids are given in the order that the players are created, starting
     at id 0.
 
     Each player is assigned a random goal.
     """
+    if mcts_players is None:
+        mcts_players = []
+    if beam_players is None:
+        beam_players = []
     i = 0
     players = []
-    goals = generate_goals(num_human + num_random + len(smart_players))
+    goals = generate_goals(num_human + num_random + len(smart_players)
+                           + len(mcts_players) + len(beam_players))
     while len(players) < num_human:
         players.append(HumanPlayer(i, goals[i]))
         i += 1
@@ -41,6 +65,12 @@ def create_players(num_human: int, num_random: int, smart_players: list[int]) \
         # make sure that this lines up with smart player implementation
         players.append(SmartPlayer(i, goals[i], smart_players[j]))
         i += 1
+    for time_limit in mcts_players:
+        players.append(MCTSPlayer(i, goals[i], time_limit))
+        i += 1
+    for width, plies in beam_players:
+        players.append(BeamSearchPlayer(i, goals[i], width, plies))
+        i += 1
     return players
 
 
@@ -62,63 +92,189 @@ def _get_block(block: Block, location: tuple[int, int], level: int) -> \
     Preconditions:
         - block.level <= level <= block.max_depth
     """
-    if not _check_location(block, location):
+    (x, y), size = block.position, block.size
+    if not _check_location((x, y), size, location):
         return None
-    elif block.level == level or block.colour is not None:
-        return block
-    else:
-        if block.max_depth < level:
-            return _get_block(block, location, block.max_depth)
-    for child in block.children:
-        if _check_location(child, location):
-            return _get_block(child, location, level)
+    level = min(level, block.max_depth)
+    # Each Block's position and size are worked out from its parent's, so
+    # that finding the Block takes time proportional to its depth.
+    while block.level < level and block.colour is None:
+        half = round(size / 2.0)
+        positions = [(x + half, y), (x, y), (x, y + half),
+                     (x + half, y + half)]
+        for child, position in zip(block.children, positions):
+            if _check_location(position, half, location):
+                block, (x, y), size = child, position, half
+                break
+        else:
+            return None
+    return block
+
+
+def _get_block_at_path(board: Block, path: tuple[int, ...]) -> Block:
+    """Return the Block within <board> reached by following <path>, the
+    indices of the children leading to it from <board>.
+    """
+    block = board
+    for index in path:
+        block = block.children[index]
+    return block
 
 
-def _check_location(block: Block, location: tuple[int, int]) -> \
-        bool:
-    """Return true if the given <location> is included in <block>
+def _check_location(position: tuple[int, int], size: int,
+                    location: tuple[int, int]) -> bool:
+    """Return true if the given <location> is included in a block at
+    <position> with dimensions <size> by <size>.
     Private helper function for the function _get_block."""
-    x = block.position[0]
-    x_1 = block.position[0] + block.size
-    y = block.position[1]
-    y_1 = block.position[1] + block.size
+    x = position[0]
+    x_1 = position[0] + size
+    y = position[1]
+    y_1 = position[1] + size
 
     if x <= location[0] < x_1 and y <= location[1] < y_1:
         return True
     return False
 
-def _get_random_block(board: Block) -> Block:
+
+def _apply_seeded(action: Action, block: Block, colour: tuple[int, int, int],
+                  seed: int | None) -> bool:
+    """Apply <action> to <block> for a player whose goal has the given
+    <colour>, and return True iff it was applied.
+
+    If <seed> is not None, the random module is seeded with it while the
+    action is applied, and then restored, so that a smash gives the same
+    result in any process.
     """
-    A private helper for RandomPlayer and SmartPlayer. Return a random block at
-    a random depth within <board>.
+    if seed is None:
+        return action.apply(block, {'colour': colour})
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        return action.apply(block, {'colour': colour})
+    finally:
+        random.setstate(state)
+
+
+class _WorkingBoard:
+    """A copy of a board on which a computer player makes moves and then takes
+    them back.
+
+    A move is taken back with the copy's journal. A linear board cannot keep
+    a journal, so each move is made on a new copy of the position before it
+    instead, and taking the move back returns to that position.
+
+    Instance Attributes:
+    - board: The root of the position reached by the moves made so far.
+
+    Private Instance Attributes:
+    - _journal: The journal of <board>, or None if it cannot keep one.
+    - _marks: For each move made and not yet taken back, the number of moves
+              in <_journal> before it, or the position before it if there
+              is no journal.
     """
-    random_pos = (random.randint(0, board.size), random.randint(0, board.size))
-    random_level = random.randint(1, board.max_depth)
+    board: Block
+    _journal: Journal | None
+    _marks: list[int | Block]
+
+    def __init__(self, board: Block) -> None:
+        """Initialize a working copy of <board>, which is not changed.
+        """
+        self.board = board.create_copy()
+        if isinstance(self.board, Block):
+            self._journal = self.board.start_journal()
+        else:
+            self._journal = None
+        self._marks = []
 
-    return _get_block(board, random_pos, random_level)
+    def make(self, path: tuple[int, ...], action: Action,
+             colour: tuple[int, int, int], seed: int | None) -> bool:
+        """Apply <action>, with the seed <seed> as for _apply_seeded, to the
+        block at <path> in <board>, for a player whose goal has the given
+        <colour>. Return True iff it was applied.
 
+        The move is recorded even if it was not applied, so that each call
+        is matched by one call to take_back.
+        """
+        if self._journal is None:
+            self._marks.append(self.board)
+            self.board = self.board.create_copy()
+        else:
+            self._marks.append(len(self._journal))
+        return _apply_seeded(action, _get_block_at_path(self.board, path),
+                             colour, seed)
+
+    def take_back(self) -> None:
+        """Take back the most recent move that has not been taken back yet.
+        """
+        mark = self._marks.pop()
+        if self._journal is None:
+            self.board = mark
+        else:
+            while len(self._journal) > mark:
+                self._journal.undo()
+
+    def take_back_all(self) -> None:
+        """Take back every move that has not been taken back yet.
+        """
+        while self._marks:
+            self.take_back()
 
-def _move(block: Block, move: int, player: Player) -> tuple[bool, Action]:
+
+def _score_trials(board: Block, goal: Goal,
+                  trials: list[tuple[tuple[int, ...], str, int | None]],
+                  prune: bool) -> list[int | None]:
+    """Return the change in the score for <goal> made by each of <trials>
+    on <board>, less the penalty of its action.
+
+    Each trial is the path to the block to move, the short name of the
+    action, and the seed for _apply_seeded. Each trial is made on one
+    working copy of <board> and then taken back, so <board> is not changed.
+
+    If <prune> is True, a trial whose upper bound shows that it cannot beat
+    the best trial so far is not applied, and its score is None.
     """
-    A private helper for RandomPlayer and SmartPlayer. Execute move on block.
-    To be used on a copy of the actual board.
+    work = _WorkingBoard(board)
+    prev_score = SCORE_CACHE.score(goal, work.board)
+    best = 0
+    scores = []
+    for path, name, seed in trials:
+        action = _ACTIONS[name]
+        if prune and goal.upper_bound(
+                work.board, _get_block_at_path(work.board, path),
+                action) - prev_score <= best:
+            scores.append(None)
+            continue
+        work.make(path, action, goal.colour, seed)
+        score = SCORE_CACHE.score(goal, work.board) - prev_score \
+            - action.penalty
+        work.take_back()
+        scores.append(score)
+        best = max(best, score)
+    return scores
+
+
+# The board last decoded by _score_trials_remotely in this process, keyed by
+# its encoding.
+_decoded_boards = {}
+
+
+def _score_trials_remotely(data: bytes, goal: Goal,
+                           trials: list[tuple[tuple[int, ...], str,
+                                              int | None]]) -> list[int]:
+    """Return the scores of <trials>, as _score_trials does without pruning,
+    on the board encoded by Block.to_bytes as <data>.
+
+    This is run in worker processes, which receive the board only in its
+    compact encoding. The board last decoded is kept, so a worker given
+    several batches of trials on one board decodes it once.
     """
-    if move == 0:
-        return block.smash(), SMASH
-    elif move == 1:
-        return block.swap(0), SWAP_HORIZONTAL
-    elif move == 2:
-        return block.swap(1), SWAP_VERTICAL
-    elif move == 3:
-        return block.rotate(1), ROTATE_CLOCKWISE
-    elif move == 4:
-        return block.rotate(3), ROTATE_COUNTER_CLOCKWISE
-    elif move == 5:
-        return block.combine(), COMBINE
-    elif move == 6:
-        return block.paint(player.goal.colour), PAINT
-    elif move == 7:
-        return True, PASS
+    board = _decoded_boards.get(data)
+    if board is None:
+        _decoded_boards.clear()
+        board = Block.from_bytes(data)
+        _decoded_boards[data] = board
+    return _score_trials(board, goal, trials, False)
+
 
 class Player:
     """A player in the Blocky game.
@@ -164,6 +320,15 @@ class Player:
         """
         raise NotImplementedError
 
+    def prepare(self, players: list[Player], turns_left: int) -> None:
+        """Prepare to be asked for a move in a game played by <players>, in
+        which this player has <turns_left> turns left, including the current
+        one.
+
+        The game calls this before each call to generate_move. Players who
+        do not look ahead need not prepare.
+        """
+
 
 class HumanPlayer(Player):
     """A human player.
@@ -287,17 +452,12 @@ class RandomPlayer(ComputerPlayer):
 
         This function does not mutate <board>.
         """
-        copy = board.create_copy()
-        valid_move = False
-
         if self._proceed:
-            while valid_move is False:
-                move_block = _get_random_block(copy)
-                move_type = random.randint(0, 6)
-                move = _move(move_block, move_type, self)
-                if move[0] is True:
-                    self._proceed = False
-                    return move[1], board
+            move = random_legal_move(board, self.goal.colour)
+            if move is not None:
+                self._proceed = False
+                path, action = move
+                return action, _get_block_at_path(board, path)
         return None
 
 
@@ -308,10 +468,19 @@ class SmartPlayer(ComputerPlayer):
     Private Instance Attributes:
     - _num_test: The number of moves this SmartPlayer will test out before
                  choosing a move.
+    - _executor: The executor whose worker processes assess the moves, or
+                 None if they are assessed in this process.
+    - _workers: The number of worker processes of <_executor>.
+
+    Representation Invariants:
+    - self._workers >= 1
     """
     _num_test: int
+    _executor: Executor | None
+    _workers: int
 
-    def __init__(self, player_id: int, goal: Goal, difficulty: int) -> None:
+    def __init__(self, player_id: int, goal: Goal, difficulty: int,
+                 executor: Executor | None = None, workers: int = 1) -> None:
         """Initialize this SmartPlayer with a <player_id> and <goal>.
 
         Use <difficulty> to determine and record how many moves this SmartPlayer
@@ -319,11 +488,18 @@ class SmartPlayer(ComputerPlayer):
         <difficulty>, the more moves this SmartPlayer will assess, and hence the
         more difficult an opponent this SmartPlayer will be.
 
+        If <executor> is not None, the moves are assessed by its <workers>
+        workers, which may be other processes. The moves chosen are the same
+        either way.
+
         Preconditions:
         - difficulty >= 0
+        - workers >= 1
         """
         super().__init__(player_id, goal)
         self._num_test = difficulty
+        self._executor = executor
+        self._workers = workers
 
     def generate_move(self, board: Block) -> \
             tuple[Action, Block] | None:
@@ -340,37 +516,384 @@ class SmartPlayer(ComputerPlayer):
         """
         if not self._proceed:
             return None
-        
-        best_move = (0, PASS, board)  # score, action, move_block
-        moves = []
-
-        while len(moves) < self._num_test:
-            b2 = board.create_copy()
-            prev_score = self.goal.score(b2)
-            move_block = _get_random_block(b2)
-            if move_block.level == move_block.max_depth:
-                move_type = random.randint(0, 6)
-            elif move_block.level == move_block.max_depth - 1:
-                move_type = random.randint(0, 5)
-            else:
-                move_type = random.randint(0, 4)
-
-            valid, action = _move(move_block, move_type, self)
-            if valid:
-                new_score = self.goal.score(b2)
-                score = new_score - prev_score - action.penalty
-                moves.append((action, move_block, score))
-
-        for move in moves:
-            action = move[0]
-            move_block = move[1]
-            pos = move_block.position
-            lev = move_block.level
-            block = _get_block(board, pos, lev)
-            score = move[2]
-            if score > best_move[0]:
-                best_move = [score, action, block]
+
+        trials = []
+        while len(trials) < self._num_test:
+            move = random_legal_move(board, self.goal.colour)
+            if move is None:
+                break
+            path, action = move
+            # A smash is random, so it is given a seed of its own to get the
+            # same result wherever it is tried.
+            seed = random.getrandbits(64) if action is SMASH else None
+            trials.append((path, action.short_name, seed))
+
+        if self._executor is None:
+            scores = _score_trials(board, self.goal, trials, True)
+        else:
+            scores = self._score_in_workers(board, trials)
+
+        best_move = (0, PASS, ())  # score, action, path to move_block
+        for (path, name, _), score in zip(trials, scores):
+            if score is not None and score > best_move[0]:
+                best_move = (score, _ACTIONS[name], path)
 
         if best_move[1] is PASS:
             return None
-        return best_move[1], best_move[2]
+        return best_move[1], _get_block_at_path(board, best_move[2])
+
+    def _score_in_workers(self, board: Block,
+                          trials: list[tuple[tuple[int, ...], str,
+                                             int | None]]) -> list[int]:
+        """Return the scores of <trials> on <board>, as _score_trials does
+        without pruning, found by this SmartPlayer's executor.
+
+        The board is encoded once, and the trials are split into one batch
+        for each worker, so the encoding is sent to each worker about once
+        per turn, and each worker decodes it at most once.
+        """
+        data = board.to_bytes()
+        batches = min(len(trials), self._workers)
+        if batches == 0:
+            return []
+        size = -(-len(trials) // batches)
+        futures = [self._executor.submit(_score_trials_remotely, data,
+                                         self.goal, trials[i:i + size])
+                   for i in range(0, len(trials), size)]
+        scores = []
+        for future in futures:
+            scores.extend(future.result())
+        return scores
+
+
+class _SearchNode:
+    """A node of the tree grown by an MCTSPlayer, standing for the board
+    reached by the moves on the path to it from the root.
+
+    Instance Attributes:
+    - move: The path to the block moved, the action, and the seed for
+            _apply_seeded of the move that reaches this node from its parent,
+            or None if this is the root.
+    - untried: The legal moves from this node that have no child yet, or
+               None if they have not been listed, which is done the first
+               time a child is added to this node.
+    - children: The nodes reached by the moves tried from this node.
+    - visits: The number of playouts that passed through this node.
+    - total: The sum of the rewards of those playouts.
+    - exhausted: True iff every playout through this node would give the
+                 same reward, so that it need not be searched again.
+
+    Representation Invariants:
+    - self.visits >= 0
+    """
+    move: tuple[tuple[int, ...], Action, int | None] | None
+    untried: list[tuple[tuple[int, ...], Action]] | None
+    children: list[_SearchNode]
+    visits: int
+    total: float
+    exhausted: bool
+
+    def __init__(self, move: tuple[tuple[int, ...], Action, int | None]
+                 | None,
+                 untried: list[tuple[tuple[int, ...], Action]] | None) \
+            -> None:
+        """Initialize a node reached by <move>, with the legal moves
+        <untried> still to be tried from it.
+        """
+        self.move = move
+        self.untried = untried
+        self.children = []
+        self.visits = 0
+        self.total = 0.0
+        self.exhausted = False
+
+    def select(self, scale: float) -> _SearchNode:
+        """Return the child of this node to search next, by the UCT rule
+        with rewards divided by <scale>.
+
+        Precondition:
+        - Some child of this node is not exhausted.
+        """
+        log_visits = math.log(self.visits)
+        return max((child for child in self.children if not child.exhausted),
+                   key=lambda child: child.total / child.visits / scale
+                   + _EXPLORATION * math.sqrt(log_visits / child.visits))
+
+
+# The weight of exploring moves tried less often in the UCT rule.
+_EXPLORATION = math.sqrt(2)
+
+
+class MCTSPlayer(ComputerPlayer):
+    """A computer player who chooses moves by Monte Carlo tree search.
+
+    It grows a tree of the sequences of legal moves it could make over its
+    remaining turns, playing each new sequence out with random moves to the
+    end of the game, until the time it may think about a move runs out. A
+    playout is worth the best score less penalties reached along it, since
+    this player can stop moving by passing. Opponents' moves are not
+    modelled.
+
+    Instance Attributes:
+    - turns_left: The number of this player's turns left in the game,
+                  including the current one, as last given to prepare.
+
+    Private Instance Attributes:
+    - _time_limit: The number of seconds this MCTSPlayer may think about a
+                   move.
+
+    Representation Invariants:
+    - self.turns_left >= 1
+    - self._time_limit >= 0
+    """
+    turns_left: int
+    _time_limit: float
+
+    def __init__(self, player_id: int, goal: Goal, time_limit: float) -> None:
+        """Initialize this MCTSPlayer with a <player_id> and <goal>, who may
+        think about each move for <time_limit> seconds.
+
+        Preconditions:
+        - time_limit >= 0
+        """
+        super().__init__(player_id, goal)
+        self.turns_left = 1
+        self._time_limit = time_limit
+
+    def prepare(self, players: list[Player], turns_left: int) -> None:
+        """Record that this player has <turns_left> turns left, including the
+        current one, so that the search stops at the end of the game.
+        """
+        self.turns_left = turns_left
+
+    def generate_move(self, board: Block) -> \
+            tuple[Action, Block] | None:
+        """Return a valid move only during the player's turn, found by
+        searching until this player's time limit has passed. Return None if
+        the player should not make a move yet.
+
+        If no move is expected to improve this player's score, less the
+        penalty of the moves, this player will pass.
+
+        This method does not mutate <board>.
+        """
+        if not self._proceed:
+            return None
+        deadline = time.perf_counter() + self._time_limit
+
+        work = _WorkingBoard(board)
+        colour = self.goal.colour
+        root_score = SCORE_CACHE.score(self.goal, work.board)
+        root = _SearchNode(None, list(legal_moves(work.board, colour)))
+        root.exhausted = not root.untried
+        scale = 1.0
+        while not root.exhausted and time.perf_counter() < deadline:
+            # Selection: follow the tree until a node with untried moves.
+            node, nodes, penalty = root, [root], 0
+            while not node.untried and node.children:
+                node = node.select(scale)
+                path, action, seed = node.move
+                work.make(path, action, colour, seed)
+                penalty += action.penalty
+                nodes.append(node)
+            depth = len(nodes) - 1
+
+            # Expansion: try one untried move. A node's moves are listed
+            # once, when it is first expanded, and a node at which the game
+            # is over is given none.
+            if node.untried is None:
+                node.untried = list(legal_moves(work.board, colour))
+            if node.untried:
+                path, action = node.untried.pop(
+                    random.randrange(len(node.untried)))
+                seed = random.getrandbits(64) if action is SMASH else None
+                work.make(path, action, colour, seed)
+                penalty += action.penalty
+                depth += 1
+                child = _SearchNode((path, action, seed), None
+                                    if depth < self.turns_left else [])
+                node.children.append(child)
+                nodes.append(child)
+
+            # Playout: make random moves in the turns that remain, and keep
+            # the best score reached. The moves are sampled without listing
+            # them, since each is made once.
+            reward = SCORE_CACHE.score(self.goal, work.board) - penalty \
+                - root_score
+            best = 0
+            for _ in range(self.turns_left - depth):
+                move = random_legal_move(work.board, colour)
+                if move is None:
+                    break
+                work.make(*move, colour, None)
+                penalty += move[1].penalty
+                best = max(best, SCORE_CACHE.score(self.goal, work.board)
+                           - penalty - root_score - reward)
+            reward += best
+            scale = max(scale, abs(reward))
+
+            # Backpropagation, and restoring the board.
+            # A node with no moves left to try ends the game, or has no
+            # legal moves, so it has no playout.
+            nodes[-1].exhausted = nodes[-1].untried == [] \
+                and not nodes[-1].children
+            for node in reversed(nodes):
+                node.visits += 1
+                node.total += reward
+                if node.children and not node.untried:
+                    node.exhausted = all(child.exhausted
+                                         for child in node.children)
+            work.take_back_all()
+
+        self._proceed = False
+        if not root.children:
+            return PASS, board
+        # The move searched most is the most reliable; the mean reward breaks
+        # ties, which are common when there was little time to search.
+        best_child = max(root.children, key=lambda child: (
+            child.visits, child.total / child.visits))
+        if best_child.total <= 0:
+            return PASS, board
+        path, action, _ = best_child.move
+        return action, _get_block_at_path(board, path)
+
+
+class BeamSearchPlayer(ComputerPlayer):
+    """A computer player who looks several plies ahead by beam search,
+    expecting each opponent to answer with one of the moves best for its own
+    goal.
+
+    Plies alternate between this player and each of its opponents, in the
+    order in which they follow it in <players>. A position is evaluated by
+    the change in this player's score less its penalties, less the mean of
+    the same for its opponents. On this player's plies, the <_width> best
+    moves from each position are tried, and the <_width> best positions
+    reached are kept. On an opponent's ply, the opponent's <_width> moves best
+    for its own goal are tried, and a position is worth the worst of them for
+    this player. Positions reached by moves made in a different order are
+    found by their structural hash and kept once, and their scores are looked
+    up in SCORE_CACHE.
+
+    Instance Attributes:
+    - players: The players of the game, in the order in which they move, as
+               last given to prepare.
+
+    Private Instance Attributes:
+    - _width: The number of moves and positions kept at each ply.
+    - _plies: The number of plies searched.
+
+    Representation Invariants:
+    - self._width >= 1
+    - self._plies >= 1
+    """
+    players: list[Player]
+    _width: int
+    _plies: int
+
+    def __init__(self, player_id: int, goal: Goal, width: int,
+                 plies: int) -> None:
+        """Initialize this BeamSearchPlayer with a <player_id> and <goal>,
+        who keeps <width> moves at each ply and searches <plies> plies.
+
+        Until prepare is called, this player assumes it has no opponents.
+
+        Preconditions:
+        - width >= 1
+        - plies >= 1
+        """
+        super().__init__(player_id, goal)
+        self.players = [self]
+        self._width = width
+        self._plies = plies
+
+    def prepare(self, players: list[Player], turns_left: int) -> None:
+        """Record the <players> of the game, whose goals this player expects
+        its opponents to pursue.
+        """
+        self.players = players
+
+    def generate_move(self, board: Block) -> \
+            tuple[Action, Block] | None:
+        """Return the first move of the best line of play found by the beam
+        search, only during the player's turn. Return None if the player
+        should not make a move yet.
+
+        If no line starting with a move is better than passing, this player
+        will pass.
+
+        This method does not mutate <board>.
+        """
+        if not self._proceed:
+            return None
+        self._proceed = False
+
+        # The players in the order in which they move, starting with this one.
+        i = self.players.index(self) if self in self.players else 0
+        order = [self] + self.players[i + 1:] + self.players[:i]
+        work = _WorkingBoard(board)
+        roots = [SCORE_CACHE.score(player.goal, work.board)
+                 for player in order]
+
+        # Each position is its evaluation, the moves reaching it from <board>
+        # as (path, action, seed), and the penalties of each player in <order>
+        # for those moves.
+        beam = [(0.0, [], [0] * len(order))]
+        for ply in range(self._plies):
+            mover = ply % len(order)
+            positions = {}
+            for _, moves, penalties in beam:
+                for j, (path, action, seed) in enumerate(moves):
+                    work.make(path, action,
+                              order[j % len(order)].goal.colour, seed)
+                replies = self._expand(work, order, roots, mover, moves,
+                                       penalties)
+                work.take_back_all()
+                if mover == 0:
+                    kept = replies
+                else:
+                    kept = [min(replies, key=lambda reply: reply[1])]
+                for position in kept:
+                    key = position[0]
+                    if key not in positions or \
+                            positions[key][1] < position[1]:
+                        positions[key] = position
+            beam = [position[1:] for position in heapq.nlargest(
+                self._width, positions.values(),
+                key=lambda position: position[1])]
+
+        _, moves, _ = max(beam, key=lambda position: position[0])
+        path, action, _ = moves[0]
+        return action, _get_block_at_path(board, path)
+
+    def _expand(self, work: _WorkingBoard, order: list[Player],
+                roots: list[int], mover: int,
+                moves: list[tuple[tuple[int, ...], Action, int | None]],
+                penalties: list[int]) -> list[tuple[int, float, list, list]]:
+        """Return the <_width> moves best for player <mover> of <order> from
+        the position of <work>, reached by <moves>, as positions
+        (structural hash, evaluation, moves, penalties) after each move.
+
+        The scores of the players in <order> on the board this search started
+        from are <roots>, and their penalties so far are <penalties>. Passing
+        is one of the moves, and each move is taken back once it is evaluated.
+        """
+        colour = order[mover].goal.colour
+        replies = []
+        for path, action in [*legal_moves(work.board, colour), ((), PASS)]:
+            seed = random.getrandbits(64) if action is SMASH else None
+            work.make(path, action, colour, seed)
+            after = penalties.copy()
+            after[mover] += action.penalty
+            gains = [SCORE_CACHE.score(player.goal, work.board) - root
+                     - penalty for player, root, penalty
+                     in zip(order, roots, after)]
+            value = gains[0]
+            if len(order) > 1:
+                value -= sum(gains[1:]) / (len(order) - 1)
+            replies.append((gains[mover] if mover else value,
+                            (work.board.structural_hash(), value,
+                             moves + [(path, action, seed)], after)))
+            work.take_back()
+        best = heapq.nlargest(self._width, replies,
+                              key=lambda reply: reply[0])
+        return [position for _, position in best]
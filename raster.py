@@ -0,0 +1,88 @@
+from __future__ import annotations
+from typing import Any
+
+# A raster is a NumPy array holding the index in settings.PALETTE of the
+# colour of every unit cell of a board. It is indexed like the list returned
+# by goal.flatten: raster[i, j] is the unit cell at column i and row j, and
+# raster[0, 0] is the unit cell in the upper left corner. Each function below
+# that changes a raster only changes the n-by-n region of it whose upper left
+# unit cell is at column x and row y.
+#
+# NumPy is optional: if it is not installed, boards keep no raster.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# True iff NumPy is installed, so that rasters can be used.
+NUMPY_AVAILABLE = np is not None
+
+# The column and row offsets, in units of half a Block's width, of the upper
+# left corners of a Block's four children, in the order of Block.children.
+_CHILD_OFFSETS = ((1, 0), (0, 0), (0, 1), (1, 1))
+
+
+def new_raster(block: Any) -> np.ndarray:
+    """Return a new raster of <block>, which may use either backend.
+
+    Precondition:
+    - NUMPY_AVAILABLE
+    """
+    n = 2 ** (block.max_depth - block.level)
+    raster = np.empty((n, n), dtype=np.uint8)
+    paint_region(raster, 0, 0, n, block)
+    return raster
+
+
+def stack_rasters(boards: list[Any]) -> np.ndarray:
+    """Return a new array of shape (k, n, n) holding a raster of each of the k
+    <boards>, in order, which may use either backend.
+
+    Each board is painted straight into the array, so no board is left
+    keeping a raster that its later moves would have to update.
+
+    Preconditions:
+    - NUMPY_AVAILABLE
+    - len(boards) >= 1
+    - Every board in <boards> is n unit cells wide.
+    """
+    n = 2 ** (boards[0].max_depth - boards[0].level)
+    rasters = np.empty((len(boards), n, n), dtype=np.uint8)
+    for raster, board in zip(rasters, boards):
+        paint_region(raster, 0, 0, n, board)
+    return rasters
+
+
+def paint_region(raster: np.ndarray, x: int, y: int, n: int,
+                 block: Any) -> None:
+    """Fill the region of <raster> with the colours of <block>, which may use
+    either backend and is n unit cells wide.
+    """
+    pending = [(block, x, y, n)]
+    while pending:
+        block, x, y, n = pending.pop()
+        children = block.view_children()
+        if len(children) == 0:
+            raster[x:x + n, y:y + n] = block.colour_index
+        else:
+            half = n // 2
+            for child, (dx, dy) in zip(children, _CHILD_OFFSETS):
+                pending.append((child, x + dx * half, y + dy * half, half))
+
+
+def rotate_region(raster: np.ndarray, x: int, y: int, n: int,
+                  turns: int) -> None:
+    """Rotate the region of <raster> by <turns> clockwise quarter turns.
+    """
+    region = raster[x:x + n, y:y + n]
+    # With columns first, rot90 turns the picture clockwise.
+    region[...] = np.rot90(region, turns).copy()
+
+
+def swap_region(raster: np.ndarray, x: int, y: int, n: int,
+                vertical: bool) -> None:
+    """Swap the top and bottom halves of the region of <raster> if <vertical>
+    is True, or its left and right halves otherwise.
+    """
+    region = raster[x:x + n, y:y + n]
+    region[...] = np.roll(region, n // 2, axis=1 if vertical else 0)
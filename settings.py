@@ -31,12 +31,87 @@ HIGHLIGHT_THICKNESS = 5
 ANIMATION_DURATION = 1
 
 
+# A palette can number at most this many colours, so that every index fits in
+# a byte with one value to spare.
+MAX_PALETTE_SIZE = 255
+
+
 class UnknownColourError(Exception):
     """ An exception to be raised when the name of the colour is not known.
     """
     pass
 
 
+class PaletteFullError(Exception):
+    """ An exception to be raised when a colour cannot be added to a palette
+    because it already has MAX_PALETTE_SIZE colours.
+    """
+    pass
+
+
+class Palette:
+    """A numbering of colours, so that the game can store and compare each
+    colour as a small integer index, and only look up its RGB value to draw
+    it.
+
+    Attributes:
+    - colours: The colours in this palette, in the order of their indices.
+
+    Private Attributes:
+    - _indices: The index of each colour in this palette.
+
+    Representation Invariants:
+    - len(self.colours) <= MAX_PALETTE_SIZE
+    - self._indices[self.colours[i]] == i for 0 <= i < len(self.colours)
+    """
+    colours: list[tuple[int, int, int]]
+    _indices: dict[tuple[int, int, int], int]
+
+    def __init__(self, colours: list[tuple[int, int, int]]) -> None:
+        """Initialize this palette, giving the <colours> the indices 0 to
+        len(colours) - 1, in order.
+
+        Precondition:
+        - <colours> has no duplicates and at most MAX_PALETTE_SIZE colours.
+        """
+        self.colours = list(colours)
+        self._indices = {colour: i for i, colour in enumerate(colours)}
+
+    def __len__(self) -> int:
+        """Return the number of colours in this palette.
+        """
+        return len(self.colours)
+
+    def index(self, colour: tuple[int, int, int]) -> int:
+        """Return the index of <colour>, adding it to this palette if it is
+        not already in it.
+
+        Raise a PaletteFullError if <colour> would have to be added, but this
+        palette already has MAX_PALETTE_SIZE colours.
+
+        >>> palette = Palette([PACIFIC_POINT, REAL_RED])
+        >>> palette.index(REAL_RED)
+        1
+        >>> palette.index(WHITE)
+        2
+        >>> palette.colours[2] == WHITE
+        True
+        """
+        index = self._indices.get(colour)
+        if index is None:
+            if len(self.colours) == MAX_PALETTE_SIZE:
+                raise PaletteFullError
+            index = len(self.colours)
+            self.colours.append(colour)
+            self._indices[colour] = index
+        return index
+
+
+# The palette shared by every board. The colours in COLOUR_LIST have the
+# indices 0 to len(COLOUR_LIST) - 1, in order.
+PALETTE = Palette(COLOUR_LIST)
+
+
 def colour_name(colour: tuple[int, int, int]) -> str:
     """Return the colour name associated with this colour value, or
     the empty string if this colour value isn't in our colour list.
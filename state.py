@@ -3,6 +3,7 @@ import pygame
 
 from actions import Action
 from block import Block, _block_to_squares
+from goal import SCORE_CACHE, score_goals
 from player import Player
 from renderer import Renderer
 from settings import ANIMATION_DURATION
@@ -48,6 +49,22 @@ class GameData:
 
         return goal_score, penalty
 
+    def calculate_all_scores(self) -> list[tuple[int, int]]:
+        """Return, for each player in the order of <players>, a tuple
+        containing first their score based on their goal in the game and
+        second the deductions from their score based on the actions they've
+        taken, as calculate_score does.
+
+        The board is traversed once for all the players' goals of each kind,
+        rather than once per player, and only for the goals whose scores on
+        this board are not held in goal.SCORE_CACHE.
+        """
+        goal_scores = score_goals(self.board,
+                                  [player.goal for player in self.players],
+                                  SCORE_CACHE)
+        return [(goal_score, player.penalty)
+                for goal_score, player in zip(goal_scores, self.players)]
+
 
 class GameState:
     """One of the different states that a Blocky game can be in.
@@ -92,7 +109,8 @@ class MainState(GameState):
         self._data = data
         self._current_player_index = 0
 
-        score, penalty = self._data.calculate_score(self._current_player().id)
+        score, penalty = \
+            self._data.calculate_all_scores()[self._current_player_index]
         self._current_score = score - penalty
 
     def _current_player(self) -> Player:
@@ -106,7 +124,8 @@ class MainState(GameState):
         self._current_player_index = (self._current_player_index + 1) % len(
             self._data.players)
 
-        score, penalty = self._data.calculate_score(self._current_player().id)
+        score, penalty = \
+            self._data.calculate_all_scores()[self._current_player_index]
         self._current_score = score - penalty
 
         if self._current_player_index == 0:
@@ -138,7 +157,9 @@ class MainState(GameState):
             return GameOverState(self._data)
 
         # Ask the player to make a move
-        move = self._current_player().generate_move(self._data.board)
+        player = self._current_player()
+        player.prepare(self._data.players, self._data.max_turns - self._turn)
+        move = player.generate_move(self._data.board)
 
         if move is None:
             # No move was made, stay in the current state
@@ -245,8 +266,8 @@ class GameOverState(GameState):
         """Initialize this GameState.
         """
         self._scores = []
-        for p in data.players:
-            goal_score, penalty = data.calculate_score(p.id)
+        for p, (goal_score, penalty) in zip(data.players,
+                                            data.calculate_all_scores()):
             self._scores.append((p.id, goal_score, penalty))
         self._winner = max(self._scores, key=lambda item: item[1] - item[2])[0]
 
@@ -280,7 +301,7 @@ if __name__ == '__main__':
         'allowed-io': ['run_game'],
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'pygame', '__future__',
-            'block', 'player', 'renderer', 'settings', 'actions'
+            'block', 'player', 'renderer', 'settings', 'actions', 'goal'
         ],
         'generated-members': 'pygame.*'
     })